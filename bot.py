@@ -9,8 +9,12 @@ from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
 
 from config import config, ensure_data_directory
+from database import AsyncDatabase
 from handlers import CommandsHandler, SearchHandler
 from services.monitoring import MonitoringService
+from services.notification import NotificationService
+from services.rzd_api import AsyncRZDAPIService
+from services.rzd_seatmap import AsyncSeatMapService
 
 # Настройка логирования
 logging.basicConfig(
@@ -33,7 +37,14 @@ class TrainBot:
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
         self.dp = Dispatcher()
-        self.monitoring_service = MonitoringService()
+        # Одни клиенты РЖД и Telegram (общие пулы соединений) и один доступ к базе
+        # (один писатель) на хендлеры и мониторинг
+        self.rzd_api = AsyncRZDAPIService()
+        self.seatmap = AsyncSeatMapService()
+        self.notifications = NotificationService()
+        self.db = AsyncDatabase()
+        self.monitoring_service = MonitoringService(rzd_api=self.rzd_api, seatmap=self.seatmap, db=self.db,
+                                                    notification_service=self.notifications)
 
         # Регистрируем хендлеры
         self._register_handlers()
@@ -45,8 +56,9 @@ class TrainBot:
         search_router = Router()
 
         # Регистрируем хендлеры
-        CommandsHandler(commands_router)
-        SearchHandler(search_router)
+        CommandsHandler(commands_router, db=self.db, notification_service=self.notifications)
+        SearchHandler(search_router, rzd_api=self.rzd_api, seatmap=self.seatmap, db=self.db,
+                      notification_service=self.notifications)
 
         # Включаем роутеры в диспетчер
         self.dp.include_router(commands_router)
@@ -78,7 +90,10 @@ class TrainBot:
         """Остановка бота"""
         try:
             logger.info("Остановка бота...")
-            await self.monitoring_service.notification_service.close()
+            await self.notifications.close()
+            await self.rzd_api.close()
+            await self.seatmap.close()
+            await self.db.close()
             await self.bot.session.close()
         except Exception as e:
             logger.error(f"Ошибка остановки бота: {e}")
@@ -18,10 +18,57 @@ class Config:
     RZD_SUGGEST_URL: str = os.getenv("RZD_SUGGEST_URL", "https://ticket.rzd.ru/api/v1/suggests")
     # User Agent
     USER_AGENT: str = os.getenv("USER_AGENT", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36")
+    # HTTP-клиент к РЖД (общий пул aiohttp с keep-alive)
+    HTTP_TIMEOUT: float = float(os.getenv("HTTP_TIMEOUT", 30))
+    HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 10))
+    HTTP_POOL_LIMIT: int = int(os.getenv("HTTP_POOL_LIMIT", 100))
+    HTTP_POOL_LIMIT_PER_HOST: int = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+    HTTP_KEEPALIVE_TIMEOUT: float = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))
+    # Кэш ответов train-pricing (0 — не кэшировать)
+    TRAINS_CACHE_TTL: float = float(os.getenv("TRAINS_CACHE_TTL", 60))
+    TRAINS_CACHE_SIZE: int = int(os.getenv("TRAINS_CACHE_SIZE", 512))
+    # Кэш схем вагонов CarPricing (пустые/ошибочные ответы живут SEATMAP_NEGATIVE_TTL)
+    SEATMAP_CACHE_TTL: float = float(os.getenv("SEATMAP_CACHE_TTL", 30))
+    SEATMAP_NEGATIVE_TTL: float = float(os.getenv("SEATMAP_NEGATIVE_TTL", 10))
+    SEATMAP_CACHE_SIZE: int = int(os.getenv("SEATMAP_CACHE_SIZE", 512))
     # Database
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", "data/train_subscriptions.db")
+    # Пул соединений SQLite: размер, ожидание свободного соединения (сек),
+    # кэш страниц на соединение (КиБ), ожидание блокировки (сек)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 4))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", 8192))
+    DB_BUSY_TIMEOUT: float = float(os.getenv("DB_BUSY_TIMEOUT", 5))
+    # Записи, пришедшие в пределах DB_WRITE_BATCH_MS, фиксируются одной транзакцией (не больше DB_WRITE_BATCH_SIZE)
+    DB_WRITE_BATCH_MS: float = float(os.getenv("DB_WRITE_BATCH_MS", 5))
+    DB_WRITE_BATCH_SIZE: int = int(os.getenv("DB_WRITE_BATCH_SIZE", 200))
+    # Кэш состояний поиска в памяти: сколько пользователей держать и через сколько секунд простоя забывать
+    SEARCH_STATE_CACHE_SIZE: int = int(os.getenv("SEARCH_STATE_CACHE_SIZE", 1000))
+    SEARCH_STATE_IDLE_TTL: float = float(os.getenv("SEARCH_STATE_IDLE_TTL", 1800))
+    # Снимок выбранного поезда в состоянии поиска сжимается zlib, если длиннее стольких байт (0 — не сжимать)
+    SEARCH_STATE_COMPRESS_MIN: int = int(os.getenv("SEARCH_STATE_COMPRESS_MIN", 1024))
     # Monitoring settings
     MONITORING_INTERVAL: int = int(os.getenv("MONITORING_INTERVAL", 300))
+    # Как часто перечитывать список активных подписок (сек) и разброс времени опроса (доля интервала)
+    MONITORING_SYNC_INTERVAL: int = int(os.getenv("MONITORING_SYNC_INTERVAL", 60))
+    MONITORING_JITTER: float = float(os.getenv("MONITORING_JITTER", 0.1))
+    # Проверки, до которых осталось не больше стольких секунд, выполняются одним циклом
+    MONITORING_BATCH_WINDOW: float = float(os.getenv("MONITORING_BATCH_WINDOW", 15))
+    # Сколько запросов к РЖД / проверок подписок выполняется одновременно
+    MONITORING_CONCURRENCY: int = int(os.getenv("MONITORING_CONCURRENCY", 10))
+    # Подсчёт мест по фильтрам маршрута: auto (NumPy, если установлен и фильтров
+    # не меньше SEAT_ENGINE_MIN_FILTERS), numpy, python
+    SEAT_ENGINE: str = os.getenv("SEAT_ENGINE", "auto")
+    SEAT_ENGINE_MIN_FILTERS: int = int(os.getenv("SEAT_ENGINE_MIN_FILTERS", 64))
+    # Сколько разных скомпилированных фильтров подписок держать в памяти (LRU)
+    FILTER_CACHE_SIZE: int = int(os.getenv("FILTER_CACHE_SIZE", 4096))
+    # Лимиты Telegram Bot API: сообщений в секунду на бота и в один чат (и сколько подряд),
+    # сколько раз повторять запрос после 429 и дольше скольки секунд retry_after не ждать
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+    TELEGRAM_CHAT_RATE: float = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+    TELEGRAM_CHAT_BURST: float = float(os.getenv("TELEGRAM_CHAT_BURST", 3))
+    TELEGRAM_MAX_RETRIES: int = int(os.getenv("TELEGRAM_MAX_RETRIES", 3))
+    TELEGRAM_MAX_RETRY_AFTER: float = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", 60))
     # Message limits
     MAX_MESSAGE_LENGTH: int = int(os.getenv("MAX_MESSAGE_LENGTH", 4000))
     MAX_CALLBACK_DATA_LENGTH: int = int(os.getenv("MAX_CALLBACK_DATA_LENGTH", 64))
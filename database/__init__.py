@@ -3,9 +3,10 @@
 """
 
 from .manager import DatabaseManager
-from .models import Subscription, SearchState
+from .async_manager import AsyncDatabase
+from .models import Subscription, SubscriptionRow, SearchState
 
-__all__ = ['DatabaseManager', 'Subscription', 'SearchState']
+__all__ = ['DatabaseManager', 'AsyncDatabase', 'Subscription', 'SubscriptionRow', 'SearchState']
 
 
 
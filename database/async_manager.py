@@ -0,0 +1,219 @@
+"""
+Асинхронный доступ к базе данных
+
+Методы DatabaseManager синхронные; вызванные прямо из хендлера aiogram, они
+блокируют event loop на время запроса (а запись — ещё и на fsync), и ждут все
+пользователи. AsyncDatabase выносит их из event loop:
+  • чтения идут в пул потоков-читателей (у каждого своё соединение, WAL);
+  • записи ставятся в очередь единственной задаче-писателю; записи, пришедшие в
+    пределах DB_WRITE_BATCH_MS, выполняются одной транзакцией (один commit);
+    каждая запись — в своём SAVEPOINT, неудачная откатывается целиком и одна.
+Результат записи (или её исключение) возвращается вызвавшему после commit, так
+что следующее чтение уже видит записанное. Состояния поиска дополнительно
+кэшируются в памяти (SearchStateCache): в базу пишутся только изменённые колонки.
+Активные подписки читаются из базы один раз и дальше берутся из реестра
+(SubscriptionRegistry), который DatabaseManager обновляет после каждой записи.
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from .manager import DatabaseManager
+from .models import Subscription, SubscriptionRow, SearchState
+from .search_state_cache import SearchStateCache
+from .subscription_registry import SubscriptionRegistry
+
+logger = logging.getLogger(__name__)
+
+# остановка задачи-писателя (см. close)
+_STOP = object()
+
+
+class AsyncDatabase:
+    """Асинхронный фасад DatabaseManager: пул читателей и один писатель с пакетными commit"""
+
+    def __init__(self, manager: DatabaseManager = None, readers: int = None,
+                 batch_ms: float = None, batch_size: int = None):
+        self.manager = manager or DatabaseManager()
+        readers = max(1, readers or config.DB_POOL_SIZE)
+        self.batch_window = (config.DB_WRITE_BATCH_MS if batch_ms is None else batch_ms) / 1000
+        self.batch_size = max(1, batch_size or config.DB_WRITE_BATCH_SIZE)
+        # каждому читателю и писателю — своё соединение, иначе потоки ждут друг друга в acquire
+        pool = getattr(self.manager, 'pool', None)
+        if pool is not None:
+            pool.ensure_size(readers + 1)
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self.search_states = SearchStateCache(
+            DatabaseManager.search_state_columns,
+            maxsize=max(1, config.SEARCH_STATE_CACHE_SIZE), idle_ttl=config.SEARCH_STATE_IDLE_TTL,
+        )
+        self.subscriptions = SubscriptionRegistry(self.manager)
+        # сколько записей и транзакций выполнено (записей на транзакцию — эффект пакетирования)
+        self.writes = 0
+        self.batches = 0
+
+    async def _read(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(method, *args))
+
+    async def _write(self, method, *args):
+        loop = asyncio.get_running_loop()
+        if self._writer is None or self._writer.done() or self._writer.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._writer = loop.create_task(self._write_loop())
+        future = loop.create_future()
+        self._queue.put_nowait((method, args, future))
+        return await future
+
+    async def _next_batch(self) -> list:
+        """Первая запись из очереди и всё, что придёт за batch_window (не больше batch_size)"""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            stop = batch[-1] is _STOP
+            writes = [item for item in batch if item is not _STOP]
+            if writes:
+                try:
+                    results = await loop.run_in_executor(self._writer_thread, self._apply, writes)
+                except Exception as e:
+                    logger.error(f"Ошибка фиксации пакета записей ({len(writes)}): {e}")
+                    results = [(False, e)] * len(writes)
+                for (_, _, future), (ok, value) in zip(writes, results):
+                    if future.done():
+                        continue  # вызвавший уже не ждёт (отменён)
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+            if stop:
+                return
+
+    def _apply(self, writes: list) -> list:
+        """Выполняет записи пакета одной транзакцией (в потоке писателя).
+
+        Запись, не дошедшая до commit (исключение или перехваченная методом ошибка),
+        откатывается до своего SAVEPOINT (см. ConnectionPool.batch) — её хуки не вызываются.
+        Если не удался сам COMMIT, откатывается весь пакет: хуки after_commit не вызываются,
+        выполняются after_rollback, исключение получают все записи пакета (см. _write_loop).
+        """
+        results = []
+        with self.manager.transaction():
+            for method, args, _ in writes:
+                try:
+                    results.append((True, method(*args)))
+                except Exception as e:
+                    results.append((False, e))
+        self.writes += len(writes)
+        self.batches += 1
+        return results
+
+    async def close(self):
+        """Дожидается записей из очереди и останавливает писателя и пулы потоков"""
+        if self._writer is not None and not self._writer.done():
+            self._queue.put_nowait(_STOP)
+            await self._writer
+        self._readers.shutdown(wait=False)
+        self._writer_thread.shutdown(wait=False)
+        self.manager.close()
+
+    # --- чтение ---
+
+    async def get_user_subscriptions(self, user_id: int) -> List[Subscription]:
+        return await self._read(self.manager.get_user_subscriptions, user_id)
+
+    async def get_subscription(self, subscription_id: int, user_id: int) -> Optional[Subscription]:
+        return await self._read(self.manager.get_subscription, subscription_id, user_id)
+
+    async def get_active_subscriptions(self) -> List[SubscriptionRow]:
+        """Активные подписки из реестра (таблица читается только при первом обращении)"""
+        if not self.subscriptions.loaded:
+            await self._read(self.subscriptions.load)
+        return self.subscriptions.active()
+
+    async def get_subscription_last_state(self, subscription_id: int) -> Optional[str]:
+        return await self._read(self.manager.get_subscription_last_state, subscription_id)
+
+    async def get_subscription_last_places(self, subscription_id: int) -> Optional[str]:
+        return await self._read(self.manager.get_subscription_last_places, subscription_id)
+
+    async def get_subscription_states(self, subscription_ids: List[int]) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        return await self._read(self.manager.get_subscription_states, subscription_ids)
+
+    async def get_search_state(self, user_id: int) -> Optional[SearchState]:
+        state = self.search_states.get(user_id)
+        if state is None:
+            state = await self._read(self.manager.get_search_state, user_id)
+            if state is not None:
+                self.search_states.load(state)
+        return state
+
+    # --- запись ---
+
+    async def create_subscription(self, subscription: Subscription) -> Optional[int]:
+        return await self._write(self.manager.create_subscription, subscription)
+
+    async def delete_subscription(self, subscription_id: int, user_id: int) -> bool:
+        return await self._write(self.manager.delete_subscription, subscription_id, user_id)
+
+    async def disable_subscription(self, subscription_id: int, user_id: int) -> bool:
+        return await self._write(self.manager.disable_subscription, subscription_id, user_id)
+
+    async def enable_subscription(self, subscription_id: int, user_id: int) -> bool:
+        return await self._write(self.manager.enable_subscription, subscription_id, user_id)
+
+    async def update_subscription_filters(self, subscription_id: int, user_id: int,
+                                          car_types: str, berth: str, max_price: int,
+                                          min_seats: int) -> bool:
+        return await self._write(self.manager.update_subscription_filters, subscription_id, user_id,
+                                 car_types, berth, max_price, min_seats)
+
+    async def save_subscription_last_state(self, subscription_id: int, state: str,
+                                           places: Optional[str] = None) -> bool:
+        return await self._write(self.manager.save_subscription_last_state, subscription_id, state, places)
+
+    async def save_subscription_states(self, states: Dict[int, Tuple[str, Optional[str]]]) -> bool:
+        return await self._write(self.manager.save_subscription_states, states)
+
+    async def save_search_state(self, search_state: SearchState):
+        """Сохраняет в кэш; в базу — только изменённые колонки (повторные сохранения
+        до записи сливаются с уже стоящей в очереди)"""
+        token = self.search_states.update(search_state)
+        if token is not None:
+            await self._write(self._flush_search_state, search_state.user_id, token)
+
+    def _flush_search_state(self, user_id: int, token: int):
+        """Запись накопленных колонок состояния поиска (в потоке писателя)"""
+        columns = self.search_states.take_pending(user_id, token)
+        if not columns:
+            return
+        if not self.manager.update_search_state_columns(user_id, columns):
+            # новое сохранение, поставленное после take_pending, не теряется
+            self.search_states.write_failed(user_id, token, columns)
+        else:
+            # SAVEPOINT записи отпущен, но пакет ещё может не зафиксироваться
+            self.manager.pool.after_rollback(
+                lambda: self.search_states.write_failed(user_id, token, columns))
+
+    async def clear_search_state(self, user_id: int):
+        self.search_states.drop(user_id)
+        return await self._write(self.manager.clear_search_state, user_id)
@@ -0,0 +1,218 @@
+"""
+Пул долгоживущих соединений SQLite
+
+Раньше каждый метод DatabaseManager открывал новое соединение: разбор схемы,
+rollback-журнал с fsync на каждую запись. Соединения пула живут весь процесс,
+база работает в WAL (читатели не ждут писателя), synchronous=NORMAL (fsync
+только на контрольных точках WAL), у каждого соединения свой кэш страниц и
+кэш подготовленных запросов (cached_statements). Соединение выдаётся одному
+потоку целиком, поэтому пулом можно пользоваться из asyncio.to_thread.
+
+batch() объединяет вызовы методов DatabaseManager в одну транзакцию: пока он
+открыт, поток получает из пула одно и то же соединение, а commit() методов
+откладывается до выхода из batch. Каждый метод внутри batch работает в своём
+SAVEPOINT: если метод не дошёл до commit() (ошибка, в том числе перехваченная
+самим методом), откатываются только его изменения, а не весь пакет и не половина
+метода. after_commit() выполняет действие после фиксации: сразу вне batch или при
+выходе из него (при откате — не выполняет). after_rollback() — наоборот, только если
+транзакция batch откатилась, в том числе из-за ошибки самого COMMIT.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# сколько подготовленных запросов помнит каждое соединение
+STATEMENT_CACHE_SIZE = 256
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Новое соединение с настройками для бота"""
+    conn = sqlite3.connect(
+        path,
+        timeout=config.DB_BUSY_TIMEOUT,
+        check_same_thread=False,  # соединение переходит между потоками через пул
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KB)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+class _BatchConnection:
+    """Соединение внутри batch(): acquire открывает SAVEPOINT метода, commit() метода
+    его фиксирует (RELEASE), rollback() или release без commit — откатывает.
+
+    Действия after_commit и after_rollback, добавленные внутри откаченного SAVEPOINT,
+    отбрасываются: свой откат метод обрабатывает сам.
+    """
+
+    __slots__ = ('conn', 'callbacks', 'rollback_callbacks', '_savepoints')
+
+    def __init__(self, conn: sqlite3.Connection, callbacks: list, rollback_callbacks: list):
+        self.conn = conn
+        self.callbacks = callbacks
+        self.rollback_callbacks = rollback_callbacks
+        # открытые SAVEPOINT: [имя, число after_commit и after_rollback на момент открытия, открыт ли ещё]
+        self._savepoints = []
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def begin(self):
+        name = f"w{len(self._savepoints)}"
+        self.conn.execute(f"SAVEPOINT {name}")
+        self._savepoints.append([name, len(self.callbacks), len(self.rollback_callbacks), True])
+
+    def commit(self):
+        if self._savepoints and self._savepoints[-1][3]:
+            self._savepoints[-1][3] = False
+            self.conn.execute(f"RELEASE {self._savepoints[-1][0]}")
+
+    def rollback(self):
+        if self._savepoints and self._savepoints[-1][3]:
+            name, mark, rollback_mark, _ = self._savepoints[-1]
+            self._savepoints[-1][3] = False
+            self.conn.execute(f"ROLLBACK TO {name}")
+            self.conn.execute(f"RELEASE {name}")
+            del self.callbacks[mark:]
+            del self.rollback_callbacks[rollback_mark:]
+
+    def end(self):
+        """Возврат в пул: незафиксированный SAVEPOINT метода откатывается"""
+        if self._savepoints:
+            self.rollback()
+            self._savepoints.pop()
+
+
+class ConnectionPool:
+    """Не более size соединений; acquire ждёт, пока освободится занятое,
+    но не дольше timeout секунд (затем TimeoutError)"""
+
+    def __init__(self, path: str, size: int = None, timeout: float = None):
+        self.path = path
+        self.size = max(1, size or config.DB_POOL_SIZE)
+        self.timeout = config.DB_POOL_TIMEOUT if timeout is None else timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def acquire(self) -> sqlite3.Connection:
+        pinned = getattr(self._local, 'batch', None)
+        if pinned is not None:
+            pinned.begin()
+            return pinned
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"Нет свободного соединения с базой за {self.timeout} с "
+                f"(все {self.size} заняты)"
+            ) from None
+
+    def ensure_size(self, size: int):
+        """Расширяет пул до size соединений (не уменьшает)"""
+        with self._lock:
+            self.size = max(self.size, size)
+
+    def release(self, conn: sqlite3.Connection):
+        """Возвращает соединение в пул; незавершённая транзакция откатывается"""
+        if isinstance(conn, _BatchConnection):
+            conn.end()
+            return  # само соединение вернётся в пул по выходу из batch()
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def batch(self):
+        """Одна транзакция на все обращения к пулу из этого потока внутри блока.
+
+        Фиксируется при выходе из блока, откатывается при исключении (и при ошибке
+        COMMIT — тогда исключение уходит вызвавшему, выполняются действия after_rollback).
+        """
+        if getattr(self._local, 'batch', None) is not None:
+            yield  # уже внутри batch — вложенный блок входит во внешнюю транзакцию
+            return
+        conn = self.acquire()
+        after_commit, after_rollback = [], []
+        self._local.after_commit = after_commit
+        self._local.after_rollback = after_rollback
+        self._local.batch = _BatchConnection(conn, after_commit, after_rollback)
+        try:
+            # явный BEGIN: RELEASE SAVEPOINT метода не должен фиксировать транзакцию пакета
+            conn.execute("BEGIN")
+            yield
+            conn.commit()
+        except BaseException:
+            try:
+                # после неудачного COMMIT транзакция может остаться открытой
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                self._end_batch(conn)
+            for callback in after_rollback:
+                self._run(callback)
+            raise
+        self._end_batch(conn)
+        for callback in after_commit:
+            self._run(callback)
+
+    def _end_batch(self, conn: sqlite3.Connection):
+        self._local.batch = None
+        self._local.after_commit = None
+        self._local.after_rollback = None
+        self.release(conn)
+
+    def after_commit(self, callback):
+        """callback() после фиксации текущей транзакции потока (вне batch — сразу)"""
+        pending = getattr(self._local, 'after_commit', None)
+        if pending is not None:
+            pending.append(callback)
+        else:
+            self._run(callback)
+
+    def after_rollback(self, callback):
+        """callback() при откате текущей транзакции batch (вне batch метод уже зафиксировал
+        изменения — не вызывается)"""
+        pending = getattr(self._local, 'after_rollback', None)
+        if pending is not None:
+            pending.append(callback)
+
+    @staticmethod
+    def _run(callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"Ошибка обработчика после commit/rollback: {e}")
+
+    def close(self):
+        """Закрывает свободные соединения (занятые закроются при сборке мусора)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
@@ -1,129 +1,119 @@
 """
 Менеджер базы данных
 """
-import sqlite3
 import logging
-from typing import List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
 
-from .models import Subscription, SearchState
+from .connection import ConnectionPool
+from .migrations import ensure_schema
+from .models import Subscription, SubscriptionRow, SearchState
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# колонки subscriptions в порядке _subscription_from_row
+SUBSCRIPTION_COLUMNS = (
+    'id, user_id, origin_code, origin_name, destination_code, destination_name, '
+    'departure_date, train_numbers, car_types, min_seats, adult_passengers, '
+    'children_passengers, interval_minutes, is_active, created_at, berth, max_price'
+)
+# сколько id подставлять в один IN (...) (лимит параметров запроса SQLite — 999 в старых версиях)
+IN_CHUNK_SIZE = 500
+# размер страницы iter_active_subscriptions
+ACTIVE_PAGE_SIZE = 1000
+
 
 class DatabaseManager:
     """Менеджер базы данных"""
     
     def __init__(self):
         self.db_path = config.DATABASE_PATH
+        self.pool = ConnectionPool(self.db_path)
+        # hook(subscription_id, subscription) после фиксации изменения подписки
+        self._change_hooks: List[Callable[[int, Optional[SubscriptionRow]], None]] = []
         self.init_database()
+
+    def close(self):
+        """Закрывает соединения с базой"""
+        self.pool.close()
+
+    def transaction(self):
+        """Вызовы методов внутри блока with выполняются одной транзакцией"""
+        return self.pool.batch()
     
-    def init_database(self):
-        """Инициализация базы данных"""
+    def add_change_hook(self, hook: Callable[[int, Optional[SubscriptionRow]], None]):
+        """Подписка на изменения подписок: hook(subscription_id, subscription) вызывается
+        после commit; subscription — строка после изменения или None, если подписка удалена"""
+        self._change_hooks.append(hook)
+
+    def _subscription_changed(self, cursor, subscription_id: int):
+        """Перечитывает изменённую подписку и оповещает хуки после фиксации транзакции"""
+        if not self._change_hooks:
+            return
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Создаем таблицу подписок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    origin_code TEXT,
-                    origin_name TEXT,
-                    destination_code TEXT,
-                    destination_name TEXT,
-                    departure_date TEXT,
-                    train_numbers TEXT,
-                    car_types TEXT,
-                    min_seats INTEGER,
-                    adult_passengers INTEGER,
-                    children_passengers INTEGER,
-                    interval_minutes INTEGER,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Создаем таблицу состояний поиска
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS search_states (
-                    user_id INTEGER PRIMARY KEY,
-                    origin_code TEXT,
-                    origin_name TEXT,
-                    destination_code TEXT,
-                    destination_name TEXT,
-                    departure_date TEXT,
-                    adult_passengers INTEGER DEFAULT 1,
-                    children_passengers INTEGER DEFAULT 0,
-                    min_seats INTEGER DEFAULT 1,
-                    train_numbers TEXT DEFAULT '',
-                    car_types TEXT DEFAULT '',
-                    progress_message_id INTEGER,
-                    selected_train_number TEXT,
-                    selected_train_info TEXT,
-                    search_step TEXT DEFAULT 'origin',
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    messages_to_delete TEXT DEFAULT ''
-                )
-            ''')
+            cursor.execute(f'SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions WHERE id = ?',
+                           (subscription_id,))
+            row = cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Ошибка чтения изменённой подписки #{subscription_id}: {e}")
+            return
+        subscription = self._subscription_row(row) if row else None
+        hooks = list(self._change_hooks)
 
-            # Таблица для хранения последнего состояния доступности мест по подписке
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS subscription_states (
-                    subscription_id INTEGER PRIMARY KEY,
-                    last_state TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Миграция: добавить колонку messages_to_delete, если её нет (для старых БД)
-            try:
-                cursor.execute("PRAGMA table_info(search_states)")
-                columns = [row[1] for row in cursor.fetchall()]
-                if 'messages_to_delete' not in columns:
-                    cursor.execute("ALTER TABLE search_states ADD COLUMN messages_to_delete TEXT DEFAULT ''")
-                    logger.info("Добавлена колонка messages_to_delete в search_states")
-            except Exception as mig_e:
-                logger.error(f"Ошибка миграции search_states.messages_to_delete: {mig_e}")
-
-            # Миграции новых колонок фильтров (для старых БД)
-            try:
-                cursor.execute("PRAGMA table_info(subscriptions)")
-                cols = [r[1] for r in cursor.fetchall()]
-                if 'berth' not in cols:
-                    cursor.execute("ALTER TABLE subscriptions ADD COLUMN berth TEXT DEFAULT 'any'")
-                if 'max_price' not in cols:
-                    cursor.execute("ALTER TABLE subscriptions ADD COLUMN max_price INTEGER DEFAULT 0")
-                cursor.execute("PRAGMA table_info(search_states)")
-                scols = [r[1] for r in cursor.fetchall()]
-                for col, ddl in (
-                    ('filter_car_types', "ALTER TABLE search_states ADD COLUMN filter_car_types TEXT DEFAULT ''"),
-                    ('filter_berth', "ALTER TABLE search_states ADD COLUMN filter_berth TEXT DEFAULT 'any'"),
-                    ('filter_max_price', "ALTER TABLE search_states ADD COLUMN filter_max_price INTEGER DEFAULT 0"),
-                    ('selected_train_cargroups', "ALTER TABLE search_states ADD COLUMN selected_train_cargroups TEXT DEFAULT ''"),
-                    ('editing_subscription_id', "ALTER TABLE search_states ADD COLUMN editing_subscription_id INTEGER"),
-                    ('station_options', "ALTER TABLE search_states ADD COLUMN station_options TEXT DEFAULT ''"),
-                ):
-                    if col not in scols:
-                        cursor.execute(ddl)
-            except Exception as mig_e:
-                logger.error(f"Ошибка миграции колонок фильтров: {mig_e}")
+        def notify():
+            for hook in hooks:
+                hook(subscription_id, subscription)
 
-            conn.commit()
-            logger.info("База данных инициализирована")
-            
+        self.pool.after_commit(notify)
+
+    @staticmethod
+    def _subscription_from_row(row) -> Subscription:
+        """Subscription из строки SELECT SUBSCRIPTION_COLUMNS"""
+        return Subscription(
+            id=row[0],
+            user_id=row[1],
+            origin_code=row[2],
+            origin_name=row[3],
+            destination_code=row[4],
+            destination_name=row[5],
+            departure_date=row[6],
+            train_numbers=row[7],
+            car_types=row[8],
+            min_seats=row[9],
+            adult_passengers=row[10],
+            children_passengers=row[11],
+            interval_minutes=row[12],
+            is_active=bool(row[13]),
+            created_at=datetime.fromisoformat(row[14]),
+            berth=row[15] if row[15] is not None else 'any',
+            max_price=row[16] if row[16] is not None else 0
+        )
+
+    @staticmethod
+    def _subscription_row(row) -> SubscriptionRow:
+        """SubscriptionRow из строки SELECT SUBSCRIPTION_COLUMNS (created_at не разбирается)"""
+        return SubscriptionRow(
+            *row[:13], bool(row[13]), row[14],
+            berth=row[15] if row[15] is not None else 'any',
+            max_price=row[16] if row[16] is not None else 0,
+        )
+
+    def init_database(self):
+        """Приводит схему базы к текущей версии (миграции — см. database.migrations)"""
+        conn = self.pool.acquire()
+        try:
+            ensure_schema(conn, self.db_path)
         except Exception as e:
             logger.error(f"Ошибка инициализации базы данных: {e}")
             raise
         finally:
-            conn.close()
-    
+            self.pool.release(conn)
+
     def create_subscription(self, subscription: Subscription) -> Optional[int]:
         """Создание новой подписки"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -143,6 +133,7 @@ class DatabaseManager:
             
             subscription_id = cursor.lastrowid
             conn.commit()
+            self._subscription_changed(cursor, subscription_id)
             logger.info(f"Создана подписка #{subscription_id} для пользователя {subscription.user_id}")
             return subscription_id
             
@@ -150,12 +141,12 @@ class DatabaseManager:
             logger.error(f"Ошибка создания подписки: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
     
     def get_user_subscriptions(self, user_id: int) -> List[Subscription]:
         """Получение подписок пользователя"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -171,25 +162,7 @@ class DatabaseManager:
             subscriptions = []
 
             for row in rows:
-                subscription = Subscription(
-                    id=row[0],
-                    user_id=row[1],
-                    origin_code=row[2],
-                    origin_name=row[3],
-                    destination_code=row[4],
-                    destination_name=row[5],
-                    departure_date=row[6],
-                    train_numbers=row[7],
-                    car_types=row[8],
-                    min_seats=row[9],
-                    adult_passengers=row[10],
-                    children_passengers=row[11],
-                    interval_minutes=row[12],
-                    is_active=bool(row[13]),
-                    created_at=datetime.fromisoformat(row[14]),
-                    berth=row[15] if row[15] is not None else 'any',
-                    max_price=row[16] if row[16] is not None else 0
-                )
+                subscription = self._subscription_from_row(row)
                 subscriptions.append(subscription)
 
             return subscriptions
@@ -198,12 +171,12 @@ class DatabaseManager:
             logger.error(f"Ошибка получения подписок: {e}")
             return []
         finally:
-            conn.close()
+            self.pool.release(conn)
     
     def get_subscription(self, subscription_id: int, user_id: int) -> Optional[Subscription]:
         """Получение одной подписки пользователя по id"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, user_id, origin_code, origin_name, destination_code, destination_name,
@@ -215,35 +188,17 @@ class DatabaseManager:
             row = cursor.fetchone()
             if not row:
                 return None
-            return Subscription(
-                id=row[0],
-                user_id=row[1],
-                origin_code=row[2],
-                origin_name=row[3],
-                destination_code=row[4],
-                destination_name=row[5],
-                departure_date=row[6],
-                train_numbers=row[7],
-                car_types=row[8],
-                min_seats=row[9],
-                adult_passengers=row[10],
-                children_passengers=row[11],
-                interval_minutes=row[12],
-                is_active=bool(row[13]),
-                created_at=datetime.fromisoformat(row[14]),
-                berth=row[15] if row[15] is not None else 'any',
-                max_price=row[16] if row[16] is not None else 0
-            )
+            return self._subscription_from_row(row)
         except Exception as e:
             logger.error(f"Ошибка получения подписки {subscription_id}: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def get_active_subscriptions(self) -> List[Subscription]:
         """Получение всех активных подписок"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -258,25 +213,7 @@ class DatabaseManager:
             subscriptions = []
 
             for row in rows:
-                subscription = Subscription(
-                    id=row[0],
-                    user_id=row[1],
-                    origin_code=row[2],
-                    origin_name=row[3],
-                    destination_code=row[4],
-                    destination_name=row[5],
-                    departure_date=row[6],
-                    train_numbers=row[7],
-                    car_types=row[8],
-                    min_seats=row[9],
-                    adult_passengers=row[10],
-                    children_passengers=row[11],
-                    interval_minutes=row[12],
-                    is_active=bool(row[13]),
-                    created_at=datetime.fromisoformat(row[14]),
-                    berth=row[15] if row[15] is not None else 'any',
-                    max_price=row[16] if row[16] is not None else 0
-                )
+                subscription = self._subscription_from_row(row)
                 subscriptions.append(subscription)
 
             return subscriptions
@@ -285,12 +222,40 @@ class DatabaseManager:
             logger.error(f"Ошибка получения активных подписок: {e}")
             return []
         finally:
-            conn.close()
+            self.pool.release(conn)
+    
+    def iter_active_subscriptions(self, page_size: int = ACTIVE_PAGE_SIZE) -> Iterator[SubscriptionRow]:
+        """Активные подписки по возрастанию id, страницами (keyset: id > последнего).
+
+        В памяти не больше одной страницы строк, соединение берётся из пула только
+        на время запроса страницы. Ошибка чтения пробрасывается — частичный список
+        нельзя принять за полный.
+        """
+        last_id = 0
+        while True:
+            conn = self.pool.acquire()
+            try:
+                rows = conn.execute(f'''
+                    SELECT {SUBSCRIPTION_COLUMNS} FROM subscriptions
+                    WHERE is_active = 1 AND id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (last_id, page_size)).fetchall()
+            except Exception as e:
+                logger.error(f"Ошибка чтения активных подписок (после #{last_id}): {e}")
+                raise
+            finally:
+                self.pool.release(conn)
+            for row in rows:
+                yield self._subscription_row(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
     
     def delete_subscription(self, subscription_id: int, user_id: int) -> bool:
         """Полное удаление подписки и её состояния мониторинга"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('DELETE FROM subscriptions WHERE id = ? AND user_id = ?',
                            (subscription_id, user_id))
@@ -300,18 +265,19 @@ class DatabaseManager:
                            (subscription_id,))
             conn.commit()
             if success:
+                self._subscription_changed(cursor, subscription_id)
                 logger.info(f"Подписка #{subscription_id} удалена")
             return success
         except Exception as e:
             logger.error(f"Ошибка удаления подписки: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def disable_subscription(self, subscription_id: int, user_id: int) -> bool:
         """Отключение подписки"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -324,6 +290,7 @@ class DatabaseManager:
             conn.commit()
             
             if success:
+                self._subscription_changed(cursor, subscription_id)
                 logger.info(f"Подписка #{subscription_id} отключена")
             
             return success
@@ -332,14 +299,14 @@ class DatabaseManager:
             logger.error(f"Ошибка отключения подписки: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def update_subscription_filters(self, subscription_id: int, user_id: int,
                                     car_types: str, berth: str, max_price: int,
                                     min_seats: int) -> bool:
         """Обновление фильтров (тип вагона / полка / цена / кол-во мест) существующей подписки"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
                 UPDATE subscriptions
@@ -349,18 +316,19 @@ class DatabaseManager:
             success = cursor.rowcount > 0
             conn.commit()
             if success:
+                self._subscription_changed(cursor, subscription_id)
                 logger.info(f"Фильтры подписки #{subscription_id} обновлены")
             return success
         except Exception as e:
             logger.error(f"Ошибка обновления фильтров подписки: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def enable_subscription(self, subscription_id: int, user_id: int) -> bool:
         """Включение ранее отключенной подписки"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -373,6 +341,7 @@ class DatabaseManager:
             conn.commit()
 
             if success:
+                self._subscription_changed(cursor, subscription_id)
                 logger.info(f"Подписка #{subscription_id} включена")
 
             return success
@@ -381,12 +350,12 @@ class DatabaseManager:
             logger.error(f"Ошибка включения подписки: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
 
     def get_subscription_last_state(self, subscription_id: int) -> Optional[str]:
         """Возвращает сохранённое состояние доступности мест по подписке"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT last_state FROM subscription_states WHERE subscription_id = ?
@@ -397,79 +366,148 @@ class DatabaseManager:
             logger.error(f"Ошибка получения состояния подписки {subscription_id}: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
 
-    def save_subscription_last_state(self, subscription_id: int, state: str) -> bool:
-        """Сохраняет текущее состояние доступности мест по подписке"""
+    def get_subscription_last_places(self, subscription_id: int) -> Optional[str]:
+        """Возвращает сохранённый снимок свободных мест по подписке (см. services.seat_diff)"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
-                UPDATE subscription_states
-                SET last_state = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE subscription_id = ?
-            ''', (state, subscription_id))
-            if cursor.rowcount == 0:
-                cursor.execute('''
-                    INSERT INTO subscription_states (subscription_id, last_state)
-                    VALUES (?, ?)
-                ''', (subscription_id, state))
+                SELECT last_places FROM subscription_states WHERE subscription_id = ?
+            ''', (subscription_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения снимка мест подписки {subscription_id}: {e}")
+            return None
+        finally:
+            self.pool.release(conn)
+
+    def get_subscription_states(self, subscription_ids: List[int]) -> Dict[int, Tuple[Optional[str], Optional[str]]]:
+        """(last_state, last_places) подписок одним запросом IN (...); подписок без состояния в ответе нет"""
+        ids = list(dict.fromkeys(subscription_ids))
+        states = {}
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), IN_CHUNK_SIZE):
+                chunk = ids[start:start + IN_CHUNK_SIZE]
+                cursor.execute(f'''
+                    SELECT subscription_id, last_state, last_places FROM subscription_states
+                    WHERE subscription_id IN ({', '.join('?' * len(chunk))})
+                ''', chunk)
+                for subscription_id, state, places in cursor.fetchall():
+                    states[subscription_id] = (state, places)
+            return states
+        except Exception as e:
+            logger.error(f"Ошибка получения состояний подписок ({len(ids)}): {e}")
+            return {}
+        finally:
+            self.pool.release(conn)
+
+    def save_subscription_last_state(self, subscription_id: int, state: str,
+                                     places: Optional[str] = None) -> bool:
+        """Сохраняет текущее состояние доступности мест (и снимок мест) по подписке"""
+        return self.save_subscription_states({subscription_id: (state, places)})
+
+    def save_subscription_states(self, states: Dict[int, Tuple[str, Optional[str]]]) -> bool:
+        """Сохраняет {id подписки: (состояние, снимок мест)} одной транзакцией (upsert)"""
+        if not states:
+            return True
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT INTO subscription_states (subscription_id, last_state, last_places)
+                VALUES (?, ?, ?)
+                ON CONFLICT(subscription_id) DO UPDATE SET
+                    last_state = excluded.last_state,
+                    last_places = excluded.last_places,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', [(subscription_id, state, places) for subscription_id, (state, places) in states.items()])
             conn.commit()
             return True
         except Exception as e:
-            logger.error(f"Ошибка сохранения состояния подписки {subscription_id}: {e}")
+            logger.error(f"Ошибка сохранения состояний подписок {sorted(states)[:10]}: {e}")
             return False
         finally:
-            conn.close()
+            self.pool.release(conn)
     
+    @staticmethod
+    def search_state_columns(search_state: SearchState) -> dict:
+        """Значения колонок search_states (кроме user_id и updated_at) для состояния поиска"""
+        return {
+            'origin_code': search_state.origin_code,
+            'origin_name': search_state.origin_name,
+            'destination_code': search_state.destination_code,
+            'destination_name': search_state.destination_name,
+            'departure_date': search_state.departure_date,
+            'adult_passengers': search_state.adult_passengers,
+            'children_passengers': search_state.children_passengers,
+            'min_seats': search_state.min_seats,
+            'train_numbers': search_state.train_numbers,
+            'car_types': search_state.car_types,
+            'progress_message_id': search_state.progress_message_id,
+            'selected_train_number': search_state.selected_train_number,
+            'selected_train_info': search_state.selected_train_info,
+            'search_step': search_state.search_step,
+            'messages_to_delete': ','.join(str(mid) for mid in getattr(search_state, 'messages_to_delete', [])),
+            'filter_car_types': getattr(search_state, 'filter_car_types', ''),
+            'filter_berth': getattr(search_state, 'filter_berth', 'any'),
+            'filter_max_price': getattr(search_state, 'filter_max_price', 0),
+            'selected_train_cargroups': getattr(search_state, 'selected_train_cargroups', ''),
+            'editing_subscription_id': getattr(search_state, 'editing_subscription_id', None),
+            'station_options': getattr(search_state, 'station_options', ''),
+        }
+
     def save_search_state(self, search_state: SearchState):
         """Сохранение состояния поиска (с учетом новых полей)"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            messages_to_delete_str = ','.join(str(mid) for mid in getattr(search_state, 'messages_to_delete', []))
-            cursor.execute('''
-                INSERT OR REPLACE INTO search_states
-                (user_id, origin_code, origin_name, destination_code, destination_name,
-                 departure_date, adult_passengers, children_passengers, min_seats,
-                 train_numbers, car_types, progress_message_id, selected_train_number, selected_train_info, search_step, updated_at, messages_to_delete,
-                 filter_car_types, filter_berth, filter_max_price, selected_train_cargroups, editing_subscription_id, station_options)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                search_state.user_id,
-                search_state.origin_code,
-                search_state.origin_name,
-                search_state.destination_code,
-                search_state.destination_name,
-                search_state.departure_date,
-                search_state.adult_passengers,
-                search_state.children_passengers,
-                search_state.min_seats,
-                search_state.train_numbers,
-                search_state.car_types,
-                search_state.progress_message_id,
-                search_state.selected_train_number,
-                search_state.selected_train_info,
-                search_state.search_step,
-                datetime.now().isoformat(),
-                messages_to_delete_str,
-                getattr(search_state, 'filter_car_types', ''),
-                getattr(search_state, 'filter_berth', 'any'),
-                getattr(search_state, 'filter_max_price', 0),
-                getattr(search_state, 'selected_train_cargroups', ''),
-                getattr(search_state, 'editing_subscription_id', None),
-                getattr(search_state, 'station_options', ''),
-            ))
+            columns = self.search_state_columns(search_state)
+            columns['updated_at'] = datetime.now().isoformat()
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO search_states (user_id, {', '.join(columns)})
+                VALUES ({', '.join('?' * (len(columns) + 1))})
+            ''', (search_state.user_id, *columns.values()))
             conn.commit()
         except Exception as e:
             logger.error(f"Ошибка сохранения состояния поиска: {e}")
         finally:
-            conn.close()
+            self.pool.release(conn)
+
+    def update_search_state_columns(self, user_id: int, columns: dict) -> bool:
+        """Запись только изменённых колонок состояния поиска (ключи — из search_state_columns).
+
+        Если строки ещё нет, она создаётся; не переданные колонки получают значения по умолчанию.
+        """
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            columns = dict(columns, updated_at=datetime.now().isoformat())
+            cursor.execute(
+                f"UPDATE search_states SET {', '.join(f'{name} = ?' for name in columns)} WHERE user_id = ?",
+                (*columns.values(), user_id),
+            )
+            if cursor.rowcount == 0:
+                cursor.execute(f'''
+                    INSERT INTO search_states (user_id, {', '.join(columns)})
+                    VALUES ({', '.join('?' * (len(columns) + 1))})
+                ''', (user_id, *columns.values()))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка сохранения состояния поиска {user_id}: {e}")
+            return False
+        finally:
+            self.pool.release(conn)
 
     def get_search_state(self, user_id: int) -> Optional[SearchState]:
         """Получение состояния поиска пользователя (с учетом новых полей)"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT user_id, origin_code, origin_name, destination_code, destination_name,
@@ -511,12 +549,12 @@ class DatabaseManager:
             logger.error(f"Ошибка получения состояния поиска: {e}")
             return None
         finally:
-            conn.close()
+            self.pool.release(conn)
     
     def clear_search_state(self, user_id: int):
         """Очистка состояния поиска пользователя"""
+        conn = self.pool.acquire()
         try:
-            conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM search_states WHERE user_id = ?', (user_id,))
@@ -525,6 +563,6 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Ошибка очистки состояния поиска: {e}")
         finally:
-            conn.close()
+            self.pool.release(conn)
 
 
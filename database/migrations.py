@@ -0,0 +1,154 @@
+"""
+Версионные миграции схемы базы (PRAGMA user_version)
+
+Шаг N приводит схему версии N-1 к версии N. migrate() читает user_version,
+применяет только недостающие шаги одной транзакцией и записывает новую версию;
+ensure_schema() делает это один раз на процесс для каждого файла базы, сколько
+бы DatabaseManager ни создавалось.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _v1_base_schema(cursor: sqlite3.Cursor):
+    """Таблицы бота. Базы, созданные до версионирования (user_version = 0), уже
+    содержат часть таблиц и колонок — недостающие колонки добавляются."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            origin_code TEXT,
+            origin_name TEXT,
+            destination_code TEXT,
+            destination_name TEXT,
+            departure_date TEXT,
+            train_numbers TEXT,
+            car_types TEXT,
+            min_seats INTEGER,
+            adult_passengers INTEGER,
+            children_passengers INTEGER,
+            interval_minutes INTEGER,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_states (
+            user_id INTEGER PRIMARY KEY,
+            origin_code TEXT,
+            origin_name TEXT,
+            destination_code TEXT,
+            destination_name TEXT,
+            departure_date TEXT,
+            adult_passengers INTEGER DEFAULT 1,
+            children_passengers INTEGER DEFAULT 0,
+            min_seats INTEGER DEFAULT 1,
+            train_numbers TEXT DEFAULT '',
+            car_types TEXT DEFAULT '',
+            progress_message_id INTEGER,
+            selected_train_number TEXT,
+            selected_train_info TEXT,
+            search_step TEXT DEFAULT 'origin',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            messages_to_delete TEXT DEFAULT ''
+        )
+    ''')
+    # последнее состояние доступности мест по подписке
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscription_states (
+            subscription_id INTEGER PRIMARY KEY,
+            last_state TEXT,
+            last_places TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    columns = {
+        'subscriptions': (
+            ('berth', "TEXT DEFAULT 'any'"),
+            ('max_price', "INTEGER DEFAULT 0"),
+        ),
+        'search_states': (
+            ('messages_to_delete', "TEXT DEFAULT ''"),
+            ('filter_car_types', "TEXT DEFAULT ''"),
+            ('filter_berth', "TEXT DEFAULT 'any'"),
+            ('filter_max_price', "INTEGER DEFAULT 0"),
+            ('selected_train_cargroups', "TEXT DEFAULT ''"),
+            ('editing_subscription_id', "INTEGER"),
+            ('station_options', "TEXT DEFAULT ''"),
+        ),
+        'subscription_states': (
+            ('last_places', "TEXT"),
+        ),
+    }
+    for table, wanted in columns.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row[1] for row in cursor.fetchall()}
+        for column, ddl in wanted:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+                logger.info(f"Добавлена колонка {table}.{column}")
+
+
+def _v2_subscription_indexes(cursor: sqlite3.Cursor):
+    """Индексы под выборку активных подписок и списка подписок пользователя"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_subscriptions_active ON subscriptions(is_active)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_user_created ON subscriptions(user_id, created_at)"
+    )
+
+
+# MIGRATIONS[N-1] — шаг к версии N; новые шаги только добавляются в конец
+MIGRATIONS = (
+    _v1_base_schema,
+    _v2_subscription_indexes,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применяет недостающие миграции одной транзакцией; возвращает версию схемы"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # версия могла измениться, пока ждали блокировку (другой процесс)
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for step in MIGRATIONS[version:]:
+            step(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if version < SCHEMA_VERSION:
+        logger.info(f"Схема базы обновлена: версия {version} -> {SCHEMA_VERSION}")
+    return SCHEMA_VERSION
+
+
+_migrated = set()
+_lock = threading.Lock()
+
+
+def _database_key(path: str) -> tuple:
+    """Файл базы: путь и inode (пересозданный по тому же пути файл — другая база)"""
+    try:
+        return os.path.abspath(path), os.stat(path).st_ino
+    except OSError:
+        return os.path.abspath(path), None
+
+
+def ensure_schema(conn: sqlite3.Connection, path: str):
+    """migrate() один раз на процесс для файла базы path"""
+    with _lock:
+        if path != ':memory:' and _database_key(path) in _migrated:
+            return
+        migrate(conn)
+        if path != ':memory:':
+            _migrated.add(_database_key(path))
@@ -21,13 +21,55 @@ class Subscription:
     min_seats: int
     adult_passengers: int
     children_passengers: int
-    interval_minutes: int
+    interval_minutes: Optional[int]
     is_active: bool
     created_at: datetime
     berth: str = 'any'
     max_price: int = 0
 
 
+class SubscriptionRow:
+    """Активная подписка для мониторинга: поля Subscription в __slots__ (без __dict__
+    на объект); created_at хранится строкой из базы и разбирается при первом обращении"""
+
+    __slots__ = ('id', 'user_id', 'origin_code', 'origin_name', 'destination_code',
+                 'destination_name', 'departure_date', 'train_numbers', 'car_types', 'min_seats',
+                 'adult_passengers', 'children_passengers', 'interval_minutes', 'is_active',
+                 '_created_at', 'berth', 'max_price')
+
+    def __init__(self, id: int, user_id: int, origin_code: str, origin_name: str,
+                 destination_code: str, destination_name: str, departure_date: str,
+                 train_numbers: str, car_types: str, min_seats: int, adult_passengers: int,
+                 children_passengers: int, interval_minutes: int, is_active: bool,
+                 created_at, berth: str = 'any', max_price: int = 0):
+        self.id = id
+        self.user_id = user_id
+        self.origin_code = origin_code
+        self.origin_name = origin_name
+        self.destination_code = destination_code
+        self.destination_name = destination_name
+        self.departure_date = departure_date
+        self.train_numbers = train_numbers
+        self.car_types = car_types
+        self.min_seats = min_seats
+        self.adult_passengers = adult_passengers
+        self.children_passengers = children_passengers
+        self.interval_minutes = interval_minutes
+        self.is_active = is_active
+        self._created_at = created_at
+        self.berth = berth
+        self.max_price = max_price
+
+    @property
+    def created_at(self) -> datetime:
+        if isinstance(self._created_at, str):
+            self._created_at = datetime.fromisoformat(self._created_at)
+        return self._created_at
+
+    def __repr__(self) -> str:
+        return f"SubscriptionRow(id={self.id}, user_id={self.user_id}, route={self.origin_code}-{self.destination_code})"
+
+
 @dataclass
 class SearchState:
     """Модель состояния поиска пользователя"""
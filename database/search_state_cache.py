@@ -0,0 +1,147 @@
+"""
+Кэш состояний поиска (search_states) в памяти процесса
+
+Каждый клик в SearchHandler — get_search_state + save_search_state; раньше это
+два обращения к SQLite и перезапись всей строки (23 колонки вместе с блобом
+selected_train_cargroups). Кэш хранит активные SearchState (LRU) и колонки в том
+виде, в каком они последний раз сохранены: чтение отдаёт копию из памяти, а
+сохранение выясняет, какие колонки изменились, и ставит в запись только их.
+Несколько сохранений до записи в базу сливаются в одну запись (pending).
+Сессии, простаивающие дольше idle_ttl, и лишние сверх maxsize вытесняются.
+"""
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .models import SearchState
+
+
+def _copy(state: SearchState) -> SearchState:
+    """Копия для вызывающего: его изменения не попадают в кэш без сохранения"""
+    return dataclasses.replace(state, messages_to_delete=list(state.messages_to_delete))
+
+
+class SearchStateCache:
+    """LRU состояний поиска с отслеживанием изменённых колонок.
+
+    columns — функция SearchState -> {колонка: значение} (DatabaseManager.search_state_columns).
+    Методы потокобезопасны: take_pending вызывается из потока писателя базы.
+    """
+
+    def __init__(self, columns: Callable[[SearchState], dict], maxsize: int = 1000,
+                 idle_ttl: float = 1800, clock: Callable[[], float] = time.monotonic):
+        self._columns = columns
+        self.maxsize = maxsize
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        # user_id -> (состояние, сохранённые колонки, время последнего обращения)
+        self._entries: "OrderedDict[int, Tuple[SearchState, dict, float]]" = OrderedDict()
+        # user_id -> (номер записи, колонки к записи)
+        self._pending: Dict[int, Tuple[int, dict]] = {}
+        self._tokens = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.columns_written = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: int) -> Optional[SearchState]:
+        """Копия состояния из кэша или None (нужно читать из базы)"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            state, saved, _ = entry
+            self._touch(user_id, state, saved)
+            return _copy(state)
+
+    def load(self, state: SearchState):
+        """Состояние, прочитанное из базы (совпадает с базой)"""
+        with self._lock:
+            self._touch(state.user_id, _copy(state), self._columns(state))
+
+    def update(self, state: SearchState) -> Optional[int]:
+        """Сохранение: запоминает состояние и изменённые колонки.
+
+        Возвращает номер записи, если её нужно поставить в очередь (take_pending);
+        None — изменений нет или запись для пользователя уже ждёт в очереди.
+        """
+        columns = self._columns(state)
+        with self._lock:
+            entry = self._entries.get(state.user_id)
+            saved = entry[1] if entry is not None else {}
+            changed = {name: value for name, value in columns.items()
+                       if entry is None or saved.get(name) != value}
+            self._touch(state.user_id, _copy(state), columns)
+            if not changed:
+                return None
+            pending = self._pending.get(state.user_id)
+            if pending is not None:
+                pending[1].update(changed)
+                return None
+            self._tokens += 1
+            self._pending[state.user_id] = (self._tokens, changed)
+            return self._tokens
+
+    def take_pending(self, user_id: int, token: int) -> Optional[dict]:
+        """Колонки к записи по номеру записи из update (None — запись отменена drop)"""
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is None or pending[0] != token:
+                return None
+            del self._pending[user_id]
+            self.writes += 1
+            self.columns_written += len(pending[1])
+            return pending[1]
+
+    def write_failed(self, user_id: int, token: int, columns: dict):
+        """Запись token (колонки columns из take_pending) не удалась.
+
+        Если после неё уже поставлена новая запись — колонки снова помечаются
+        изменёнными и уйдут вместе с ней (её значения новее). Иначе состояние
+        забывается: кэш расходится с базой, следующее чтение перечитает строку.
+        """
+        with self._lock:
+            pending = self._pending.get(user_id)
+            if pending is not None and pending[0] != token:
+                for name, value in columns.items():
+                    pending[1].setdefault(name, value)
+                return
+            self._entries.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def drop(self, user_id: int):
+        """Забывает состояние пользователя и его незаписанные колонки"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    def _touch(self, user_id: int, state: SearchState, saved: dict):
+        now = self._clock()
+        self._entries[user_id] = (state, saved, now)
+        self._entries.move_to_end(user_id)
+        # вытесняем простаивающие и лишние; состояния с незаписанными колонками
+        # держим, иначе чтение из базы вернуло бы устаревшую строку
+        while self._entries:
+            oldest, (_, _, used) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.maxsize and now - used <= self.idle_ttl:
+                break
+            if oldest in self._pending or oldest == user_id:
+                break
+            del self._entries[oldest]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'columns_written': self.columns_written,
+            'size': len(self._entries),
+        }
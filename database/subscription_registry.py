@@ -0,0 +1,144 @@
+"""
+Реестр активных подписок в памяти процесса
+
+Мониторинг каждые MONITORING_SYNC_INTERVAL перечитывал всю таблицу subscriptions
+и заново собирал Subscription (с datetime.fromisoformat на строку). Реестр
+загружается из базы один раз, а дальше обновляется хуками DatabaseManager после
+фиксации каждой записи (создание, отключение, включение, смена фильтров,
+удаление). Кроме списка по id есть индексы по маршруту (route_key — один запрос
+train-pricing) и по номеру поезда.
+
+Подписки хранятся как SubscriptionRow (__slots__, created_at не разбирается) и
+загружаются постранично (DatabaseManager.iter_active_subscriptions), без полного
+списка строк в памяти. Объекты в реестре общие для всех читателей — изменять их нельзя.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+from .models import Subscription, SubscriptionRow
+
+# подписка в реестре: SubscriptionRow из базы или Subscription, переданная в load
+AnySubscription = Union[SubscriptionRow, Subscription]
+
+
+def route_key(subscription: AnySubscription) -> tuple:
+    """Ключ запроса train-pricing: подписки с одинаковым ключом видят один ответ РЖД"""
+    return (
+        subscription.origin_code, subscription.destination_code, subscription.departure_date,
+        subscription.adult_passengers, subscription.children_passengers,
+    )
+
+
+def _train_numbers(subscription: AnySubscription) -> Set[str]:
+    return {n for n in (subscription.train_numbers or '').split(',') if n}
+
+
+class SubscriptionRegistry:
+    """Активные подписки по id с индексами по маршруту и номеру поезда.
+
+    Подписки без номеров поездов (любой поезд) входят в результат by_train для
+    любого номера. Методы потокобезопасны: хуки вызываются из потока писателя базы.
+    """
+
+    def __init__(self, manager=None):
+        self._by_id: Dict[int, AnySubscription] = {}
+        self._by_route: Dict[tuple, Dict[int, AnySubscription]] = {}
+        self._by_train: Dict[str, Dict[int, AnySubscription]] = {}
+        self._any_train: Dict[int, AnySubscription] = {}
+        self._lock = threading.Lock()
+        # изменения, пришедшие во время load (чтение таблицы могло их не увидеть)
+        self._during_load: Optional[Dict[int, Optional[AnySubscription]]] = None
+        self.loaded = False
+        self.manager = manager
+        if manager is not None:
+            manager.add_change_hook(self.apply)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, subscription_id: int) -> bool:
+        return subscription_id in self._by_id
+
+    def load(self, subscriptions: Iterable[AnySubscription] = None):
+        """Заполняет реестр (по умолчанию — активными подписками из базы, постранично)"""
+        from_db = subscriptions is None
+        if from_db:
+            subscriptions = self.manager.iter_active_subscriptions()
+        # собираем новый реестр отдельно: до конца загрузки читатели видят прежний
+        fresh = SubscriptionRegistry()
+        with self._lock:
+            self._during_load = {} if from_db else None
+        try:
+            for subscription in subscriptions:
+                if subscription.is_active:
+                    fresh._add(subscription)
+        except Exception:
+            with self._lock:
+                self._during_load = None
+            raise
+        with self._lock:
+            self._by_id, self._by_route = fresh._by_id, fresh._by_route
+            self._by_train, self._any_train = fresh._by_train, fresh._any_train
+            # изменения, зафиксированные пока читали таблицу, накладываем поверх
+            for subscription_id, subscription in (self._during_load or {}).items():
+                self._apply(subscription_id, subscription)
+            self._during_load = None
+            self.loaded = True
+
+    def apply(self, subscription_id: int, subscription: Optional[AnySubscription]):
+        """Хук DatabaseManager: подписка после изменения (None — удалена)"""
+        with self._lock:
+            if self._during_load is not None:
+                self._during_load[subscription_id] = subscription
+            self._apply(subscription_id, subscription)
+
+    def _apply(self, subscription_id: int, subscription: Optional[AnySubscription]):
+        self._remove(subscription_id)
+        if subscription is not None and subscription.is_active:
+            self._add(subscription)
+
+    def _add(self, subscription: AnySubscription):
+        self._by_id[subscription.id] = subscription
+        self._by_route.setdefault(route_key(subscription), {})[subscription.id] = subscription
+        numbers = _train_numbers(subscription)
+        for number in numbers:
+            self._by_train.setdefault(number, {})[subscription.id] = subscription
+        if not numbers:
+            self._any_train[subscription.id] = subscription
+
+    def _remove(self, subscription_id: int):
+        old = self._by_id.pop(subscription_id, None)
+        if old is None:
+            return
+        key = route_key(old)
+        self._by_route[key].pop(subscription_id, None)
+        if not self._by_route[key]:
+            del self._by_route[key]
+        for number in _train_numbers(old):
+            self._by_train[number].pop(subscription_id, None)
+            if not self._by_train[number]:
+                del self._by_train[number]
+        self._any_train.pop(subscription_id, None)
+
+    def get(self, subscription_id: int) -> Optional[AnySubscription]:
+        return self._by_id.get(subscription_id)
+
+    def active(self) -> List[AnySubscription]:
+        """Все активные подписки (в порядке id)"""
+        with self._lock:
+            return [self._by_id[i] for i in sorted(self._by_id)]
+
+    def by_route(self, key: tuple) -> List[AnySubscription]:
+        """Подписки маршрута route_key"""
+        with self._lock:
+            return list(self._by_route.get(key, {}).values())
+
+    def routes(self) -> Dict[tuple, List[AnySubscription]]:
+        """Все маршруты с их подписками"""
+        with self._lock:
+            return {key: list(subs.values()) for key, subs in self._by_route.items()}
+
+    def by_train(self, number: str) -> List[AnySubscription]:
+        """Подписки, которым интересен поезд number (включая подписки на любой поезд)"""
+        with self._lock:
+            return list(self._by_train.get(number, {}).values()) + list(self._any_train.values())
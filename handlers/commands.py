@@ -9,7 +9,7 @@ from aiogram.filters import Command
 from handlers.base import BaseHandler
 from services.notification import NotificationService
 from services.filters import format_filter_summary
-from database import DatabaseManager
+from database import AsyncDatabase
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +17,10 @@ logger = logging.getLogger(__name__)
 class CommandsHandler(BaseHandler):
     """Хендлер для команд"""
     
-    def __init__(self, router: Router):
-        self.notification_service = NotificationService()
-        self.db_manager = DatabaseManager()
+    def __init__(self, router: Router, db: AsyncDatabase = None,
+                 notification_service: NotificationService = None):
+        self.notification_service = notification_service or NotificationService()
+        self.db = db or AsyncDatabase()
         super().__init__(router)
     
     def register_handlers(self):
@@ -47,7 +48,7 @@ class CommandsHandler(BaseHandler):
     async def cancel_command(self, message: Message):
         """Обработчик команды /cancel — сброс зависшего состояния поиска"""
         try:
-            self.db_manager.clear_search_state(message.from_user.id)
+            await self.db.clear_search_state(message.from_user.id)
             await message.answer("🚫 Текущий поиск сброшен. Напишите /search, чтобы начать заново.")
         except Exception as e:
             logger.error(f"Ошибка сброса состояния поиска: {e}")
@@ -87,7 +88,7 @@ class CommandsHandler(BaseHandler):
         """Обработчик команды /subscriptions"""
         try:
             user_id = message.from_user.id
-            subscriptions = self.db_manager.get_user_subscriptions(user_id)
+            subscriptions = await self.db.get_user_subscriptions(user_id)
             
             if not subscriptions:
                 await message.answer("У вас пока нет подписок. Используйте поиск для создания подписки.")
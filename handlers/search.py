@@ -1,7 +1,6 @@
 """
 Хендлеры для поиска
 """
-import asyncio
 import json
 import logging
 from datetime import datetime
@@ -10,11 +9,15 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 
 from handlers.base import BaseHandler
-from services.rzd_api import RZDAPIService
+from services.rzd_api import AsyncRZDAPIService
+from services.rzd_seatmap import AsyncSeatMapService, SEATMAP_BERTHS, format_seatmap_detail
 from services.notification import NotificationService
 from services.monitoring import MonitoringService
+from services.seat_filter import filter_compiler
+from services import train_snapshot
+from services.train_snapshot import TrainSnapshotCache
 from services import filters as flt
-from database import DatabaseManager, SearchState, Subscription
+from database import AsyncDatabase, SearchState, Subscription
 from config import config
 
 logger = logging.getLogger(__name__)
@@ -23,10 +26,17 @@ logger = logging.getLogger(__name__)
 class SearchHandler(BaseHandler):
     """Хендлер для поиска"""
     
-    def __init__(self, router: Router):
-        self.rzd_api = RZDAPIService()
-        self.notification_service = NotificationService()
-        self.db_manager = DatabaseManager()
+    def __init__(self, router: Router, rzd_api: AsyncRZDAPIService = None,
+                 seatmap: AsyncSeatMapService = None, db: AsyncDatabase = None,
+                 notification_service: NotificationService = None):
+        # общие клиенты РЖД, Telegram и доступ к базе передаются из bot.py (один пул
+        # соединений, одна сессия отправки и один писатель в базу на весь бот)
+        self.rzd_api = rzd_api or AsyncRZDAPIService()
+        self.seatmap = seatmap or AsyncSeatMapService()
+        self.notification_service = notification_service or NotificationService()
+        self.db = db or AsyncDatabase()
+        # разобранные снимки выбранного поезда (панель фильтров перерисовывается на каждый клик)
+        self.train_snapshots = TrainSnapshotCache()
         super().__init__(router)
     
     def register_handlers(self):
@@ -107,8 +117,7 @@ class SearchHandler(BaseHandler):
 
     async def _load_and_show_trains(self, chat_id: int, search_state: SearchState):
         """Ищет поезда по выбранным параметрам и показывает список (общий путь)."""
-        trains_data = await asyncio.to_thread(
-            self.rzd_api.search_trains,
+        trains_data = await self.rzd_api.search_trains(
             origin_code=search_state.origin_code,
             destination_code=search_state.destination_code,
             departure_date=search_state.departure_date,
@@ -135,7 +144,7 @@ class SearchHandler(BaseHandler):
             sent_id = await self.notification_service.send_message_with_keyboard(chat_id, text, keyboard or [])
             if sent_id:
                 search_state.progress_message_id = sent_id
-        self.db_manager.save_search_state(search_state)
+        await self.db.save_search_state(search_state)
 
     def _panel_text(self, breakdown: dict, matched: dict, filter_summary: str,
                     matched_unit: str = "мест") -> str:
@@ -155,7 +164,7 @@ class SearchHandler(BaseHandler):
     async def search_command(self, message: Message):
         """Обработчик команды /search"""
         user_id = message.from_user.id
-        search_state = self.db_manager.get_search_state(user_id) or SearchState(user_id=user_id)
+        search_state = await self.db.get_search_state(user_id) or SearchState(user_id=user_id)
         # Сбросить старое состояние поиска
         search_state.origin_code = None
         search_state.origin_name = None
@@ -166,25 +175,25 @@ class SearchHandler(BaseHandler):
         search_state.selected_train_number = None
         search_state.selected_train_info = None
         search_state.search_step = 'origin'
-        self.db_manager.save_search_state(search_state)
+        await self.db.save_search_state(search_state)
         progress_text = self.format_progress_message(search_state) + '\nВведите название станции отправления:'
         sent = await message.answer(progress_text, parse_mode='HTML')
         search_state.progress_message_id = sent.message_id
-        self.db_manager.save_search_state(search_state)
+        await self.db.save_search_state(search_state)
 
     async def handle_text_message(self, message: Message):
         """Обработка текстовых сообщений с учетом этапа поиска"""
         try:
             user_id = message.from_user.id
             text = message.text.strip()
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             logger.info(f"[handle_text_message] user_id={user_id} search_step={getattr(search_state, 'search_step', None)} text='{text}'")
             if not search_state:
                 search_state = SearchState(user_id=user_id)
             # Если это не progress_message, добавить в messages_to_delete
             if message.message_id != search_state.progress_message_id:
                 search_state.messages_to_delete.append(message.message_id)
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
             # Явная логика по этапу поиска
             if search_state.search_step == 'origin':
                 await self.search_stations(message, text, search_state, step='origin')
@@ -199,27 +208,27 @@ class SearchHandler(BaseHandler):
             else:
                 sent = await message.answer('Используйте кнопки для выбора поезда или подписки.')
                 search_state.messages_to_delete.append(sent.message_id)
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
         except Exception as e:
             logger.error(f"Ошибка обработки текстового сообщения: {e}")
             sent = await message.answer("❌ Произошла ошибка. Попробуйте позже.")
-            search_state = self.db_manager.get_search_state(message.from_user.id) or SearchState(user_id=message.from_user.id)
+            search_state = await self.db.get_search_state(message.from_user.id) or SearchState(user_id=message.from_user.id)
             search_state.messages_to_delete.append(sent.message_id)
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
 
     async def search_stations(self, message: Message, query: str, search_state: SearchState, step: str):
         """Поиск станций для отправления или назначения"""
         if len(query) < config.MIN_QUERY_LENGTH:
             sent = await message.answer(f"Введите минимум {config.MIN_QUERY_LENGTH} символа для поиска станции")
             search_state.messages_to_delete.append(sent.message_id)
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             return
         try:
-            stations = await asyncio.to_thread(self.rzd_api.search_stations, query)
+            stations = await self.rzd_api.search_stations(query)
             if not stations:
                 sent = await message.answer("Станции не найдены. Попробуйте другой запрос.")
                 search_state.messages_to_delete.append(sent.message_id)
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
                 return
             keyboard = []
             options = {}  # код -> имя, чтобы надёжно восстановить имя (callback не вмещает длинные)
@@ -240,7 +249,7 @@ class SearchHandler(BaseHandler):
                 prev = {}
             prev.update(options)
             search_state.station_options = json.dumps(prev, ensure_ascii=False)
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             prompt = 'Выберите станцию отправления:' if step == 'origin' else 'Выберите станцию назначения:'
             sent_id = await self.notification_service.send_message_with_keyboard(
                 message.from_user.id,
@@ -250,12 +259,12 @@ class SearchHandler(BaseHandler):
             # Клавиатуру со списком станций надо удалить после выбора — кладём её id в messages_to_delete
             if sent_id:
                 search_state.messages_to_delete.append(sent_id)
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
         except Exception as e:
             logger.error(f"Ошибка поиска станций: {e}")
             sent = await message.answer("Ошибка при поиске станций. Попробуйте позже.")
             search_state.messages_to_delete.append(sent.message_id)
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
 
     async def handle_callback(self, callback: CallbackQuery):
         """Обработка callback запросов (добавить select_train_)"""
@@ -307,7 +316,7 @@ class SearchHandler(BaseHandler):
             if msg_id and msg_id != search_state.progress_message_id:
                 await self.notification_service.delete_message(chat_id, msg_id)
         search_state.messages_to_delete = []
-        self.db_manager.save_search_state(search_state)
+        await self.db.save_search_state(search_state)
 
     async def handle_station_selection(self, callback: CallbackQuery):
         """Обработка выбора станции (рефакторинг: редактируем прогресс-сообщение)"""
@@ -319,7 +328,7 @@ class SearchHandler(BaseHandler):
                 await callback.answer('❌ Ошибка при обработке выбора станции')
                 return
             station_code = parts[1]
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state:
                 search_state = SearchState(user_id=user_id)
             # Имя станции: 1) из карты код->имя (надёжно, callback не вмещает длинные),
@@ -336,7 +345,7 @@ class SearchHandler(BaseHandler):
             # Если сообщение с кнопками не совпадает с progress_message, добавить в messages_to_delete
             if callback.message.message_id != search_state.progress_message_id:
                 search_state.messages_to_delete.append(callback.message.message_id)
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
             logger.info(f"[handle_station_selection] user_id={user_id} search_step(before)={search_state.search_step} station_code={station_code} station_name={station_name}")
             # Определяем, какую станцию выбираем
             if search_state.search_step == 'origin':
@@ -354,7 +363,7 @@ class SearchHandler(BaseHandler):
             else:
                 await callback.answer('❌ Неожиданный этап выбора станции')
                 return
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             logger.info(f"[handle_station_selection] user_id={user_id} search_step(after)={search_state.search_step}")
             progress_text = self.format_progress_message(search_state) + next_step
             # на шаге даты показываем календарь-кнопки
@@ -373,7 +382,7 @@ class SearchHandler(BaseHandler):
                 )
                 if sent_id:
                     search_state.progress_message_id = sent_id
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
             # Удаляем все сообщения пользователя кроме progress_message_id
             await self._delete_user_messages(callback.message.chat.id, search_state)
             await callback.answer()
@@ -390,7 +399,7 @@ class SearchHandler(BaseHandler):
             return
         search_state.departure_date = date_obj.strftime("%Y-%m-%dT00:00:00")
         search_state.search_step = 'train'
-        self.db_manager.save_search_state(search_state)
+        await self.db.save_search_state(search_state)
         await self._load_and_show_trains(chat_id, search_state)
         await self._delete_user_messages(chat_id, search_state)
 
@@ -398,7 +407,7 @@ class SearchHandler(BaseHandler):
         """Выбор даты кнопкой-календарём (callback pickdate_YYYY-MM-DD)."""
         try:
             user_id = callback.from_user.id
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state:
                 await callback.answer('❌ Ошибка состояния поиска')
                 return
@@ -430,7 +439,7 @@ class SearchHandler(BaseHandler):
         """Поиск поездов"""
         try:
             user_id = callback.from_user.id
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             
             if not search_state or not all([
                 search_state.origin_code, 
@@ -442,9 +451,8 @@ class SearchHandler(BaseHandler):
             
             await callback.message.edit_text("🔍 Ищу поезда...")
 
-            # Поиск поездов через API (блокирующий requests — уводим в поток)
-            trains_data = await asyncio.to_thread(
-                self.rzd_api.search_trains,
+            # Поиск поездов через API
+            trains_data = await self.rzd_api.search_trains(
                 origin_code=search_state.origin_code,
                 destination_code=search_state.destination_code,
                 departure_date=search_state.departure_date,
@@ -548,7 +556,7 @@ class SearchHandler(BaseHandler):
             data = callback.data
             user_id = callback.from_user.id
             train_number = data.split("_")[-1]
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state or not all([
                 search_state.origin_code, 
                 search_state.destination_code, 
@@ -579,11 +587,11 @@ class SearchHandler(BaseHandler):
                 min_seats=search_state.min_seats,
                 adult_passengers=search_state.adult_passengers,
                 children_passengers=search_state.children_passengers,
-                interval_minutes=5,
+                interval_minutes=None,  # опрос раз в MONITORING_INTERVAL
                 is_active=True,
                 created_at=datetime.now()
             )
-            subscription_id = self.db_manager.create_subscription(subscription)
+            subscription_id = await self.db.create_subscription(subscription)
             if subscription_id:
                 result_text = (
                     f"✅ Подписка создана!\n\n"
@@ -602,7 +610,7 @@ class SearchHandler(BaseHandler):
                 else:
                     await callback.message.edit_text(result_text, parse_mode='HTML')
                 # Очищаем состояние поиска и progress_message_id
-                self.db_manager.clear_search_state(user_id)
+                await self.db.clear_search_state(user_id)
             else:
                 error_text = self.format_progress_message(search_state) + '\n❌ Ошибка при создании подписки'
                 if search_state.progress_message_id:
@@ -631,7 +639,7 @@ class SearchHandler(BaseHandler):
         """Подписка на отслеживание"""
         try:
             user_id = callback.from_user.id
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             
             if not search_state or not all([
                 search_state.origin_code, 
@@ -655,12 +663,12 @@ class SearchHandler(BaseHandler):
                 min_seats=search_state.min_seats,
                 adult_passengers=search_state.adult_passengers,
                 children_passengers=search_state.children_passengers,
-                interval_minutes=5,
+                interval_minutes=None,  # опрос раз в MONITORING_INTERVAL
                 is_active=True,
                 created_at=datetime.now()
             )
             
-            subscription_id = self.db_manager.create_subscription(subscription)
+            subscription_id = await self.db.create_subscription(subscription)
             
             if subscription_id:
                 await callback.message.edit_text(
@@ -671,7 +679,7 @@ class SearchHandler(BaseHandler):
                 )
                 
                 # Очищаем состояние поиска
-                self.db_manager.clear_search_state(user_id)
+                await self.db.clear_search_state(user_id)
             else:
                 await callback.message.edit_text("❌ Ошибка при создании подписки")
                 
@@ -689,7 +697,7 @@ class SearchHandler(BaseHandler):
             subscription_id = int(data.split("_")[-1])
             
             # Отключаем подписку
-            success = self.db_manager.disable_subscription(subscription_id, user_id)
+            success = await self.db.disable_subscription(subscription_id, user_id)
             
             if success:
                 await callback.message.edit_text("✅ Подписка отключена!")
@@ -734,7 +742,7 @@ class SearchHandler(BaseHandler):
         try:
             user_id = callback.from_user.id
             subscription_id = int(callback.data.split("_")[-1])
-            success = self.db_manager.delete_subscription(subscription_id, user_id)
+            success = await self.db.delete_subscription(subscription_id, user_id)
             text = f"🗑 Подписка #{subscription_id} удалена." if success else "❌ Подписка не найдена."
             await callback.message.edit_text(text)
             await callback.answer("Удалено" if success else "Не найдено")
@@ -749,7 +757,7 @@ class SearchHandler(BaseHandler):
             user_id = callback.from_user.id
 
             subscription_id = int(data.split("_")[-1])
-            success = self.db_manager.enable_subscription(subscription_id, user_id)
+            success = await self.db.enable_subscription(subscription_id, user_id)
 
             if success:
                 await callback.message.edit_text("✅ Подписка включена!")
@@ -765,43 +773,41 @@ class SearchHandler(BaseHandler):
         try:
             user_id = callback.from_user.id
             subscription_id = int(callback.data.split("_")[-1])
-            subscription = self.db_manager.get_subscription(subscription_id, user_id)
+            subscription = await self.db.get_subscription(subscription_id, user_id)
             if not subscription:
                 await callback.answer("Подписка не найдена")
                 return
             await callback.answer("Проверяю наличие мест…")
 
-            trains_data = await asyncio.to_thread(
-                self.rzd_api.search_trains,
+            trains_data = await self.rzd_api.search_trains(
                 origin_code=subscription.origin_code,
                 destination_code=subscription.destination_code,
                 departure_date=subscription.departure_date,
                 adult_passengers=subscription.adult_passengers,
                 children_passengers=subscription.children_passengers,
             )
-            allowed = subscription.train_numbers.split(',') if subscription.train_numbers else None
-            car_types = [c for c in (subscription.car_types or '').split(',') if c]
-            berth = subscription.berth
-            max_price = subscription.max_price
+            seat_filter = filter_compiler.compile(subscription)
+            car_types = seat_filter.car_types
+            berth = seat_filter.berth
+            max_price = seat_filter.max_price
             lines = []
             unit = flt.matched_unit(berth)
-            from services.rzd_seatmap import SeatMapService, SEATMAP_BERTHS as seatmap_berths, format_seatmap_detail
             for train in trains_data.get('trains', []):
                 t = self.rzd_api.extract_train_info(train)
-                if allowed and t['number'] not in allowed:
+                if not seat_filter.wants_train(t['number']):
                     continue
                 duration = f" ({t['duration']})" if t['duration'] else ''
                 line = f"🚂 <b>{t['number']}</b> {t['name']} {t['departure']}→{t['arrival']}{duration}\n"
-                if berth in seatmap_berths:
-                    # точный список купе через схему вагонов (сетевой запрос — в поток)
-                    detail = await asyncio.to_thread(
-                        SeatMapService().detail_for_berth, berth,
+                if seat_filter.needs_seatmap:
+                    # точный список купе через схему вагонов
+                    detail = await self.seatmap.detail_for_berth(
+                        berth,
                         subscription.origin_code, subscription.destination_code,
                         train.get('LocalDepartureDateTime'),
                         train.get('TrainNumber') or train.get('DisplayTrainNumber') or '',
                         train.get('Provider', 'P1'),
-                        car_types or None, max_price,
-                        min_count=subscription.min_seats,
+                        car_types, max_price,
+                        min_count=seat_filter.min_seats,
                     )
                     if detail:
                         line += f"   ✅ {unit}: {len(detail)}\n   🚪 {format_seatmap_detail(berth, detail)}"
@@ -809,7 +815,7 @@ class SearchHandler(BaseHandler):
                         line += f"   ❌ нет ({unit})"
                 else:
                     seats = self.rzd_api.match_seats(
-                        train, car_types=car_types or None, berth=berth, max_price=max_price
+                        train, car_types=car_types, berth=berth, max_price=max_price
                     )
                     if seats['total'] > 0:
                         line += f"   ✅ {unit}: {seats['total']}"
@@ -829,8 +835,7 @@ class SearchHandler(BaseHandler):
                 f"Фильтр: {summary}\n\n"
             )
             body = "\n".join(lines) if lines else "Поезда не найдены."
-            url = await asyncio.to_thread(
-                self.rzd_api.build_purchase_url,
+            url = await self.rzd_api.build_purchase_url(
                 subscription.origin_code, subscription.destination_code, subscription.departure_date,
                 subscription.origin_name, subscription.destination_name, subscription.adult_passengers,
             )
@@ -851,13 +856,12 @@ class SearchHandler(BaseHandler):
                 return
             train_number = parts[2]
             train_info = parts[3] if len(parts) > 3 else train_number
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state:
                 await callback.answer('❌ Ошибка состояния поиска')
                 return
             await callback.answer("Загружаю наличие…")
-            trains_data = await asyncio.to_thread(
-                self.rzd_api.search_trains,
+            trains_data = await self.rzd_api.search_trains(
                 origin_code=search_state.origin_code,
                 destination_code=search_state.destination_code,
                 departure_date=search_state.departure_date,
@@ -878,7 +882,7 @@ class SearchHandler(BaseHandler):
             search_state.filter_max_price = 0
             search_state.min_seats = 1
             search_state.editing_subscription_id = None
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             await self._render_filter_panel(callback.message.chat.id, search_state)
         except Exception as e:
             logger.error(f'Ошибка выбора поезда: {e}')
@@ -886,35 +890,19 @@ class SearchHandler(BaseHandler):
 
     @staticmethod
     def _store_train(train: dict) -> str:
-        """Сериализует нужные для панели данные поезда: CarGroups + мета (provider, dep)."""
-        return json.dumps({
-            "cg": train.get("CarGroups", []),
-            "p": train.get("Provider", "P1"),
-            "d": train.get("LocalDepartureDateTime"),
-        }, ensure_ascii=False)
-
-    @staticmethod
-    def _load_train(blob: str):
-        """Возвращает (cargroups, provider, dep). Поддерживает старый формат (список CarGroups)."""
-        try:
-            data = json.loads(blob or '[]')
-        except Exception:
-            return [], "P1", None
-        if isinstance(data, list):  # старый формат — только CarGroups
-            return data, "P1", None
-        return data.get("cg", []), data.get("p", "P1"), data.get("d")
+        """Компактный снимок поезда для панели: доступные группы вагонов + мета (provider, dep)."""
+        return train_snapshot.dump(train)
 
     async def _render_filter_panel(self, chat_id: int, search_state: SearchState):
         """Рисует/обновляет панель наличия и фильтров (edit-in-place)."""
-        cargroups, provider, dep = self._load_train(search_state.selected_train_cargroups)
-        train = {'CarGroups': cargroups}
+        snapshot = self.train_snapshots.get(search_state.user_id, search_state.selected_train_cargroups)
+        train, provider, dep = snapshot.train, snapshot.provider, snapshot.departure
         car_types = [c for c in (search_state.filter_car_types or '').split(',') if c]
         breakdown = self.rzd_api.match_seats(train)
-        from services.rzd_seatmap import SeatMapService, SEATMAP_BERTHS
         if search_state.filter_berth in SEATMAP_BERTHS:
-            # точный подсчёт купе через схему вагонов (сетевой запрос — в поток)
-            n = await asyncio.to_thread(
-                SeatMapService().count_for_berth, search_state.filter_berth,
+            # точный подсчёт купе через схему вагонов
+            n = await self.seatmap.count_for_berth(
+                search_state.filter_berth,
                 search_state.origin_code, search_state.destination_code, dep,
                 search_state.selected_train_number, provider,
                 car_types or None, search_state.filter_max_price,
@@ -936,7 +924,7 @@ class SearchHandler(BaseHandler):
             submit_text, submit_cb = "💾 Сохранить фильтры", "save_filters"
         else:
             submit_text, submit_cb = "🔔 Подписаться", "subscribe_filtered"
-        context = flt.build_filter_context(cargroups)
+        context = flt.build_filter_context(snapshot.cargroups)
         keyboard = flt.build_filter_keyboard(
             search_state.filter_car_types, search_state.filter_berth, search_state.filter_max_price,
             context, submit_text=submit_text, submit_cb=submit_cb, min_seats=search_state.min_seats,
@@ -949,14 +937,14 @@ class SearchHandler(BaseHandler):
             sent_id = await self.notification_service.send_message_with_keyboard(chat_id, text, keyboard)
             if sent_id:
                 search_state.progress_message_id = sent_id
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
 
     async def handle_filter_toggle(self, callback: CallbackQuery):
         """Тоггл фильтра: обновляем состояние и перерисовываем панель без запроса к РЖД."""
         try:
             user_id = callback.from_user.id
             parsed = flt.parse_filter_callback(callback.data)
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not parsed or not search_state:
                 await callback.answer()
                 return
@@ -969,14 +957,14 @@ class SearchHandler(BaseHandler):
                 if value == 'set':
                     # запрашиваем сумму вводом сообщением
                     search_state.search_step = 'await_price'
-                    self.db_manager.save_search_state(search_state)
+                    await self.db.save_search_state(search_state)
                     sent_id = await self.notification_service.send_message(
                         user_id,
                         "💰 Введите максимальную цену в рублях (например 8000).\nОтправьте 0 — без лимита.",
                     )
                     if sent_id:
                         search_state.messages_to_delete.append(sent_id)
-                        self.db_manager.save_search_state(search_state)
+                        await self.db.save_search_state(search_state)
                     await callback.answer("Введите цену сообщением")
                     return
                 # value == '0' — сброс лимита
@@ -984,17 +972,17 @@ class SearchHandler(BaseHandler):
             elif kind == 'seats' and value == 'set':
                 # запрашиваем количество мест вводом сообщением
                 search_state.search_step = 'await_seats'
-                self.db_manager.save_search_state(search_state)
+                await self.db.save_search_state(search_state)
                 sent_id = await self.notification_service.send_message(
                     user_id,
                     "🔢 Введите нужное количество мест (например 3).",
                 )
                 if sent_id:
                     search_state.messages_to_delete.append(sent_id)
-                    self.db_manager.save_search_state(search_state)
+                    await self.db.save_search_state(search_state)
                 await callback.answer("Введите количество мест сообщением")
                 return
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             await self._render_filter_panel(callback.message.chat.id, search_state)
             await callback.answer()
         except Exception as e:
@@ -1008,13 +996,13 @@ class SearchHandler(BaseHandler):
             search_state.filter_max_price = int(digits) if digits else 0
             # возвращаемся к панели фильтров
             search_state.search_step = 'done'
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             await self._render_filter_panel(message.chat.id, search_state)
             await self._delete_user_messages(message.chat.id, search_state)
         except Exception as e:
             logger.error(f"Ошибка ввода цены: {e}")
             search_state.search_step = 'done'
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
 
     async def handle_seats_input(self, message: Message, search_state: SearchState):
         """Обработка ручного ввода количества мест (после кнопки «Мест: N»)."""
@@ -1023,41 +1011,40 @@ class SearchHandler(BaseHandler):
             search_state.min_seats = max(1, int(digits)) if digits else 1
             # возвращаемся к панели фильтров
             search_state.search_step = 'done'
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             await self._render_filter_panel(message.chat.id, search_state)
             await self._delete_user_messages(message.chat.id, search_state)
         except Exception as e:
             logger.error(f"Ошибка ввода количества мест: {e}")
             search_state.search_step = 'done'
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
 
     async def handle_edit_filters(self, callback: CallbackQuery):
         """Открывает панель фильтров для существующей подписки (режим правки)."""
         try:
             user_id = callback.from_user.id
             subscription_id = int(callback.data.split("_")[-1])
-            sub = self.db_manager.get_subscription(subscription_id, user_id)
+            sub = await self.db.get_subscription(subscription_id, user_id)
             if not sub:
                 await callback.answer("Подписка не найдена")
                 return
             await callback.answer("Загружаю фильтры…")
-            trains_data = await asyncio.to_thread(
-                self.rzd_api.search_trains,
+            trains_data = await self.rzd_api.search_trains(
                 origin_code=sub.origin_code,
                 destination_code=sub.destination_code,
                 departure_date=sub.departure_date,
                 adult_passengers=sub.adult_passengers,
                 children_passengers=sub.children_passengers,
             )
-            allowed = sub.train_numbers.split(',') if sub.train_numbers else None
+            seat_filter = filter_compiler.compile(sub)
             selected = {}
             for tr in trains_data.get('trains', []):
                 num = self.rzd_api.extract_train_info(tr)['number']
-                if allowed and num not in allowed:
+                if not seat_filter.wants_train(num):
                     continue
                 selected = tr
                 break
-            search_state = self.db_manager.get_search_state(user_id) or SearchState(user_id=user_id)
+            search_state = await self.db.get_search_state(user_id) or SearchState(user_id=user_id)
             # переносим контекст подписки в состояние, чтобы панель работала как при создании
             search_state.origin_code = sub.origin_code
             search_state.origin_name = sub.origin_name
@@ -1073,7 +1060,7 @@ class SearchHandler(BaseHandler):
             search_state.editing_subscription_id = subscription_id
             search_state.search_step = 'editfilters'
             search_state.progress_message_id = None  # рисуем панель отдельным сообщением
-            self.db_manager.save_search_state(search_state)
+            await self.db.save_search_state(search_state)
             await self._render_filter_panel(callback.message.chat.id, search_state)
         except Exception as e:
             logger.error(f"Ошибка открытия правки фильтров: {e}")
@@ -1083,12 +1070,12 @@ class SearchHandler(BaseHandler):
         """Сохраняет изменённые фильтры в существующую подписку."""
         try:
             user_id = callback.from_user.id
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state or not search_state.editing_subscription_id:
                 await callback.answer("Нет подписки для сохранения")
                 return
             sub_id = search_state.editing_subscription_id
-            ok = self.db_manager.update_subscription_filters(
+            ok = await self.db.update_subscription_filters(
                 sub_id, user_id,
                 search_state.filter_car_types, search_state.filter_berth, search_state.filter_max_price,
                 search_state.min_seats,
@@ -1107,7 +1094,7 @@ class SearchHandler(BaseHandler):
                 )
             else:
                 await callback.message.answer(text, parse_mode='HTML')
-            self.db_manager.clear_search_state(user_id)
+            await self.db.clear_search_state(user_id)
             await callback.answer("Сохранено")
         except Exception as e:
             logger.error(f"Ошибка сохранения фильтров подписки: {e}")
@@ -1117,7 +1104,7 @@ class SearchHandler(BaseHandler):
         """Подписка на выбранный поезд (через этап выбора)"""
         try:
             user_id = callback.from_user.id
-            search_state = self.db_manager.get_search_state(user_id)
+            search_state = await self.db.get_search_state(user_id)
             if not search_state or not all([
                 search_state.origin_code,
                 search_state.destination_code,
@@ -1150,11 +1137,11 @@ class SearchHandler(BaseHandler):
                 min_seats=search_state.min_seats,
                 adult_passengers=search_state.adult_passengers,
                 children_passengers=search_state.children_passengers,
-                interval_minutes=5,
+                interval_minutes=None,  # опрос раз в MONITORING_INTERVAL
                 is_active=True,
                 created_at=datetime.now()
             )
-            subscription_id = self.db_manager.create_subscription(subscription)
+            subscription_id = await self.db.create_subscription(subscription)
             if subscription_id:
                 result_text = (
                     f"✅ Подписка создана!\n\n"
@@ -1173,7 +1160,7 @@ class SearchHandler(BaseHandler):
                     )
                 else:
                     await callback.message.edit_text(result_text, parse_mode='HTML')
-                self.db_manager.clear_search_state(user_id)
+                await self.db.clear_search_state(user_id)
             else:
                 error_text = self.format_progress_message(search_state) + '\n❌ Ошибка при создании подписки'
                 if search_state and search_state.progress_message_id:
@@ -2,11 +2,11 @@
 Пакет сервисов
 """
 
-from .rzd_api import RZDAPIService
+from .rzd_api import RZDAPIService, AsyncRZDAPIService
 from .monitoring import MonitoringService
 from .notification import NotificationService
 
-__all__ = ['RZDAPIService', 'MonitoringService', 'NotificationService']
+__all__ = ['RZDAPIService', 'AsyncRZDAPIService', 'MonitoringService', 'NotificationService']
 
 
 
@@ -0,0 +1,124 @@
+"""
+Кэш ответов РЖД: TTL + LRU + объединение параллельных запросов (single-flight)
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU-кэш с временем жизни записей и объединением одинаковых запросов.
+
+    get_or_load(key, loader): свежая запись отдаётся из кэша (hit); если за тем же
+    ключом уже идёт запрос — ждём его результат вместо второго запроса (coalesced);
+    иначе вызываем loader (miss). Исключение loader-а получают все ожидающие, в кэш
+    оно не попадает; при отмене ведущего запроса ожидающие загружают значение сами.
+    Значения отдаются как есть (без копии) — их нельзя изменять.
+    ttl <= 0 отключает хранение, но объединение параллельных запросов остаётся.
+    ttl_for(value) позволяет задать своё время жизни для отдельных значений
+    (например, короткое — для пустых ответов); None означает ttl по умолчанию.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 256,
+                 clock: Callable[[], float] = time.monotonic,
+                 ttl_for: Callable[[Any], Optional[float]] = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._ttl_for = ttl_for
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Свежее значение по ключу (с продвижением в LRU) или default"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Кладёт значение; при переполнении вытесняет давно не использованные"""
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (self._clock() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable = _MISSING):
+        """Удаляет запись по ключу (без ключа — очищает кэш целиком)"""
+        if key is _MISSING:
+            self._data.clear()
+        else:
+            self._data.pop(key, None)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение из кэша, из уже идущего запроса или от loader()"""
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+            pending = self._inflight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                # shield: отмена одного ожидающего не должна отменять общий запрос
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # отменён сам ожидающий — выходим, отменён ведущий — грузим заново
+                task = asyncio.current_task()
+                if not pending.cancelled() or (task is not None and task.cancelling()):
+                    raise
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # помечаем как прочитанное, если ожидающих не было
+            raise
+        else:
+            # значение — ожидающим до записи в кэш (ошибка ttl_for/set их не задевает)
+            future.set_result(value)
+        finally:
+            self._inflight.pop(key, None)
+            # ведущий отменён — ожидающие повторят загрузку сами
+            if not future.done():
+                future.cancel()
+        try:
+            self.set(key, value, self._ttl_for(value) if self._ttl_for else None)
+        except Exception as e:
+            logger.warning(f"Не удалось закэшировать значение {key!r}: {e}")
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий/промахов/объединённых запросов и размер кэша"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'size': len(self._data),
+        }
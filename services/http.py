@@ -0,0 +1,25 @@
+"""
+Общая фабрика HTTP-сессий aiohttp для запросов к РЖД
+"""
+import aiohttp
+
+from config import config
+
+
+def create_session(**kwargs) -> aiohttp.ClientSession:
+    """Создаёт ClientSession с пулом соединений и явными таймаутами.
+
+    Соединения к ticket.rzd.ru держатся открытыми (keep-alive) и переиспользуются,
+    поэтому TLS-рукопожатие платится один раз на соединение, а не на каждый запрос.
+    limit_per_host ограничивает число параллельных соединений к одному хосту.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=config.HTTP_POOL_LIMIT,
+        limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+    )
+    timeout = aiohttp.ClientTimeout(
+        total=config.HTTP_TIMEOUT,
+        connect=config.HTTP_CONNECT_TIMEOUT,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, **kwargs)
@@ -2,38 +2,201 @@
 Сервис мониторинга подписок
 """
 import asyncio
+import heapq
 import logging
+import random
 import time
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 from datetime import datetime
 
-from database import DatabaseManager, Subscription
-from services.rzd_api import RZDAPIService
+from database import AsyncDatabase, Subscription
+from database.subscription_registry import route_key
+from services.rzd_api import AsyncRZDAPIService
+from services.rzd_seatmap import (
+    AsyncSeatMapService, SeatMapIndex, detail_for_berth, format_seatmap_detail,
+    seatmap_may_match,
+)
 from services.notification import NotificationService
+from services.rate_limit import telegram_limiter
+from services.seat_filter import filter_compiler
+from services.train_model import Train, as_train
 from services.filters import format_filter_summary, matched_unit
+from services.seat_diff import (
+    count_places, decode_snapshot, diff_places, encode_snapshot, places_from_count, places_from_detail,
+)
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# (состояние, снимок мест) подписки, по которой ещё ничего не сохранено
+_NO_STATE = (None, None)
+
+
+@dataclass
+class TrainMatch:
+    """Результат оценки поезда под фильтр подписки.
+
+    detail — список купе/групп по схеме вагонов (для berth 'cabin'/'pair'/'together'),
+    seats — результат match_seats (для остальных фильтров), places — снимок свободных
+    мест {вагон: маска}, appeared/disappeared — разница с прошлым опросом (если был).
+    """
+    info: dict
+    count: int
+    detail: Optional[list] = None
+    seats: Optional[dict] = None
+    places: Dict[str, int] = field(default_factory=dict)
+    appeared: Optional[Dict[str, int]] = None
+    disappeared: Optional[Dict[str, int]] = None
+
+
+class SubscriptionScheduler:
+    """Очередь подписок по времени следующей проверки (min-heap по due-времени).
+
+    Каждая подписка опрашивается со своим interval_minutes (без него — раз в
+    MONITORING_INTERVAL). Расписание ведётся по маршрутам (route_key): первый
+    маршрут случайно размазывается по интервалу, новая подписка известного маршрута
+    встаёт на его ближайшую проверку, а разброс ±jitter при перепланировании общий
+    для подписок маршрута — поэтому маршрут проверяется одним запросом к РЖД, а
+    разные маршруты не идут пачкой в начале цикла. pop_due забирает всё, что
+    наступит в пределах batch_window, чтобы близкие проверки шли одним циклом.
+    Время — монотонные секунды.
+    """
+
+    def __init__(self, default_interval: float = None, jitter: float = None,
+                 rng: random.Random = None, clock=time.monotonic, batch_window: float = None):
+        self.default_interval = default_interval or config.MONITORING_INTERVAL
+        self.jitter = config.MONITORING_JITTER if jitter is None else jitter
+        self.batch_window = config.MONITORING_BATCH_WINDOW if batch_window is None else batch_window
+        self._rng = rng or random.Random()
+        self._clock = clock
+        self._heap: List[tuple] = []  # (due, subscription_id); устаревшие записи пропускаются
+        self._due: Dict[int, float] = {}
+        self._subscriptions: Dict[int, Subscription] = {}
+        self._routes: Dict[tuple, set] = {}  # route_key -> id подписок в расписании
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def interval_for(self, subscription: Subscription) -> float:
+        """Интервал опроса подписки в секундах"""
+        minutes = subscription.interval_minutes
+        return minutes * 60 if minutes and minutes > 0 else self.default_interval
+
+    def _push(self, subscription_id: int, due: float):
+        self._due[subscription_id] = due
+        heapq.heappush(self._heap, (due, subscription_id))
+
+    def _forget(self, subscription_id: int):
+        subscription = self._subscriptions.pop(subscription_id)
+        self._due.pop(subscription_id, None)
+        key = route_key(subscription)
+        self._routes[key].discard(subscription_id)
+        if not self._routes[key]:
+            del self._routes[key]
+
+    def _first_due(self, subscription: Subscription, now: float) -> float:
+        """Первая проверка: ближайшая проверка маршрута или случайный момент интервала"""
+        mates = [self._due[i] for i in self._routes.get(route_key(subscription), ()) if i in self._due]
+        if mates:
+            return min(mates)
+        return now + self._rng.uniform(0, self.interval_for(subscription))
+
+    def sync(self, subscriptions: List[Subscription], now: float = None):
+        """Синхронизирует очередь с актуальным списком активных подписок.
+
+        Новые подписки получают первое время проверки своего маршрута, у известных
+        обновляется только объект (фильтры), исчезнувшие — удаляются.
+        """
+        now = self._clock() if now is None else now
+        current = {s.id: s for s in subscriptions}
+        for subscription_id in list(self._subscriptions):
+            old = self._subscriptions[subscription_id]
+            if subscription_id not in current or route_key(current[subscription_id]) != route_key(old):
+                self._forget(subscription_id)
+        for subscription_id, subscription in current.items():
+            if subscription_id not in self._subscriptions:
+                self._push(subscription_id, self._first_due(subscription, now))
+                self._routes.setdefault(route_key(subscription), set()).add(subscription_id)
+            self._subscriptions[subscription_id] = subscription
+
+    def pop_due(self, now: float = None) -> List[Subscription]:
+        """Забирает из очереди подписки, проверка которых наступила (или наступит в batch_window)"""
+        now = self._clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now + self.batch_window:
+            due_at, subscription_id = heapq.heappop(self._heap)
+            if self._due.get(subscription_id) != due_at:
+                continue  # запись устарела (подписку удалили или перепланировали)
+            del self._due[subscription_id]
+            due.append(self._subscriptions[subscription_id])
+        return due
+
+    def reschedule(self, subscriptions: List[Subscription], now: float = None):
+        """Ставит следующие проверки через интервал подписки; разброс ±jitter — один на маршрут"""
+        now = self._clock() if now is None else now
+        spreads: Dict[tuple, float] = {}
+        for subscription in subscriptions:
+            if subscription.id not in self._subscriptions:
+                continue
+            key = route_key(subscription)
+            if key not in spreads:
+                spreads[key] = 1 + self._rng.uniform(-self.jitter, self.jitter)
+            self._push(subscription.id, now + self.interval_for(subscription) * spreads[key])
+
+    def next_due(self) -> Optional[float]:
+        """Ближайшее время проверки или None, если очередь пуста"""
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
 
 class MonitoringService:
     """Сервис мониторинга подписок"""
     
-    def __init__(self):
-        self.db_manager = DatabaseManager()
-        self.rzd_api = RZDAPIService()
-        self.notification_service = NotificationService()
+    def __init__(self, rzd_api: AsyncRZDAPIService = None, seatmap: AsyncSeatMapService = None,
+                 db: AsyncDatabase = None, notification_service: NotificationService = None):
+        # общий с хендлерами доступ к базе (один писатель на процесс)
+        self.db = db or AsyncDatabase()
+        self.db_manager = self.db.manager
+        # общие клиенты РЖД передаются из bot.py (один пул соединений на весь бот)
+        self.rzd_api = rzd_api or AsyncRZDAPIService()
+        self.seatmap = seatmap or AsyncSeatMapService()
+        self.notification_service = notification_service or NotificationService()
         self.is_running = False
+        self.last_cycle_stats: dict = {}
+        # сколько запросов CarPricing не понадобилось благодаря агрегатам train-pricing
+        self.seatmap_pruned = 0
+        self.scheduler = SubscriptionScheduler()
     
     async def start_monitoring(self):
-        """Запуск мониторинга"""
+        """Запуск мониторинга.
+
+        Список активных подписок (реестр в памяти, см. database.subscription_registry)
+        сверяется с расписанием раз в MONITORING_SYNC_INTERVAL, а каждая подписка
+        проверяется по своему расписанию (SubscriptionScheduler). Подписки одного
+        маршрута становятся «due» вместе и проверяются одним циклом: один запрос
+        train-pricing на маршрут, одна схема на поезд, одна запись состояний.
+        """
         self.is_running = True
         logger.info("Мониторинг подписок запущен")
+        next_sync = 0.0
         
         while self.is_running:
             try:
-                await self.check_all_subscriptions()
-                await asyncio.sleep(config.MONITORING_INTERVAL)
+                now = time.monotonic()
+                if now >= next_sync:
+                    self.scheduler.sync(await self.db.get_active_subscriptions(), now)
+                    next_sync = now + config.MONITORING_SYNC_INTERVAL
+
+                due = self.scheduler.pop_due(now)
+                if due:
+                    await self.check_subscriptions(due)
+                    self.scheduler.reschedule(due, time.monotonic())
+
+                next_due = self.scheduler.next_due()
+                wake_at = next_sync if next_due is None else min(next_due, next_sync)
+                await asyncio.sleep(max(0.0, wake_at - time.monotonic()))
             except Exception as e:
                 logger.error(f"Ошибка в мониторинге: {e}")
                 await asyncio.sleep(60)  # Пауза при ошибке
@@ -43,20 +206,243 @@ class MonitoringService:
         self.is_running = False
         logger.info("Мониторинг подписок остановлен")
     
+    @staticmethod
+    def route_key(subscription: Subscription) -> tuple:
+        """Ключ запроса train-pricing: подписки с одинаковым ключом видят один ответ РЖД"""
+        return route_key(subscription)
+
+    @classmethod
+    def group_by_route(cls, subscriptions: List[Subscription]) -> Dict[tuple, List[Subscription]]:
+        """Группирует подписки по маршруту (порядок групп и подписок сохраняется)"""
+        routes: Dict[tuple, List[Subscription]] = {}
+        for subscription in subscriptions:
+            routes.setdefault(cls.route_key(subscription), []).append(subscription)
+        return routes
+
     async def check_all_subscriptions(self):
         """Проверка всех активных подписок"""
         try:
-            subscriptions = self.db_manager.get_active_subscriptions()
-            logger.info(f"Проверяем {len(subscriptions)} активных подписок")
-            
-            for subscription in subscriptions:
-                try:
-                    await self.check_single_subscription(subscription)
-                except Exception as e:
-                    logger.error(f"Ошибка при проверке подписки {subscription.id}: {e}")
-                    
+            subscriptions = await self.db.get_active_subscriptions()
+            await self.check_subscriptions(subscriptions)
         except Exception as e:
             logger.error(f"Ошибка при проверке подписок: {e}")
+
+    async def check_subscriptions(self, subscriptions: List[Subscription]) -> dict:
+        """Параллельная проверка подписок с ограничением MONITORING_CONCURRENCY.
+
+        Одновременно выполняется не больше MONITORING_CONCURRENCY запросов к РЖД /
+        проверок подписок; ошибка одной подписки не влияет на остальные. Сначала
+        запрашиваются поезда маршрутов, затем схема вагонов — по одному запросу на
+        каждый поезд, нужный хоть одной подписке cabin/pair/together, и только потом
+        подписки оцениваются по готовым данным. Возвращает статистику цикла (она же в
+        self.last_cycle_stats) — по длительности цикла подбирается лимит параллельности.
+        """
+        started = time.monotonic()
+        pruned_before = self.seatmap_pruned
+        routes = self.group_by_route(subscriptions)
+        logger.debug(f"Проверяем {len(subscriptions)} активных подписок на {len(routes)} маршрутах")
+
+        semaphore = asyncio.Semaphore(max(1, config.MONITORING_CONCURRENCY))
+        loaded = await asyncio.gather(
+            *(self._load_route(route_subscriptions, semaphore) for route_subscriptions in routes.values()),
+            return_exceptions=True,
+        )
+        failed = 0
+        ready = []  # (подписки маршрута, ответ train-pricing)
+        for route_subscriptions, result in zip(routes.values(), loaded):
+            if isinstance(result, BaseException):
+                ids = [s.id for s in route_subscriptions]
+                logger.error(f"Ошибка при проверке маршрута подписок {ids}: {result}")
+                failed += len(route_subscriptions)
+            elif result is not None:
+                ready.append((route_subscriptions, result))
+
+        seatmaps = await self.prefetch_seatmaps(ready, semaphore)
+        # прошлые состояния всех подписок цикла — одним запросом, изменившиеся — одной записью
+        states = await self.db.get_subscription_states(
+            [s.id for route_subscriptions, _ in ready for s in route_subscriptions]
+        )
+        changed: Dict[int, tuple] = {}
+        results = await asyncio.gather(
+            *(self.check_route(route_subscriptions, semaphore, trains_data, seatmaps, states, changed)
+              for route_subscriptions, trains_data in ready),
+            return_exceptions=True,
+        )
+        await self._save_states(changed)
+        for (route_subscriptions, _), result in zip(ready, results):
+            if isinstance(result, BaseException):
+                ids = [s.id for s in route_subscriptions]
+                logger.error(f"Ошибка при проверке маршрута подписок {ids}: {result}")
+                failed += len(route_subscriptions)
+            else:
+                failed += result
+
+        duration = time.monotonic() - started
+        self.last_cycle_stats = {
+            'subscriptions': len(subscriptions),
+            'routes': len(routes),
+            'failed': failed,
+            'duration': duration,
+            'concurrency': config.MONITORING_CONCURRENCY,
+            'seatmap_pruned': self.seatmap_pruned - pruned_before,
+            'seatmap_fetched': len(seatmaps),
+            'states_saved': len(changed),
+            # лимит отправки в Telegram: глубина очереди и ожидание (накопительно)
+            'telegram': telegram_limiter.stats(),
+        }
+        telegram = self.last_cycle_stats['telegram']
+        logger.info(
+            f"Цикл мониторинга: {len(subscriptions)} подписок, {len(routes)} маршрутов "
+            f"за {duration:.1f} с (ошибок: {failed}, параллельность: {config.MONITORING_CONCURRENCY}, "
+            f"схем вагонов: {len(seatmaps)}, без запроса схемы: {self.last_cycle_stats['seatmap_pruned']}, "
+            f"очередь Telegram: {telegram['waiting']}, ожидание до {telegram['wait_max']:.1f} с)"
+        )
+        if duration > config.MONITORING_INTERVAL:
+            logger.warning(
+                f"Цикл мониторинга ({duration:.0f} с) длиннее MONITORING_INTERVAL "
+                f"({config.MONITORING_INTERVAL} с) — стоит увеличить MONITORING_CONCURRENCY"
+            )
+        return self.last_cycle_stats
+
+    async def _load_route(self, subscriptions: List[Subscription],
+                          semaphore: asyncio.Semaphore) -> Optional[dict]:
+        """Поезда маршрута (один запрос на группу) или None, если дата уже прошла"""
+        # дата отправления входит в ключ маршрута — группа устаревает целиком
+        if self._is_expired(subscriptions[0]):
+            for subscription in subscriptions:
+                await self._deactivate_expired(subscription)
+            return None
+        async with semaphore:
+            return await self._fetch_trains(subscriptions[0])
+
+    async def prefetch_seatmaps(self, routes: List[tuple],
+                                semaphore: asyncio.Semaphore) -> Dict[tuple, Optional[SeatMapIndex]]:
+        """Схемы вагонов всех поездов, нужных подпискам cabin/pair/together цикла.
+
+        routes — [(подписки маршрута, ответ train-pricing)]. Каждый поезд (ключ
+        seatmap_key) запрашивается один раз, сколько бы подписок на него ни было;
+        поезда, которые агрегаты исключают для всех подписок, не запрашиваются
+        (seatmap_pruned — число таких схем, а не пар подписка×поезд).
+        """
+        wanted: Dict[tuple, Train] = {}
+        pruned = set()
+        for subscriptions, trains_data in routes:
+            for subscription in subscriptions:
+                seat_filter = filter_compiler.compile(subscription)
+                if not seat_filter.needs_seatmap:
+                    continue
+                for train in map(as_train, trains_data['trains']):
+                    if not seat_filter.wants_train(train.number):
+                        continue
+                    key = self.seatmap_key(subscription, train)
+                    if key in wanted:
+                        continue
+                    if seatmap_may_match(
+                        train, seat_filter.berth, car_types=seat_filter.car_types,
+                        max_price=seat_filter.max_price, min_count=seat_filter.min_seats,
+                    ):
+                        wanted[key] = train
+                    else:
+                        pruned.add(key)
+        # схема, исключённая для одной подписки, могла понадобиться другой
+        self.seatmap_pruned += len(pruned - wanted.keys())
+
+        async def fetch(key):
+            async with semaphore:
+                return await self.seatmap.fetch_index(*key)
+
+        indexes = await asyncio.gather(*(fetch(key) for key in wanted), return_exceptions=True)
+        seatmaps = {}
+        for key, index in zip(wanted, indexes):
+            if isinstance(index, BaseException):
+                logger.error(f"Схема вагонов недоступна ({key[3]}): {index}")
+                index = None
+            seatmaps[key] = index
+        return seatmaps
+
+    async def check_route(self, subscriptions: List[Subscription],
+                          semaphore: asyncio.Semaphore = None, trains_data: dict = None,
+                          seatmaps: Dict[tuple, Optional[SeatMapIndex]] = None,
+                          states: Dict[int, tuple] = None, changed: Dict[int, tuple] = None) -> int:
+        """Проверка группы подписок одного маршрута: один запрос к РЖД на всю группу.
+
+        trains_data/seatmaps — уже полученные в цикле поезда маршрута и схемы вагонов;
+        без них всё запрашивается здесь. Агрегатные фильтры всех подписок группы
+        считаются разом (match_route_batch). states — прошлые (состояние, снимок мест)
+        подписок цикла, changed — куда сложить изменившиеся (их сохраняет вызвавший);
+        без них состояния группы читаются и сохраняются здесь. Возвращает число
+        подписок, проверка которых завершилась ошибкой.
+        """
+        semaphore = semaphore or asyncio.Semaphore(max(1, config.MONITORING_CONCURRENCY))
+        if trains_data is None:
+            trains_data = await self._load_route(subscriptions, semaphore)
+            if trains_data is None:
+                return 0
+        trains_data = dict(trains_data, trains=[as_train(t) for t in trains_data['trains']])
+        aggregates = self.batch_aggregates(subscriptions, trains_data['trains'])
+        save_here = changed is None
+        if states is None:
+            states = await self.db.get_subscription_states([s.id for s in subscriptions])
+        if save_here:
+            changed = {}
+
+        async def check(subscription):
+            async with semaphore:
+                return await self.check_single_subscription(
+                    subscription, trains_data, seatmaps, aggregates.get(subscription.id),
+                    states.get(subscription.id, _NO_STATE), changed,
+                )
+
+        results = await asyncio.gather(*(check(s) for s in subscriptions), return_exceptions=True)
+        if save_here:
+            await self._save_states(changed)
+        failed = 0
+        for subscription, result in zip(subscriptions, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка при проверке подписки {subscription.id}: {result}")
+            if result is not True:
+                failed += 1
+        return failed
+
+    def batch_aggregates(self, subscriptions: List[Subscription],
+                         trains: List[Train]) -> Dict[int, List[dict]]:
+        """match_seats подписок с агрегатными фильтрами: {id подписки: [результат по поездам]}.
+
+        Один проход по группам вагонов каждого поезда на все подписки маршрута
+        (одинаковые фильтры считаются один раз) вместо match_seats на каждую пару.
+        """
+        compiled = [(s, filter_compiler.compile(s)) for s in subscriptions]
+        compiled = [(s, f) for s, f in compiled if not f.needs_seatmap]
+        if not compiled:
+            return {}
+        subscriptions = [s for s, _ in compiled]
+        filters = [f for _, f in compiled]
+        per_train = self.rzd_api.match_route_batch(trains, filters)
+        return {
+            subscription.id: [results[i] for results in per_train]
+            for i, subscription in enumerate(subscriptions)
+        }
+
+    async def _save_states(self, changed: Dict[int, tuple]):
+        """Изменившиеся состояния подписок — одной транзакцией"""
+        if changed and not await self.db.save_subscription_states(changed):
+            logger.error(f"Не удалось сохранить состояния {len(changed)} подписок")
+
+    async def _fetch_trains(self, subscription: Subscription) -> dict:
+        """Поезда маршрута подписки (train-pricing), сразу в виде Train"""
+        return await self.rzd_api.search_trains(
+            origin_code=subscription.origin_code,
+            destination_code=subscription.destination_code,
+            departure_date=subscription.departure_date,
+            adult_passengers=subscription.adult_passengers,
+            children_passengers=subscription.children_passengers,
+            typed=True,
+        )
+
+    async def _deactivate_expired(self, subscription: Subscription):
+        """Подписки на прошедшие даты больше не имеет смысла проверять — деактивируем"""
+        await self.db.disable_subscription(subscription.id, subscription.user_id)
+        logger.info(f"Подписка #{subscription.id} деактивирована: дата отправления прошла")
     
     def _is_expired(self, subscription: Subscription) -> bool:
         """Дата отправления уже прошла?"""
@@ -66,90 +452,154 @@ class MonitoringService:
             return False
 
     @staticmethod
-    def count_matched(rzd_api, subscription, train) -> int:
-        """Сколько мест поезда подходит под фильтр подписки.
+    def seatmap_key(subscription: Subscription, train: Train) -> tuple:
+        """Ключ схемы вагонов (аргументы fetch_index): от числа пассажиров не зависит"""
+        return (
+            subscription.origin_code, subscription.destination_code,
+            train.departure_datetime, train.number, train.provider,
+        )
+
+    @staticmethod
+    def _wants_train(subscription: Subscription, train: Train) -> bool:
+        """Поезд входит в train_numbers подписки (пустой список — любой)"""
+        return filter_compiler.compile(subscription).wants_train(train.info['number'])
+
+    async def evaluate_train(self, subscription, train,
+                             seatmaps: Dict[tuple, Optional[SeatMapIndex]] = None,
+                             seats: dict = None) -> TrainMatch:
+        """Оценка поезда под фильтр подписки — один раз за проверку.
 
-        Для berth 'cabin'/'pair'/'together' считает через схему вагонов (CarPricing) —
-        агрегатных данных недостаточно. Иначе — match_seats.
+        Для berth 'cabin'/'pair'/'together' — список купе/групп по схеме вагонов
+        (CarPricing): агрегатных данных недостаточно. Но если агрегаты уже исключают
+        совпадение, схема не запрашивается. Схема берётся из seatmaps
+        (собранных циклом), иначе запрашивается. Для остальных фильтров — match_seats
+        (или готовый результат seats из batch_aggregates).
         """
-        from services.rzd_seatmap import SeatMapService, SEATMAP_BERTHS
-        if subscription.berth in SEATMAP_BERTHS:
-            car_types = [c for c in (subscription.car_types or '').split(',') if c]
-            n = SeatMapService().count_for_berth(
-                subscription.berth,
-                subscription.origin_code, subscription.destination_code,
-                train.get('LocalDepartureDateTime'),
-                train.get('TrainNumber') or train.get('DisplayTrainNumber') or '',
-                train.get('Provider', 'P1'),
-                car_types=car_types or None, max_price=subscription.max_price,
-                min_count=subscription.min_seats,
+        train = as_train(train)
+        info = train.info
+        seat_filter = filter_compiler.compile(subscription)
+        if seat_filter.needs_seatmap:
+            if not seatmap_may_match(train, seat_filter.berth, car_types=seat_filter.car_types,
+                                     max_price=seat_filter.max_price, min_count=seat_filter.min_seats):
+                return TrainMatch(info=info, count=0, detail=[])
+            key = self.seatmap_key(subscription, train)
+            if seatmaps is not None and key in seatmaps:
+                index = seatmaps[key]
+                detail = detail_for_berth(
+                    index, seat_filter.berth, car_types=seat_filter.car_types,
+                    max_price=seat_filter.max_price, min_count=seat_filter.min_seats,
+                ) if index is not None else []
+            else:
+                detail = await self.seatmap.detail_for_berth(
+                    seat_filter.berth, *key,
+                    car_types=seat_filter.car_types, max_price=seat_filter.max_price,
+                    min_count=seat_filter.min_seats,
+                ) or []
+            return TrainMatch(info=info, count=len(detail), detail=detail,
+                              places=places_from_detail(detail))
+        if seats is None:
+            seats = self.rzd_api.match_seats(
+                train, car_types=seat_filter.car_types,
+                berth=seat_filter.berth, max_price=seat_filter.max_price,
             )
-            return n or 0
-        car_types = [c for c in (subscription.car_types or '').split(',') if c]
-        return rzd_api.match_seats(
-            train, car_types=car_types or None,
-            berth=subscription.berth, max_price=subscription.max_price,
-        )['total']
+        return TrainMatch(info=info, count=seats['total'], seats=seats,
+                          places=places_from_count(seats['total']))
 
-    @classmethod
-    def _filtered_state(cls, rzd_api, subscription, trains: list):
-        """Возвращает (подходящие_поезда, строка_состояния) с учётом фильтров подписки."""
-        available, parts = [], []
-        for train in trains:
-            number = rzd_api.extract_train_info(train)['number']
-            if subscription.train_numbers and number not in subscription.train_numbers.split(','):
-                continue
-            count = cls.count_matched(rzd_api, subscription, train)
-            if count >= max(1, subscription.min_seats):
-                available.append(train)
-            parts.append(f"{number}:{count}")
-        return available, ",".join(sorted(parts))
-
-    async def check_single_subscription(self, subscription: Subscription):
-        """Проверка одной подписки"""
+    async def count_matched(self, subscription, train) -> int:
+        """Сколько мест поезда подходит под фильтр подписки"""
+        return (await self.evaluate_train(subscription, train)).count
+
+    async def evaluate_trains(self, subscription, trains: list,
+                              seatmaps: Dict[tuple, Optional[SeatMapIndex]] = None,
+                              aggregates: List[dict] = None) -> List[TrainMatch]:
+        """Оценка поездов маршрута, отобранных по train_numbers подписки.
+
+        aggregates — готовые результаты match_seats по каждому поезду trains.
+        """
+        aggregates = aggregates or [None] * len(trains)
+        seat_filter = filter_compiler.compile(subscription)
+        return [await self.evaluate_train(subscription, train, seatmaps, seats)
+                for train, seats in zip(map(as_train, trains), aggregates)
+                if seat_filter.wants_train(train.info['number'])]
+
+    @staticmethod
+    def _state(matches: List[TrainMatch]) -> str:
+        return ",".join(sorted(f"{m.info['number']}:{m.count}" for m in matches))
+
+    async def _filtered_state(self, subscription, trains: list):
+        """Возвращает (подходящие TrainMatch, строка_состояния) с учётом фильтров подписки."""
+        matches = await self.evaluate_trains(subscription, trains)
+        need = filter_compiler.compile(subscription).threshold
+        return [m for m in matches if m.count >= need], self._state(matches)
+
+    @staticmethod
+    def _apply_diff(matches: List[TrainMatch], previous: Dict[str, Dict[str, int]]):
+        """Проставляет appeared/disappeared относительно прошлого снимка"""
+        for m in matches:
+            m.appeared, m.disappeared = diff_places(previous.get(m.info['number'], {}), m.places)
+
+    async def check_single_subscription(self, subscription: Subscription, trains_data: dict = None,
+                                        seatmaps: Dict[tuple, Optional[SeatMapIndex]] = None,
+                                        aggregates: List[dict] = None, state: tuple = None,
+                                        changed: Dict[int, tuple] = None) -> bool:
+        """Проверка одной подписки (True — успешно, False — ошибка, она уже залогирована).
+
+        trains_data — уже полученный ответ train-pricing маршрута (из check_route);
+        без него поезда запрашиваются отдельно. seatmaps — схемы вагонов цикла,
+        aggregates — результаты match_seats по поездам (из batch_aggregates).
+        state — прошлые (состояние, снимок мест) из get_subscription_states; новое
+        состояние, если оно изменилось, кладётся в changed (иначе сохраняется сразу).
+        """
         try:
-            # Подписки на прошедшие даты больше не имеет смысла проверять — деактивируем
             if self._is_expired(subscription):
-                self.db_manager.disable_subscription(subscription.id, subscription.user_id)
-                logger.info(f"Подписка #{subscription.id} деактивирована: дата отправления прошла")
-                return
-
-            # Получаем данные о поездах (блокирующий requests — уводим в отдельный поток)
-            trains_data = await asyncio.to_thread(
-                self.rzd_api.search_trains,
-                origin_code=subscription.origin_code,
-                destination_code=subscription.destination_code,
-                departure_date=subscription.departure_date,
-                adult_passengers=subscription.adult_passengers,
-                children_passengers=subscription.children_passengers
-            )
+                await self._deactivate_expired(subscription)
+                return True
+
+            # Получаем данные о поездах
+            if trains_data is None:
+                trains_data = await self._fetch_trains(subscription)
             
-            # Проверяем наличие мест (с учётом фильтров подписки) и готовим краткое состояние.
-            # Для фильтра «купе целиком» внутри идёт сетевой запрос схемы вагонов — уводим в поток.
-            available_trains, current_state = await asyncio.to_thread(
-                self._filtered_state, self.rzd_api, subscription, trains_data['trains']
-            )
-            last_state = self.db_manager.get_subscription_last_state(subscription.id)
+            # Оцениваем поезда (с учётом фильтров подписки). Для фильтров cabin/pair/together
+            # внутри идёт запрос схемы вагонов — один раз: уведомление собирается из тех же результатов.
+            matches = await self.evaluate_trains(subscription, trains_data['trains'], seatmaps, aggregates)
+            need = filter_compiler.compile(subscription).threshold
+            available_trains = [m for m in matches if m.count >= need]
+            current_state = self._state(matches)
+            if state is None:
+                state = (await self.db.get_subscription_states([subscription.id])).get(subscription.id, _NO_STATE)
+            last_state, last_places = state
+            previous = decode_snapshot(last_places)
 
-            # Отправляем уведомление только если текущая сводка отличается от предыдущей,
-            # и одновременно сейчас есть доступные места по условиям подписки.
-            if available_trains and current_state != (last_state or ""):
-                await self.send_availability_notification(subscription, available_trains)
+            if previous is None:
+                # Снимка мест ещё нет — уведомляем, если сводка отличается от предыдущей
+                # и одновременно сейчас есть доступные места по условиям подписки.
+                fresh = available_trains if current_state != (last_state or "") else []
+            else:
+                # Уведомляем только о поездах, где появились новые места (а не о тех же
+                # оставшихся или пропавших) — неизменившиеся поезда не перерисовываем.
+                self._apply_diff(matches, previous)
+                fresh = [m for m in available_trains if m.appeared]
+            if fresh:
+                await self.send_availability_notification(subscription, fresh)
 
-            # Сохраняем текущее состояние всегда
-            self.db_manager.save_subscription_last_state(subscription.id, current_state)
+            # Сохраняем состояние и снимок мест, только если они изменились
+            new_state = (current_state, encode_snapshot({m.info['number']: m.places for m in matches}))
+            if new_state != state:
+                if changed is not None:
+                    changed[subscription.id] = new_state
+                else:
+                    await self.db.save_subscription_states({subscription.id: new_state})
+            return True
                 
         except Exception as e:
             logger.error(f"Ошибка при проверке подписки {subscription.id}: {e}")
+            return False
     
-    async def send_availability_notification(self, subscription: Subscription, trains: List[dict]):
+    async def send_availability_notification(self, subscription: Subscription, matches: List[TrainMatch]):
         """Отправка уведомления о появлении мест"""
         try:
-            # для cabin внутри идёт сетевой запрос схемы вагонов — уводим в поток
-            message = await asyncio.to_thread(self.format_availability_message, subscription, trains)
-            # резолв nodeId делает сетевые запросы — уводим в поток
-            purchase_url = await asyncio.to_thread(
-                self.rzd_api.build_purchase_url,
+            message = self.format_availability_message(subscription, matches)
+            purchase_url = await self.rzd_api.build_purchase_url(
                 subscription.origin_code, subscription.destination_code,
                 subscription.departure_date,
                 subscription.origin_name, subscription.destination_name,
@@ -164,53 +614,41 @@ class MonitoringService:
         except Exception as e:
             logger.error(f"Ошибка отправки уведомления: {e}")
     
-    def format_availability_message(self, subscription: Subscription, trains: List[dict]) -> str:
-        """Форматирование сообщения о появлении мест"""
+    def format_availability_message(self, subscription: Subscription, matches: List[TrainMatch]) -> str:
+        """Форматирование сообщения о появлении мест (по готовым результатам, без запросов)"""
         message = f"🔔 Уведомление о появлении мест!\n\n"
         message += f"Подписка #{subscription.id}\n"
         message += f"Маршрут: {subscription.origin_name} -> {subscription.destination_name}\n"
         message += f"Дата: {subscription.departure_date[:10]}\n\n"
 
-        car_types = [c for c in (subscription.car_types or '').split(',') if c]
         berth = subscription.berth
-        max_price = subscription.max_price
-
-        summary = format_filter_summary(subscription.car_types, berth, max_price, subscription.min_seats)
+        summary = format_filter_summary(subscription.car_types, berth, subscription.max_price,
+                                        subscription.min_seats)
         message += f"Фильтр: {summary}\n\n"
 
-        for i, train in enumerate(trains[:5], 1):  # Показываем первые 5 поездов
-            t = self.rzd_api.extract_train_info(train)
+        unit = matched_unit(berth)
+        for i, match in enumerate(matches[:5], 1):  # Показываем первые 5 поездов
+            t = match.info
             duration = f" ({t['duration']})" if t['duration'] else ''
 
             message += f"{i}. 🚂 {t['number']} {t['name']}\n"
             message += f"   ⏰ {t['departure']} → {t['arrival']}{duration}\n"
 
-            unit = matched_unit(berth)
-            from services.rzd_seatmap import SeatMapService, SEATMAP_BERTHS, format_seatmap_detail
-            if berth in SEATMAP_BERTHS:
+            if match.detail is not None:
                 # точный список купе через схему вагонов (с номерами)
-                detail = SeatMapService().detail_for_berth(
-                    berth,
-                    subscription.origin_code, subscription.destination_code,
-                    train.get('LocalDepartureDateTime'),
-                    train.get('TrainNumber') or train.get('DisplayTrainNumber') or '',
-                    train.get('Provider', 'P1'),
-                    car_types=car_types or None, max_price=max_price,
-                    min_count=subscription.min_seats,
-                ) or []
-                message += f"   ✅ Доступно ({unit}): {len(detail)}\n"
-                if detail:
-                    message += f"   🚪 {format_seatmap_detail(berth, detail)}\n"
+                message += f"   ✅ Доступно ({unit}): {match.count}\n"
+                if match.detail:
+                    message += f"   🚪 {format_seatmap_detail(berth, match.detail)}\n"
             else:
-                m = self.rzd_api.match_seats(
-                    train, car_types=car_types or None, berth=berth, max_price=max_price
-                )
+                m = match.seats
                 seats_line = f"   ✅ Доступно ({unit}): {m['total']}"
                 if m['lower'] or m['upper']:
                     seats_line += f" (низ {m['lower']} / верх {m['upper']})"
                 message += seats_line + "\n"
                 if m['min_price']:
                     message += f"   💰 от {m['min_price']:.0f} ₽\n"
+            if match.appeared:
+                message += f"   🆕 Освободилось мест: {count_places(match.appeared)}\n"
             message += "\n"
 
         return message
@@ -1,11 +1,14 @@
 """
 Сервис уведомлений
 """
+import asyncio
 import aiohttp
+import json
 import logging
-from typing import Optional
+from typing import Optional, Tuple
 
 from config import config
+from services.rate_limit import TelegramRateLimiter, telegram_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -13,10 +16,12 @@ logger = logging.getLogger(__name__)
 class NotificationService:
     """Сервис отправки уведомлений"""
     
-    def __init__(self):
+    def __init__(self, limiter: TelegramRateLimiter = None):
         self.bot_token = config.BOT_TOKEN
         self.api_url = f"https://api.telegram.org/bot{self.bot_token}"
         self._session: Optional[aiohttp.ClientSession] = None
+        # общий на процесс лимит отправки (см. services.rate_limit)
+        self.limiter = limiter or telegram_limiter
 
     async def _get_session(self) -> aiohttp.ClientSession:
         """Лениво создаёт и переиспользует одну ClientSession на весь срок жизни сервиса"""
@@ -29,11 +34,52 @@ class NotificationService:
         if self._session and not self._session.closed:
             await self._session.close()
 
+    @staticmethod
+    def _retry_after(response_text: str) -> float:
+        """parameters.retry_after из ответа 429 (по умолчанию 1 с)"""
+        try:
+            return float(json.loads(response_text).get("parameters", {}).get("retry_after", 1))
+        except (ValueError, TypeError, AttributeError):
+            return 1.0
+
+    async def _post(self, method: str, data: dict, chat_id: Optional[int] = None,
+                    throttle: bool = True, as_json: bool = True,
+                    chat_limit: bool = True) -> Tuple[int, object]:
+        """POST к Bot API в пределах лимита отправки; на 429 ждёт retry_after и повторяет.
+
+        chat_id — чат запроса, chat_limit=False — без лимита чата (только общий),
+        throttle=False — запрос без лимита (ответ на callback). Возвращает (статус,
+        JSON ответа при 200, иначе текст ответа).
+        """
+        session = await self._get_session()
+        attempt = 0
+        while True:
+            if throttle:
+                await self.limiter.acquire(chat_id if chat_limit else None)
+            body = {"json": data} if as_json else {"data": data}
+            async with session.post(f"{self.api_url}/{method}", **body) as response:
+                if response.status == 200:
+                    return 200, await response.json()
+                response_text = await response.text()
+                status = response.status
+            if status != 429 or attempt >= config.TELEGRAM_MAX_RETRIES:
+                return status, response_text
+            retry_after = self._retry_after(response_text)
+            if retry_after > config.TELEGRAM_MAX_RETRY_AFTER:
+                return status, response_text
+            attempt += 1
+            if throttle:
+                # общий лимит (429 без чата или в нескольких чатах подряд) ставит на паузу всю отправку
+                scope = "всех чатов" if self.limiter.pause(retry_after, chat_id) else f"чата {chat_id}"
+            else:
+                scope = f"чата {chat_id}"
+                await asyncio.sleep(retry_after)
+            logger.warning(f"{method}: 429, пауза для {scope}, повтор {attempt} через {retry_after:g} с")
+
     async def send_message(self, user_id: int, text: str, keyboard: Optional[list] = None,
                            parse_mode: str = "HTML") -> Optional[int]:
         """Отправка сообщения пользователю. Возвращает message_id или None"""
         try:
-            session = await self._get_session()
             data = {
                 "chat_id": user_id,
                 "text": text,
@@ -42,15 +88,12 @@ class NotificationService:
             if keyboard:
                 data["reply_markup"] = {"inline_keyboard": keyboard}
 
-            async with session.post(f"{self.api_url}/sendMessage", json=data) as response:
-                if response.status == 200:
-                    logger.info(f"Сообщение отправлено пользователю {user_id}")
-                    payload = await response.json()
-                    return payload.get("result", {}).get("message_id")
-                else:
-                    response_text = await response.text()
-                    logger.error(f"Ошибка отправки сообщения: {response.status} - {response_text}")
-                    return None
+            status, payload = await self._post("sendMessage", data, chat_id=user_id)
+            if status == 200:
+                logger.info(f"Сообщение отправлено пользователю {user_id}")
+                return payload.get("result", {}).get("message_id")
+            logger.error(f"Ошибка отправки сообщения: {status} - {payload}")
+            return None
 
         except Exception as e:
             logger.error(f"Ошибка при отправке сообщения: {e}")
@@ -65,7 +108,6 @@ class NotificationService:
                           keyboard: Optional[list] = None, parse_mode: str = "HTML") -> bool:
         """Редактирование сообщения"""
         try:
-            session = await self._get_session()
             data = {
                 "chat_id": chat_id,
                 "message_id": message_id,
@@ -76,14 +118,12 @@ class NotificationService:
             if keyboard:
                 data["reply_markup"] = {"inline_keyboard": keyboard}
 
-            async with session.post(f"{self.api_url}/editMessageText", json=data) as response:
-                if response.status == 200:
-                    logger.info(f"Сообщение отредактировано")
-                    return True
-                else:
-                    response_text = await response.text()
-                    logger.error(f"Ошибка редактирования сообщения: {response.status} - {response_text}")
-                    return False
+            status, payload = await self._post("editMessageText", data, chat_id=chat_id)
+            if status == 200:
+                logger.info(f"Сообщение отредактировано")
+                return True
+            logger.error(f"Ошибка редактирования сообщения: {status} - {payload}")
+            return False
 
         except Exception as e:
             logger.error(f"Ошибка при редактировании сообщения: {e}")
@@ -92,7 +132,6 @@ class NotificationService:
     async def answer_callback_query(self, callback_query_id: str, text: str = "") -> bool:
         """Ответ на callback query"""
         try:
-            session = await self._get_session()
             data = {
                 "callback_query_id": callback_query_id
             }
@@ -100,13 +139,11 @@ class NotificationService:
             if text:
                 data["text"] = text
 
-            async with session.post(f"{self.api_url}/answerCallbackQuery", data=data) as response:
-                if response.status == 200:
-                    return True
-                else:
-                    response_text = await response.text()
-                    logger.error(f"Ошибка ответа на callback: {response.status} - {response_text}")
-                    return False
+            status, payload = await self._post("answerCallbackQuery", data, throttle=False, as_json=False)
+            if status == 200:
+                return True
+            logger.error(f"Ошибка ответа на callback: {status} - {payload}")
+            return False
 
         except Exception as e:
             logger.error(f"Ошибка при ответе на callback: {e}")
@@ -115,19 +152,18 @@ class NotificationService:
     async def delete_message(self, chat_id: int, message_id: int) -> bool:
         """Удаление сообщения"""
         try:
-            session = await self._get_session()
             data = {
                 "chat_id": chat_id,
                 "message_id": message_id
             }
-            async with session.post(f"{self.api_url}/deleteMessage", data=data) as response:
-                if response.status == 200:
-                    logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
-                    return True
-                else:
-                    response_text = await response.text()
-                    logger.error(f"Ошибка удаления сообщения: {response.status} - {response_text}")
-                    return False
+            # только общий лимит: хендлеры удаляют несколько сообщений подряд
+            status, payload = await self._post("deleteMessage", data, chat_id=chat_id,
+                                               as_json=False, chat_limit=False)
+            if status == 200:
+                logger.info(f"Сообщение {message_id} удалено в чате {chat_id}")
+                return True
+            logger.error(f"Ошибка удаления сообщения: {status} - {payload}")
+            return False
         except Exception as e:
             logger.error(f"Ошибка при удалении сообщения: {e}")
             return False
@@ -0,0 +1,171 @@
+"""
+Ограничение частоты запросов к Telegram Bot API
+
+Telegram принимает около 30 сообщений в секунду на бота и около одного в секунду в
+один чат; сверх этого отвечает 429 с parameters.retry_after. Когда у популярного
+поезда освобождаются места, мониторинг рассылает сотни уведомлений разом — без
+ограничения большая часть получала 429 и терялась. TelegramRateLimiter — два уровня
+token bucket (общий и по чату); отправители ждут своей очереди в acquire(), а 429
+приостанавливает чат на retry_after (pause). Telegram не сообщает, какой лимит
+превышен: если 429 за короткое время получают разные чаты (или запрос без чата),
+превышен общий лимит, и на паузу встаёт вся отправка. Один ограничитель на процесс
+(telegram_limiter) общий для всех NotificationService.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from config import config
+
+# погрешность float при пополнении корзины (иначе «почти целый» токен ждал бы бесконечно малое время)
+_EPSILON = 1e-9
+# 429 в разные чаты в пределах стольких секунд — признак превышения общего лимита
+_FLOOD_WINDOW = 1.0
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше capacity; запрос берёт один токен"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Через сколько секунд можно взять токен (0 — сейчас)"""
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        need = 0.0 if self.tokens >= 1 - _EPSILON else (1 - self.tokens) / self.rate
+        wait = max(need, self.paused_until - now)
+        return wait if wait > _EPSILON else 0.0
+
+    def take(self):
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        """Корзина полна и не на паузе — её можно забыть"""
+        return now >= self.paused_until and self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class TelegramRateLimiter:
+    """Общий (global_rate/с) и початовый (chat_rate/с, до chat_burst подряд) лимиты.
+
+    Ожидающие общего лимита обслуживаются по очереди (FIFO), ожидание лимита чата
+    не задерживает отправку в другие чаты.
+    """
+
+    def __init__(self, global_rate: float = None, chat_rate: float = None, chat_burst: float = None,
+                 clock: Callable[[], float] = time.monotonic, sleep=asyncio.sleep,
+                 max_chats: int = 10000):
+        global_rate = global_rate or config.TELEGRAM_GLOBAL_RATE
+        self.chat_rate = chat_rate or config.TELEGRAM_CHAT_RATE
+        self.chat_burst = chat_burst or config.TELEGRAM_CHAT_BURST
+        self.max_chats = max_chats
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(global_rate, global_rate, clock())
+        self._chats: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop = None
+        # метрики: сколько ждут сейчас (глубина очереди), пропущено запросов, ожидания
+        self.waiting = 0
+        self.max_waiting = 0
+        self.acquired = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pauses = 0
+        self.global_pauses = 0
+        # (чат, время) последнего 429 с лимитом чата
+        self._last_flood: Optional[tuple] = None
+
+    def _chat(self, chat_id: Hashable, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+            if len(self._chats) > self.max_chats:
+                for key in [k for k, b in self._chats.items() if b.idle(now) and k != chat_id]:
+                    del self._chats[key]
+        self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: Hashable = None) -> float:
+        """Ждёт разрешения на запрос в чат chat_id (None — только общий лимит); возвращает ожидание, с"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock, self._lock_loop = asyncio.Lock(), loop
+        started = self._clock()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            while True:
+                chat = self._chat(chat_id, self._clock()) if chat_id is not None else None
+                if chat is not None:
+                    delay = chat.wait_time(self._clock())
+                    if delay > 0:
+                        await self._sleep(delay)
+                        continue
+                async with self._lock:
+                    delay = self._global.wait_time(self._clock())
+                    while delay > 0:
+                        await self._sleep(delay)
+                        delay = self._global.wait_time(self._clock())
+                    # за время ожидания в чат мог уйти другой запрос — тогда снова ждём чат
+                    if chat is None or chat.wait_time(self._clock()) <= 0:
+                        self._global.take()
+                        if chat is not None:
+                            chat.take()
+                        break
+        finally:
+            self.waiting -= 1
+        waited = self._clock() - started
+        self.acquired += 1
+        if waited > 0:
+            self.delayed += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def pause(self, retry_after: float, chat_id: Hashable = None) -> bool:
+        """Ответ 429: запросы в чат ждут retry_after секунд.
+
+        Без chat_id или если другой чат получил 429 меньше _FLOOD_WINDOW назад —
+        превышен общий лимит, и ждут все запросы. Возвращает True для общей паузы.
+        """
+        now = self._clock()
+        flood = chat_id is None or (
+            self._last_flood is not None and self._last_flood[0] != chat_id
+            and now - self._last_flood[1] <= _FLOOD_WINDOW
+        )
+        if chat_id is not None:
+            self._last_flood = (chat_id, now)
+            bucket = self._chat(chat_id, now)
+            bucket.paused_until = max(bucket.paused_until, now + retry_after)
+        if flood:
+            self._global.paused_until = max(self._global.paused_until, now + retry_after)
+            self.global_pauses += 1
+        self.pauses += 1
+        return flood
+
+    def stats(self) -> Dict[str, float]:
+        """Глубина очереди и время ожидания"""
+        return {
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'acquired': self.acquired,
+            'delayed': self.delayed,
+            'wait_avg': self.wait_total / self.delayed if self.delayed else 0.0,
+            'wait_max': self.wait_max,
+            'pauses': self.pauses,
+            'global_pauses': self.global_pauses,
+        }
+
+
+# общий ограничитель процесса (все NotificationService)
+telegram_limiter = TelegramRateLimiter()
@@ -1,13 +1,21 @@
 """
 Сервис для работы с API РЖД
 """
+import asyncio
 import requests
 import logging
 import json
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from datetime import datetime
 
+import aiohttp
+
 from config import config
+from services.cache import TTLCache
+from services import seat_engine
+from services.http import create_session
+from services.seat_filter import SeatFilter
+from services.train_model import CarGroup, Train, as_train, format_duration, parse_trains, train_info
 
 logger = logging.getLogger(__name__)
 
@@ -25,47 +33,87 @@ class RZDAPIService:
         self.suggest_url = suggest_url or config.RZD_SUGGEST_URL
         self.user_agent = user_agent or config.USER_AGENT
     
+    def _headers(self) -> Dict:
+        """Заголовки запросов к публичному API РЖД"""
+        return {
+            'Accept': 'application/json, text/plain, */*',
+            'Accept-Language': 'ru-RU,ru;q=0.9',
+            'User-Agent': self.user_agent,
+        }
+
+    @staticmethod
+    def _station_params(query: str) -> Dict:
+        """Параметры запроса к suggest-API станций"""
+        return {
+            'Query': query,
+            'TransportType': 'bus,avia,rail,aeroexpress,suburban,boat',
+            'GroupResults': 'true',
+            'RailwaySortPriority': 'true',
+            'SynonymOn': '1',
+            'Language': 'ru'
+        }
+
+    @staticmethod
+    def _train_params(origin_code: str, destination_code: str, departure_date: str,
+                      adult_passengers: int, children_passengers: int) -> Dict:
+        """Параметры запроса к train-pricing"""
+        return {
+            "service_provider": "B2B_RZD",
+            "getByLocalTime": "true",
+            "carGrouping": "DontGroup",
+            "destination": destination_code,
+            "origin": origin_code,
+            "departureDate": departure_date,
+            "specialPlacesDemand": "StandardPlacesAndForDisabledPersons",
+            "carIssuingType": "Passenger",
+            "getTrainsFromSchedule": "true",
+            "adultPassengersQuantity": adult_passengers,
+            "childrenPassengersQuantity": children_passengers,
+            "hasPlacesForLargeFamily": "false"
+        }
+
+    @staticmethod
+    def _parse_stations(data: Dict, query: str) -> List[Dict]:
+        """Станции из ответа suggest-API (поезда, города, аэропорты)"""
+        # Обрабатываем разные типы результатов
+        stations = []
+
+        # Добавляем станции из разных категорий
+        if data.get('train'):
+            stations.extend(data['train'])
+        if data.get('city'):
+            stations.extend(data['city'])
+        if data.get('avia'):
+            stations.extend(data['avia'])
+
+        logger.info(f"Найдено {len(stations)} станций для запроса '{query}'")
+        return stations[:config.MAX_STATIONS_PER_SEARCH]
+
+    @staticmethod
+    def _parse_trains(data: Dict, origin_code: str, destination_code: str,
+                      typed: bool = False) -> Dict:
+        """{'trains', 'total_count'} из ответа train-pricing (typed — поезда как Train)"""
+        trains = data.get('Trains', [])
+        logger.info(f"Найдено {len(trains)} поездов для маршрута {origin_code} -> {destination_code}")
+
+        trains = trains[:config.MAX_TRAINS_PER_RESULT]
+        return {
+            'trains': parse_trains(trains) if typed else trains,
+            'total_count': len(data.get('Trains', []))
+        }
+
     def search_stations(self, query: str) -> List[Dict]:
         """Поиск станций по запросу"""
         try:
-            headers = {
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'User-Agent': self.user_agent,
-            }
-            
-            params = {
-                'Query': query,
-                'TransportType': 'bus,avia,rail,aeroexpress,suburban,boat',
-                'GroupResults': 'true',
-                'RailwaySortPriority': 'true',
-                'SynonymOn': '1',
-                'Language': 'ru'
-            }
-            
             response = requests.get(
                 self.suggest_url, 
-                params=params, 
-                headers=headers, 
+                params=self._station_params(query), 
+                headers=self._headers(), 
                 timeout=30
             )
             response.raise_for_status()
             
-            data = response.json()
-            
-            # Обрабатываем разные типы результатов
-            stations = []
-            
-            # Добавляем станции из разных категорий
-            if data.get('train'):
-                stations.extend(data['train'])
-            if data.get('city'):
-                stations.extend(data['city'])
-            if data.get('avia'):
-                stations.extend(data['avia'])
-            
-            logger.info(f"Найдено {len(stations)} станций для запроса '{query}'")
-            return stations[:config.MAX_STATIONS_PER_SEARCH]
+            return self._parse_stations(response.json(), query)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка запроса к API станций: {e}")
@@ -79,47 +127,21 @@ class RZDAPIService:
     
     def search_trains(self, origin_code: str, destination_code: str, 
                      departure_date: str, adult_passengers: int = 1, 
-                     children_passengers: int = 0) -> Dict:
-        """Поиск поездов"""
+                     children_passengers: int = 0, typed: bool = False) -> Dict:
+        """Поиск поездов (typed=True — поезда как services.train_model.Train)"""
         try:
-            params = {
-                "service_provider": "B2B_RZD",
-                "getByLocalTime": "true",
-                "carGrouping": "DontGroup",
-                "destination": destination_code,
-                "origin": origin_code,
-                "departureDate": departure_date,
-                "specialPlacesDemand": "StandardPlacesAndForDisabledPersons",
-                "carIssuingType": "Passenger",
-                "getTrainsFromSchedule": "true",
-                "adultPassengersQuantity": adult_passengers,
-                "childrenPassengersQuantity": children_passengers,
-                "hasPlacesForLargeFamily": "false"
-            }
-            
-            headers = {
-                'Accept': 'application/json, text/plain, */*',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'User-Agent': self.user_agent,
-            }
+            params = self._train_params(origin_code, destination_code, departure_date,
+                                        adult_passengers, children_passengers)
             
             response = requests.get(
                 self.api_url, 
                 params=params, 
-                headers=headers, 
+                headers=self._headers(), 
                 timeout=30
             )
             response.raise_for_status()
             
-            data = response.json()
-            
-            trains = data.get('Trains', [])
-            logger.info(f"Найдено {len(trains)} поездов для маршрута {origin_code} -> {destination_code}")
-            
-            return {
-                'trains': trains[:config.MAX_TRAINS_PER_RESULT],
-                'total_count': len(trains)
-            }
+            return self._parse_trains(response.json(), origin_code, destination_code, typed)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Ошибка запроса к API поездов: {e}")
@@ -131,39 +153,18 @@ class RZDAPIService:
             logger.error(f"Неожиданная ошибка при поиске поездов: {e}")
             return {'trains': [], 'total_count': 0}
     
-    @staticmethod
-    def _available_count(car_group: Dict) -> int:
-        """Реальное число доступных мест в группе вагонов.
-
-        У РЖД PlaceQuantity иногда равен 0, хотя места есть (динамическое
-        ценообразование / продажа целыми купе) — настоящее количество лежит в
-        TotalPlaceQuantity. Берём его, а PlaceQuantity — лишь запасной вариант.
-        """
-        tpq = car_group.get('TotalPlaceQuantity')
-        if tpq is None:
-            tpq = car_group.get('PlaceQuantity', 0)
-        return tpq or 0
-
-    def check_available_seats(self, train: Dict, min_seats: int = 1) -> bool:
+    def check_available_seats(self, train: Union[Dict, Train], min_seats: int = 1) -> bool:
         """Проверка наличия свободных мест в поезде"""
         try:
-            for car_group in train.get('CarGroups', []):
-                if (car_group.get('AvailabilityIndication') == 'Available' and
-                    self._available_count(car_group) >= min_seats):
-                    return True
-            return False
+            return any(cg.places >= min_seats for cg in as_train(train).car_groups)
         except Exception as e:
             logger.error(f"Ошибка проверки мест в поезде: {e}")
             return False
 
-    def count_available_seats(self, train: Dict) -> int:
+    def count_available_seats(self, train: Union[Dict, Train]) -> int:
         """Подсчет общего количества свободных мест в поезде"""
         try:
-            total_seats = 0
-            for car_group in train.get('CarGroups', []):
-                if car_group.get('AvailabilityIndication') == 'Available':
-                    total_seats += self._available_count(car_group)
-            return total_seats
+            return as_train(train).available_seats
         except Exception as e:
             logger.error(f"Ошибка подсчета мест в поезде: {e}")
             return 0
@@ -171,60 +172,34 @@ class RZDAPIService:
     @staticmethod
     def format_duration(minutes) -> str:
         """Форматирование длительности в пути (минуты -> 'Xч Yм')"""
-        try:
-            total = int(minutes)
-        except (TypeError, ValueError):
-            return ''
-        if total <= 0:
-            return ''
-        hours, mins = divmod(total, 60)
-        if hours and mins:
-            return f"{hours}ч {mins}м"
-        if hours:
-            return f"{hours}ч"
-        return f"{mins}м"
-
-    def extract_train_info(self, train: Dict) -> Dict:
+        return format_duration(minutes)
+
+    def extract_train_info(self, train: Union[Dict, Train]) -> Dict:
         """Извлекает отображаемые поля поезда из ответа API РЖД.
 
         API возвращает время в полях LocalDepartureDateTime/LocalArrivalDateTime
         и название в TrainName/TrainDescription — а не DepartureTime/RouteName.
+        У Train поля уже разобраны (общий словарь — не изменять).
         """
-        def _time(value) -> str:
-            if not value:
-                return ''
-            try:
-                return datetime.fromisoformat(value).strftime('%H:%M')
-            except (ValueError, TypeError):
-                # Fallback: 'YYYY-MM-DDTHH:MM:SS' -> 'HH:MM'
-                return value[11:16] if isinstance(value, str) and len(value) >= 16 else ''
+        if isinstance(train, Train):
+            return train.info
+        return train_info(train)
 
-        return {
-            'number': train.get('TrainNumber') or train.get('DisplayTrainNumber') or 'N/A',
-            'name': train.get('TrainName') or train.get('TrainDescription') or '',
-            'departure': _time(train.get('LocalDepartureDateTime')),
-            'arrival': _time(train.get('LocalArrivalDateTime')),
-            'duration': self.format_duration(train.get('TripDuration')),
-        }
-
-    def count_seats_breakdown(self, train: Dict) -> Dict:
+    def count_seats_breakdown(self, train: Union[Dict, Train]) -> Dict:
         """Разбивка свободных мест: всего / нижние / верхние и по типам вагонов"""
         result = {'total': 0, 'lower': 0, 'upper': 0, 'types': {}}
         try:
-            for cg in train.get('CarGroups', []):
-                if cg.get('AvailabilityIndication') != 'Available':
-                    continue
-                qty = self._available_count(cg)
-                result['total'] += qty
-                result['lower'] += cg.get('LowerPlaceQuantity', 0) or 0
-                result['upper'] += cg.get('UpperPlaceQuantity', 0) or 0
-                name = cg.get('CarTypeName') or cg.get('CarType') or '?'
-                result['types'][name] = result['types'].get(name, 0) + qty
+            for cg in as_train(train).car_groups:
+                result['total'] += cg.places
+                result['lower'] += cg.lower
+                result['upper'] += cg.upper
+                name = cg.car_type_name or cg.car_type or '?'
+                result['types'][name] = result['types'].get(name, 0) + cg.places
         except Exception as e:
             logger.error(f"Ошибка разбивки мест в поезде: {e}")
         return result
 
-    def match_seats(self, train: Dict, car_types=None, berth: str = 'any',
+    def match_seats(self, train: Union[Dict, Train], car_types=None, berth: str = 'any',
                     max_price: int = 0) -> Dict:
         """Считает места, подходящие под фильтры подписки.
 
@@ -234,66 +209,101 @@ class RZDAPIService:
             'cabin' — полностью свободные купе (EmptyCabinQuantity).
         max_price: потолок цены в рублях (0 = любая), сравнение с MinPrice группы.
         """
-        result = {'total': 0, 'lower': 0, 'upper': 0, 'side': 0, 'min_price': None, 'by_type': {}}
-        wanted = set(car_types) if car_types else None
+        wanted = frozenset(car_types) if car_types else None
+        return self.match_seats_batch(train, [SeatFilter(wanted, berth, max_price)])[0]
+
+    def match_seats_batch(self, train: Union[Dict, Train], filters: List[SeatFilter]) -> List[Dict]:
+        """match_seats сразу для многих фильтров за один проход по группам вагонов.
+
+        Возвращает результаты в порядке filters; одинаковые фильтры (match_key)
+        считаются один раз и получают общий словарь — его нельзя изменять.
+        """
+        results: Dict[tuple, Dict] = {}
+        for f in filters:
+            if f.match_key not in results:
+                results[f.match_key] = {'total': 0, 'lower': 0, 'upper': 0, 'side': 0,
+                                        'min_price': None, 'by_type': {}}
         try:
-            for cg in train.get('CarGroups', []):
-                if cg.get('AvailabilityIndication') != 'Available':
-                    continue
-                # категория может задаваться кодом CarType (купе/плац) ИЛИ классом
-                # обслуживания (для сидячих: «Эконом+», «Бизнес» и т.п.)
-                if wanted is not None and not (
-                    cg.get('CarType') in wanted or cg.get('ServiceClassNameRu') in wanted
-                ):
-                    continue
-                price = cg.get('MinPrice')
-                if max_price and price and price > max_price:
-                    continue
-                main_lower = cg.get('LowerPlaceQuantity', 0) or 0
-                main_upper = cg.get('UpperPlaceQuantity', 0) or 0
-                side = (cg.get('LowerSidePlaceQuantity', 0) or 0) + (cg.get('UpperSidePlaceQuantity', 0) or 0)
-                cabins = cg.get('EmptyCabinQuantity', 0) or 0
-                # Сколько мест в группе подходит под выбранную категорию полки
-                if berth == 'lower':
-                    matched = main_lower
-                elif berth == 'upper':
-                    matched = main_upper
-                elif berth == 'side':
-                    matched = side
-                elif berth == 'cabin':
-                    matched = cabins
-                else:
-                    matched = self._available_count(cg)
-                if matched <= 0:
-                    continue
-                result['total'] += matched
-                result['lower'] += main_lower
-                result['upper'] += main_upper
-                result['side'] += side
-                # для сидячих показываем класс обслуживания (СИД у всех одинаков)
-                if cg.get('CarType') == 'Sedentary':
-                    name = cg.get('ServiceClassNameRu') or cg.get('CarTypeName') or 'СИД'
-                else:
-                    name = cg.get('CarTypeName') or cg.get('CarType') or '?'
-                result['by_type'][name] = result['by_type'].get(name, 0) + matched
-                if price and (result['min_price'] is None or price < result['min_price']):
-                    result['min_price'] = price
+            for cg in as_train(train).car_groups:
+                for (wanted, berth, max_price), result in results.items():
+                    self._accumulate(result, cg, wanted, berth, max_price)
         except Exception as e:
             logger.error(f"Ошибка match_seats: {e}")
-        return result
+        return [results[f.match_key] for f in filters]
 
-    def min_price(self, train: Dict) -> Optional[float]:
+    def match_route_batch(self, trains: List[Union[Dict, Train]],
+                          filters: List[SeatFilter]) -> List[List[Dict]]:
+        """match_seats_batch для всех поездов маршрута: [поезд][фильтр].
+
+        При большом числе фильтров и установленном NumPy считается векторно
+        (services.seat_engine), иначе — по поезду.
+        """
+        if seat_engine.should_vectorize(filters):
+            try:
+                return seat_engine.match_route([as_train(t) for t in trains], filters)
+            except Exception as e:
+                logger.error(f"Ошибка векторного match_seats, считаю по поездам: {e}")
+        return [self.match_seats_batch(train, filters) for train in trains]
+
+    @staticmethod
+    def _accumulate(result: Dict, cg: CarGroup, wanted, berth: str, max_price: int):
+        """Добавляет группу вагонов к результату match_seats, если она подходит под фильтр"""
+        # категория может задаваться кодом CarType (купе/плац) ИЛИ классом
+        # обслуживания (для сидячих: «Эконом+», «Бизнес» и т.п.)
+        if wanted is not None and not (cg.car_type in wanted or cg.service_class in wanted):
+            return
+        price = cg.min_price
+        if max_price and price and price > max_price:
+            return
+        # Сколько мест в группе подходит под выбранную категорию полки
+        if berth == 'lower':
+            matched = cg.lower
+        elif berth == 'upper':
+            matched = cg.upper
+        elif berth == 'side':
+            matched = cg.side
+        elif berth == 'cabin':
+            matched = cg.empty_cabins
+        else:
+            matched = cg.places
+        if matched <= 0:
+            return
+        result['total'] += matched
+        result['lower'] += cg.lower
+        result['upper'] += cg.upper
+        result['side'] += cg.side
+        # для сидячих показываем класс обслуживания (СИД у всех одинаков)
+        name = cg.label
+        result['by_type'][name] = result['by_type'].get(name, 0) + matched
+        if price and (result['min_price'] is None or price < result['min_price']):
+            result['min_price'] = price
+
+    def min_price(self, train: Union[Dict, Train]) -> Optional[float]:
         """Минимальная цена среди доступных вагонов (None, если мест нет)"""
         try:
-            prices = [
-                cg.get('MinPrice') for cg in train.get('CarGroups', [])
-                if cg.get('AvailabilityIndication') == 'Available' and cg.get('MinPrice')
-            ]
-            return min(prices) if prices else None
+            return as_train(train).min_price
         except Exception as e:
             logger.error(f"Ошибка определения цены поезда: {e}")
             return None
 
+    @staticmethod
+    def _node_id_queries(name: str) -> List[str]:
+        """Варианты запроса к suggest по имени станции (без кода и уточнений в скобках)"""
+        import re
+        if not name:
+            return []
+        query = re.sub(r'\s*\(\d+\)\s*$', '', name)      # убрать хвост "(2060001)"
+        query = re.sub(r'\s*\(.*?\)', '', query).strip()  # убрать "(Московский вокзал)"
+        return [q for q in (query, query.split()[0] if query else '') if q]
+
+    @staticmethod
+    def _match_node_id(stations: List[Dict], code: str) -> str:
+        """nodeId станции с нужным expressCode из ответа suggest или ''"""
+        for st in stations:
+            if str(st.get('expressCode')) == str(code):
+                return st.get('nodeId') or st.get('cityId') or ''
+        return ''
+
     def resolve_node_id(self, code: str, name: str = '') -> str:
         """Находит nodeId станции (для ссылки на поиск РЖД) по коду и имени.
 
@@ -301,21 +311,24 @@ class RZDAPIService:
         не ищет по числовому коду, поэтому запрашиваем по очищенному имени и
         сопоставляем по expressCode. Возвращает nodeId или '' если не нашли.
         """
-        import re
-        if not name:
-            return ''
-        query = re.sub(r'\s*\(\d+\)\s*$', '', name)      # убрать хвост "(2060001)"
-        query = re.sub(r'\s*\(.*?\)', '', query).strip()  # убрать "(Московский вокзал)"
-        candidates = [q for q in (query, query.split()[0] if query else '') if q]
         try:
-            for q in candidates:
-                for st in self.search_stations(q):
-                    if str(st.get('expressCode')) == str(code):
-                        return st.get('nodeId') or st.get('cityId') or ''
+            for q in self._node_id_queries(name):
+                node_id = self._match_node_id(self.search_stations(q), code)
+                if node_id:
+                    return node_id
         except Exception as e:
             logger.error(f"Ошибка резолва nodeId для {code}: {e}")
         return ''
 
+    @classmethod
+    def _purchase_url(cls, origin: str, dest: str, departure_date: str, adult: int) -> str:
+        """Ссылка на страницу поиска РЖД по nodeId (или коду) станций"""
+        try:
+            date_part = datetime.fromisoformat(departure_date).strftime('%Y-%m-%d')
+        except (ValueError, TypeError):
+            date_part = (departure_date or '')[:10]
+        return f"{cls.PURCHASE_BASE_URL}/{origin}/{dest}/{date_part}?adult={max(1, adult)}"
+
     def build_purchase_url(self, origin_code: str, destination_code: str,
                            departure_date: str, origin_name: str = '',
                            destination_name: str = '', adult: int = 1) -> str:
@@ -324,13 +337,9 @@ class RZDAPIService:
         Сайт ждёт nodeId станций и дату 'YYYY-MM-DD'. nodeId резолвим по имени;
         если не удалось — откатываемся на экспресс-код (хуже, но не пусто).
         """
-        try:
-            date_part = datetime.fromisoformat(departure_date).strftime('%Y-%m-%d')
-        except (ValueError, TypeError):
-            date_part = (departure_date or '')[:10]
         origin = self.resolve_node_id(origin_code, origin_name) or origin_code
         dest = self.resolve_node_id(destination_code, destination_name) or destination_code
-        return f"{self.PURCHASE_BASE_URL}/{origin}/{dest}/{date_part}?adult={max(1, adult)}"
+        return self._purchase_url(origin, dest, departure_date, adult)
 
     def format_station_name(self, station: Dict) -> str:
         """Форматирование названия станции для отображения"""
@@ -364,3 +373,132 @@ class RZDAPIService:
         except Exception as e:
             logger.error(f"Ошибка создания callback_data: {e}")
             return f"station_{station.get('expressCode', '')}"
+
+
+class _CachedTrains:
+    """Ответ search_trains в кэше: словари поездов и вид с Train, построенный при первом запросе"""
+
+    __slots__ = ('data', '_typed')
+
+    def __init__(self, data: Dict):
+        self.data = data
+        self._typed: Optional[Dict] = None
+
+    def view(self, typed: bool) -> Dict:
+        if not typed:
+            return self.data
+        if self._typed is None:
+            self._typed = {'trains': parse_trains(self.data['trains']),
+                           'total_count': self.data['total_count']}
+        return self._typed
+
+
+class AsyncRZDAPIService(RZDAPIService):
+    """Асинхронный клиент API РЖД на общем пуле соединений aiohttp.
+
+    Сетевые методы (search_stations, search_trains, resolve_node_id,
+    build_purchase_url) — корутины; разбор ответов и подсчёт мест наследуются от
+    RZDAPIService без изменений. Один экземпляр создаётся при старте бота и
+    передаётся хендлерам и мониторингу, чтобы все запросы шли через одну сессию.
+
+    Ответы search_trains кэшируются на TRAINS_CACHE_TTL секунд (trains_cache):
+    повторный показ списка, панель фильтров и проверка подписок на том же
+    маршруте не ходят в РЖД повторно, а параллельные запросы одного маршрута
+    объединяются в один.
+    """
+
+    def __init__(self, api_url: str = None, suggest_url: str = None, user_agent: str = None,
+                 trains_cache: TTLCache = None):
+        super().__init__(api_url=api_url, suggest_url=suggest_url, user_agent=user_agent)
+        self._session: Optional[aiohttp.ClientSession] = None
+        if trains_cache is None:
+            trains_cache = TTLCache(ttl=config.TRAINS_CACHE_TTL, maxsize=config.TRAINS_CACHE_SIZE)
+        self.trains_cache = trains_cache
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Лениво создаёт и переиспользует одну ClientSession на весь срок жизни сервиса"""
+        if self._session is None or self._session.closed:
+            self._session = create_session(headers=self._headers())
+        return self._session
+
+    async def close(self):
+        """Закрытие сессии (при остановке бота)"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def _get_json(self, url: str, params: Dict) -> Dict:
+        """GET с разбором JSON; ошибки HTTP/сети пробрасываются вызывающему"""
+        session = await self._get_session()
+        async with session.get(url, params=params) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def search_stations(self, query: str) -> List[Dict]:
+        """Поиск станций по запросу"""
+        try:
+            data = await self._get_json(self.suggest_url, self._station_params(query))
+            return self._parse_stations(data, query)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка запроса к API станций: {e}")
+            return []
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка парсинга JSON ответа: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при поиске станций: {e}")
+            return []
+
+    async def _fetch_trains(self, origin_code: str, destination_code: str,
+                            departure_date: str, adult_passengers: int,
+                            children_passengers: int) -> _CachedTrains:
+        """Запрос к train-pricing без кэша; ошибки пробрасываются"""
+        params = self._train_params(origin_code, destination_code, departure_date,
+                                    adult_passengers, children_passengers)
+        data = await self._get_json(self.api_url, params)
+        return _CachedTrains(self._parse_trains(data, origin_code, destination_code))
+
+    async def search_trains(self, origin_code: str, destination_code: str,
+                            departure_date: str, adult_passengers: int = 1,
+                            children_passengers: int = 0, typed: bool = False) -> Dict:
+        """Поиск поездов (через кэш; результат общий для всех вызывающих — не изменять).
+
+        typed=True — поезда как Train (поля уже разобраны). Ключ кэша от typed не
+        зависит: мониторинг (typed) и хендлеры (словари) делят один запрос к РЖД, а
+        Train строятся из закэшированного ответа один раз.
+        """
+        key = (origin_code, destination_code, departure_date, adult_passengers, children_passengers)
+        try:
+            # ошибки не кэшируются: следующий вызов снова пойдёт в РЖД
+            cached = await self.trains_cache.get_or_load(key, lambda: self._fetch_trains(*key))
+            return cached.view(typed)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Ошибка запроса к API поездов: {e}")
+            return {'trains': [], 'total_count': 0}
+        except json.JSONDecodeError as e:
+            logger.error(f"Ошибка парсинга JSON ответа: {e}")
+            return {'trains': [], 'total_count': 0}
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при поиске поездов: {e}")
+            return {'trains': [], 'total_count': 0}
+
+    async def resolve_node_id(self, code: str, name: str = '') -> str:
+        """Находит nodeId станции по коду и имени (см. RZDAPIService.resolve_node_id)"""
+        try:
+            for q in self._node_id_queries(name):
+                node_id = self._match_node_id(await self.search_stations(q), code)
+                if node_id:
+                    return node_id
+        except Exception as e:
+            logger.error(f"Ошибка резолва nodeId для {code}: {e}")
+        return ''
+
+    async def build_purchase_url(self, origin_code: str, destination_code: str,
+                                 departure_date: str, origin_name: str = '',
+                                 destination_name: str = '', adult: int = 1) -> str:
+        """Формирует ссылку на страницу поиска РЖД (см. RZDAPIService.build_purchase_url)"""
+        origin, dest = await asyncio.gather(
+            self.resolve_node_id(origin_code, origin_name),
+            self.resolve_node_id(destination_code, destination_name),
+        )
+        return self._purchase_url(origin or origin_code, dest or destination_code,
+                                  departure_date, adult)
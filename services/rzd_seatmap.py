@@ -13,10 +13,15 @@
 """
 import logging
 from collections import defaultdict
+from typing import Optional
 
+import aiohttp
 import requests
 
 from config import config
+from services.cache import TTLCache
+from services.http import create_session
+from services.train_model import as_train
 
 logger = logging.getLogger(__name__)
 
@@ -50,48 +55,114 @@ def _berth_kind(car: dict) -> str:
     return "other"
 
 
-def _car_allowed(car: dict, car_types) -> bool:
-    """Подходит ли вагон под выбранные категории (CarType или класс обслуживания)."""
-    if not car_types:
-        return True
-    return car.get("CarType") in car_types or car.get("ServiceClassNameRu") in car_types
+def _places(mask: int) -> list:
+    """Номера мест из битовой маски (бит p — место p), по возрастанию."""
+    places, p = [], 0
+    while mask:
+        if mask & 1:
+            places.append(p)
+        mask >>= 1
+        p += 1
+    return places
+
+
+class SeatMapIndex:
+    """Разобранная один раз схема вагонов CarPricing.
+
+    cars: вагон -> купе -> [(строка, низ, верх, бок, все)] — битовые маски мест по
+    строкам вагона (бит p — место p); rows: (CarType, класс, MinPrice) строки. Цена
+    и категория заданы на строку, поэтому маски купе хранятся по строкам и при
+    запросе объединяются только по подходящим. Фильтры cabin/pair/together с любыми
+    car_types/max_price считаются по индексу без повторного разбора Places.
+    """
+
+    __slots__ = ("cars", "rows")
 
+    def __init__(self):
+        self.cars = {}
+        self.rows = []
 
-def parse_compartments(payload: dict, car_types=None, max_price: int = 0,
+    @classmethod
+    def from_payload(cls, payload: dict) -> "SeatMapIndex":
+        index = cls()
+        try:
+            for car in payload.get("Cars") or []:
+                row = len(index.rows)
+                index.rows.append((car.get("CarType"), car.get("ServiceClassNameRu"),
+                                   car.get("MinPrice") or 0))
+                kind = _berth_kind(car)
+                comps = index.cars.setdefault(car.get("CarNumber"), {})
+                for blk in car.get("FreePlacesByCompartments") or []:
+                    mask = 0
+                    for p in str(blk.get("Places", "")).split(","):
+                        p = p.strip()
+                        if p.isdigit():
+                            mask |= 1 << int(p)
+                    if not mask:
+                        continue
+                    comps.setdefault(blk.get("CompartmentNumber"), []).append((
+                        row,
+                        mask if kind == "lower" else 0,
+                        mask if kind == "upper" else 0,
+                        mask if kind in ("side_lower", "side_upper") else 0,
+                        mask,
+                    ))
+        except Exception as e:
+            logger.error(f"Ошибка разбора схемы вагонов: {e}")
+        return index
+
+    def _allowed_rows(self, car_types, max_price: int, include_types) -> list:
+        wanted = set(car_types) if car_types else None
+        allowed = []
+        for car_type, service_class, price in self.rows:
+            allowed.append(
+                car_type in include_types
+                and (not wanted or car_type in wanted or service_class in wanted)
+                and not (max_price and price > max_price)
+            )
+        return allowed
+
+    def select(self, car_types=None, max_price: int = 0,
+               include_types=("Compartment", "ReservedSeat")) -> dict:
+        """вагон -> купе -> (низ, верх, бок, все) — маски мест подходящих строк."""
+        allowed = self._allowed_rows(car_types, max_price, include_types)
+        result = {}
+        for number, comps in self.cars.items():
+            for comp, segments in comps.items():
+                lower = upper = side = every = 0
+                for row, low, up, sd, allm in segments:
+                    if allowed[row]:
+                        lower |= low
+                        upper |= up
+                        side |= sd
+                        every |= allm
+                if every:
+                    result.setdefault(number, {})[comp] = (lower, upper, side, every)
+        return result
+
+
+def _as_index(payload) -> SeatMapIndex:
+    return payload if isinstance(payload, SeatMapIndex) else SeatMapIndex.from_payload(payload)
+
+
+def parse_compartments(payload, car_types=None, max_price: int = 0,
                        include_types=("Compartment", "ReservedSeat")) -> dict:
     """car_number -> compartment_number -> {'lower': set, 'upper': set, 'all': set}.
 
     Объединяет строки одного вагона и классифицирует места по типу полки. Боковые
     места НЕ попадают в lower/upper (они не образуют купе «низ+верх»). include_types
     ограничивает типы вагонов; car_types — выбранные категории (CarType/класс);
-    max_price (>0) отсекает вагоны дороже лимита (по MinPrice вагона)."""
-    wanted = set(car_types) if car_types else None
-    cars = defaultdict(lambda: defaultdict(lambda: {"lower": set(), "upper": set(), "all": set()}))
-    try:
-        for car in payload.get("Cars") or []:
-            if car.get("CarType") not in include_types:
-                continue
-            if not _car_allowed(car, wanted):
-                continue
-            if max_price and (car.get("MinPrice") or 0) > max_price:
-                continue
-            number = car.get("CarNumber")
-            kind = _berth_kind(car)
-            for blk in car.get("FreePlacesByCompartments") or []:
-                comp = blk.get("CompartmentNumber")
-                for p in str(blk.get("Places", "")).split(","):
-                    p = p.strip()
-                    if not p.isdigit():
-                        continue
-                    p = int(p)
-                    cell = cars[number][comp]
-                    cell["all"].add(p)
-                    # боковые (side_*) в пару «в одном купе» не идут
-                    if kind in ("lower", "upper"):
-                        cell[kind].add(p)
-    except Exception as e:
-        logger.error(f"Ошибка разбора схемы вагонов: {e}")
-    return cars
+    max_price (>0) отсекает вагоны дороже лимита (по MinPrice вагона).
+    payload — ответ CarPricing или уже построенный SeatMapIndex."""
+    selected = _as_index(payload).select(car_types=car_types, max_price=max_price,
+                                         include_types=include_types)
+    return {
+        number: {
+            comp: {"lower": set(_places(low)), "upper": set(_places(up)), "all": set(_places(every))}
+            for comp, (low, up, _side, every) in comps.items()
+        }
+        for number, comps in selected.items()
+    }
 
 
 def _sort_key(d):
@@ -100,29 +171,29 @@ def _sort_key(d):
     return (_int(d["car"]), _int(d["compartment"]))
 
 
-def blocks_with_at_least(payload: dict, min_size: int, car_types=None, max_price: int = 0,
+def blocks_with_at_least(payload, min_size: int, car_types=None, max_price: int = 0,
                          include_types=("Compartment",)) -> list:
     """Блоки (вагон+CompartmentNumber), где свободно >= min_size мест:
     [{'car','compartment','places':[...]}], отсортировано."""
     result = []
-    comps_by_car = parse_compartments(payload, car_types=car_types, max_price=max_price,
-                                      include_types=include_types)
-    for number, comps in comps_by_car.items():
-        for comp, cell in comps.items():
-            if len(cell["all"]) >= min_size:
-                result.append({"car": number, "compartment": comp, "places": sorted(cell["all"])})
+    selected = _as_index(payload).select(car_types=car_types, max_price=max_price,
+                                         include_types=include_types)
+    for number, comps in selected.items():
+        for comp, (_low, _up, _side, every) in comps.items():
+            if every.bit_count() >= min_size:
+                result.append({"car": number, "compartment": comp, "places": _places(every)})
     result.sort(key=_sort_key)
     return result
 
 
-def empty_compartments_detail(payload: dict, car_types=None, max_price: int = 0) -> list:
+def empty_compartments_detail(payload, car_types=None, max_price: int = 0) -> list:
     """Полностью свободные купе: [{'car','compartment','places':[...]}], отсортировано.
     Только купейные вагоны (целиком пустое купе — понятие купе)."""
     return blocks_with_at_least(payload, COMPARTMENT_SIZE, car_types=car_types, max_price=max_price,
                                 include_types=("Compartment",))
 
 
-def together_seats_detail(payload: dict, min_count: int, car_types=None, max_price: int = 0) -> list:
+def together_seats_detail(payload, min_count: int, car_types=None, max_price: int = 0) -> list:
     """Блоки сидячих мест (Sedentary), где свободно >= min_count мест рядом (одна
     физическая группа кресел по CompartmentNumber). Приближение: если внутри блока
     часть мест продана, оставшиеся свободные необязательно физически смежны."""
@@ -130,26 +201,27 @@ def together_seats_detail(payload: dict, min_count: int, car_types=None, max_pri
                                 include_types=("Sedentary",))
 
 
-def pair_compartments_detail(payload: dict, car_types=None, max_price: int = 0) -> list:
+def pair_compartments_detail(payload, car_types=None, max_price: int = 0) -> list:
     """Купе/блоки (купе и плац), где свободны и нижнее, и верхнее ОСНОВНЫЕ места:
     [{'car','compartment','lower':[...],'upper':[...]}], отсортировано."""
     result = []
-    comps_by_car = parse_compartments(payload, car_types=car_types, max_price=max_price)
-    for number, comps in comps_by_car.items():
-        for comp, cell in comps.items():
-            if cell["lower"] and cell["upper"]:
+    selected = _as_index(payload).select(car_types=car_types, max_price=max_price)
+    for number, comps in selected.items():
+        for comp, (low, up, _side, _every) in comps.items():
+            if low and up:
                 result.append({
                     "car": number, "compartment": comp,
-                    "lower": sorted(cell["lower"]), "upper": sorted(cell["upper"]),
+                    "lower": _places(low), "upper": _places(up),
                 })
     result.sort(key=_sort_key)
     return result
 
 
-def detail_for_berth(payload: dict, berth: str, car_types=None, max_price: int = 0,
+def detail_for_berth(payload, berth: str, car_types=None, max_price: int = 0,
                      min_count: int = 1) -> list:
     """Детали под нужный фильтр полки ('cabin' | 'pair' | 'together') с учётом категорий
-    и цены. min_count используется только веткой 'together' (сколько мест нужно рядом)."""
+    и цены. min_count используется только веткой 'together' (сколько мест нужно рядом).
+    payload — ответ CarPricing или SeatMapIndex (для серии запросов к одной схеме)."""
     if berth == "pair":
         return pair_compartments_detail(payload, car_types=car_types, max_price=max_price)
     if berth == "together":
@@ -157,6 +229,45 @@ def detail_for_berth(payload: dict, berth: str, car_types=None, max_price: int =
     return empty_compartments_detail(payload, car_types=car_types, max_price=max_price)
 
 
+def seatmap_may_match(train, berth: str, car_types=None, max_price: int = 0,
+                      min_count: int = 1) -> bool:
+    """Может ли схема вагонов поезда дать совпадение — по агрегатам CarGroups train-pricing.
+
+    False только когда агрегаты это исключают: нет доступных групп нужного типа
+    (Compartment для 'cabin', Compartment/ReservedSeat для 'pair', Sedentary для
+    'together') под категории и цену, мест в них меньше нужного (4 для купе целиком,
+    min_count для 'together') или для 'pair' нет нижних/верхних. Такие поезда не
+    требуют запроса CarPricing. Проверка консервативная: неизвестные поля не отсекают.
+    train — ответ train-pricing (словарь) или Train.
+    """
+    include_types = {"cabin": ("Compartment",), "pair": ("Compartment", "ReservedSeat"),
+                     "together": ("Sedentary",)}.get(berth)
+    if include_types is None:
+        return True
+    wanted = set(car_types) if car_types else None
+    total = lower = upper = 0
+    berths_known = True
+    for cg in as_train(train).car_groups:
+        if cg.car_type not in include_types:
+            continue
+        # у группы может не быть класса обслуживания, а у вагонов схемы — быть
+        if wanted is not None and cg.car_type not in wanted and cg.service_class \
+                and cg.service_class not in wanted:
+            continue
+        # MinPrice группы — минимум по её вагонам: дороже лимита — дороже и каждый вагон
+        if max_price and (cg.min_price or 0) > max_price:
+            continue
+        total += cg.places
+        berths_known = berths_known and cg.berths_known
+        lower += cg.lower
+        upper += cg.upper
+    if berth == "cabin":
+        return total >= COMPARTMENT_SIZE
+    if berth == "pair":
+        return total >= 2 and (not berths_known or (lower > 0 and upper > 0))
+    return total >= max(1, min_count)
+
+
 def count_empty_compartments(payload: dict) -> int:
     """Число полностью свободных купе."""
     return len(empty_compartments_detail(payload))
@@ -208,18 +319,21 @@ class SeatMapService:
     def __init__(self):
         self.user_agent = config.USER_AGENT
 
-    def _fetch(self, origin_code: str, destination_code: str, departure_datetime: str,
-               train_number: str, provider: str = "P1") -> dict:
-        """POST к CarPricing. departure_datetime — ЛОКАЛЬНОЕ время отправления
-        (LocalDepartureDateTime поезда, с часами, а не полночь)."""
-        headers = {
+    def _headers(self) -> dict:
+        """Заголовки запроса к CarPricing"""
+        return {
             "Accept": "application/json, text/plain, */*",
             "Content-Type": "application/json",
             "User-Agent": self.user_agent,
             "Origin": "https://ticket.rzd.ru",
             "Referer": "https://ticket.rzd.ru/",
         }
-        body = {
+
+    @staticmethod
+    def _body(origin_code: str, destination_code: str, departure_datetime: str,
+              train_number: str, provider: str = "P1") -> dict:
+        """Тело запроса к CarPricing"""
+        return {
             "OriginCode": origin_code,
             "DestinationCode": destination_code,
             "Provider": provider or "P1",
@@ -230,7 +344,13 @@ class SeatMapService:
             "HasPlacesForLargeFamily": False,
             "CarIssuingType": "Passenger",
         }
-        resp = requests.post(CAR_PRICING_URL, json=body, headers=headers, timeout=30)
+
+    def _fetch(self, origin_code: str, destination_code: str, departure_datetime: str,
+               train_number: str, provider: str = "P1") -> dict:
+        """POST к CarPricing. departure_datetime — ЛОКАЛЬНОЕ время отправления
+        (LocalDepartureDateTime поезда, с часами, а не полночь)."""
+        body = self._body(origin_code, destination_code, departure_datetime, train_number, provider)
+        resp = requests.post(CAR_PRICING_URL, json=body, headers=self._headers(), timeout=30)
         resp.raise_for_status()
         return resp.json()
 
@@ -267,3 +387,121 @@ class SeatMapService:
                            train_number, provider="P1"):
         return self.count_for_berth('cabin', origin_code, destination_code,
                                     departure_datetime, train_number, provider)
+
+
+class AsyncSeatMapService(SeatMapService):
+    """Асинхронная обёртка над CarPricing на общем пуле соединений aiohttp.
+
+    Один долгоживущий экземпляр создаётся в bot.py и передаётся мониторингу и
+    хендлерам: запросы схемы вагонов переиспользуют keep-alive соединения вместо
+    TLS-рукопожатия на каждый поезд. Разбор схемы — те же функции модуля.
+
+    Ответы CarPricing кэшируются на SEATMAP_CACHE_TTL секунд по ключу
+    (откуда, куда, LocalDepartureDateTime, номер поезда, провайдер): тогглы панели
+    фильтров и подписки на тот же поезд берут схему из кэша. Ошибки и пустые схемы
+    кэшируются на SEATMAP_NEGATIVE_TTL, чтобы не долбить РЖД повторными запросами.
+    Полученная схема разбирается в SeatMapIndex один раз — все фильтры считаются по нему.
+    """
+
+    def __init__(self, payload_cache: TTLCache = None):
+        super().__init__()
+        self._session: Optional[aiohttp.ClientSession] = None
+        if payload_cache is None:
+            payload_cache = TTLCache(
+                ttl=config.SEATMAP_CACHE_TTL, maxsize=config.SEATMAP_CACHE_SIZE,
+                ttl_for=lambda payload: None if payload and payload.get("Cars") else config.SEATMAP_NEGATIVE_TTL,
+            )
+        self.payload_cache = payload_cache
+        # разобранные схемы (SeatMapIndex) по тому же ключу; сбрасываются при загрузке нового payload-а
+        self.index_cache = TTLCache(ttl=config.SEATMAP_CACHE_TTL, maxsize=config.SEATMAP_CACHE_SIZE)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Лениво создаёт и переиспользует одну ClientSession на весь срок жизни сервиса"""
+        if self._session is None or self._session.closed:
+            self._session = create_session(headers=self._headers())
+        return self._session
+
+    async def close(self):
+        """Закрытие сессии (при остановке бота)"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def _fetch(self, origin_code: str, destination_code: str, departure_datetime: str,
+                     train_number: str, provider: str = "P1") -> dict:
+        """POST к CarPricing (см. SeatMapService._fetch)"""
+        session = await self._get_session()
+        body = self._body(origin_code, destination_code, departure_datetime, train_number, provider)
+        async with session.post(CAR_PRICING_URL, json=body) as resp:
+            resp.raise_for_status()
+            return await resp.json(content_type=None)
+
+    @staticmethod
+    def _cache_key(origin_code, destination_code, departure_datetime, train_number, provider):
+        return (origin_code, destination_code, departure_datetime, train_number, provider or "P1")
+
+    async def fetch_payload(self, origin_code: str, destination_code: str, departure_datetime: str,
+                            train_number: str, provider: str = "P1") -> Optional[dict]:
+        """Схема вагонов поезда через кэш; None — РЖД не ответил (ошибка тоже кэшируется)"""
+        key = self._cache_key(origin_code, destination_code, departure_datetime, train_number, provider)
+
+        async def load():
+            try:
+                return await self._fetch(origin_code, destination_code, departure_datetime,
+                                         train_number, provider)
+            except Exception as e:
+                logger.error(f"Схема вагонов недоступна ({train_number}): {e}")
+                return None
+            finally:
+                # индекс прежнего payload-а устарел (ссылку на payload индекс не держит)
+                self.index_cache.invalidate(key)
+
+        return await self.payload_cache.get_or_load(key, load)
+
+    async def fetch_index(self, origin_code: str, destination_code: str, departure_datetime: str,
+                          train_number: str, provider: str = "P1") -> Optional[SeatMapIndex]:
+        """Разобранная схема вагонов (SeatMapIndex); строится один раз на полученный payload.
+
+        Загрузка нового payload-а сбрасывает индекс по тому же ключу, поэтому
+        закэшированный индекс всегда построен из текущего payload-а.
+        """
+        payload = await self.fetch_payload(origin_code, destination_code, departure_datetime,
+                                           train_number, provider)
+        if payload is None:
+            return None
+        key = self._cache_key(origin_code, destination_code, departure_datetime, train_number, provider)
+        index = self.index_cache.get(key)
+        if index is None:
+            index = SeatMapIndex.from_payload(payload)
+            self.index_cache.set(key, index)
+        return index
+
+    async def detail_for_berth(self, berth: str, origin_code: str, destination_code: str,
+                               departure_datetime: str, train_number: str, provider: str = "P1",
+                               car_types=None, max_price: int = 0, min_count: int = 1):
+        """Детали под фильтр полки или None при ошибке (см. SeatMapService.detail_for_berth)"""
+        index = await self.fetch_index(origin_code, destination_code, departure_datetime,
+                                       train_number, provider)
+        if index is None:
+            return None
+        return detail_for_berth(index, berth, car_types=car_types, max_price=max_price,
+                                min_count=min_count)
+
+    async def count_for_berth(self, berth: str, origin_code: str, destination_code: str,
+                              departure_datetime: str, train_number: str, provider: str = "P1",
+                              car_types=None, max_price: int = 0, min_count: int = 1):
+        """Число подходящих купе/групп под фильтр полки или None при сетевой ошибке."""
+        detail = await self.detail_for_berth(
+            berth, origin_code, destination_code, departure_datetime, train_number, provider,
+            car_types=car_types, max_price=max_price, min_count=min_count,
+        )
+        return None if detail is None else len(detail)
+
+    async def empty_compartments_detail(self, origin_code, destination_code, departure_datetime,
+                                        train_number, provider="P1"):
+        return await self.detail_for_berth('cabin', origin_code, destination_code,
+                                           departure_datetime, train_number, provider)
+
+    async def empty_compartments(self, origin_code, destination_code, departure_datetime,
+                                 train_number, provider="P1"):
+        return await self.count_for_berth('cabin', origin_code, destination_code,
+                                          departure_datetime, train_number, provider)
@@ -0,0 +1,70 @@
+"""
+Снимки свободных мест между опросами и их разница (какие места появились/ушли)
+
+Снимок поезда — {вагон: битовая маска мест} (бит p — место p). Для фильтров по
+схеме вагонов (cabin/pair/together) места известны точно; для агрегатных фильтров
+train-pricing знает только количество, поэтому снимок — {'*': маска из count бит},
+и «новые места» там означают прирост количества.
+"""
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# вагон для агрегатного снимка (номера мест неизвестны)
+ANY_CAR = "*"
+
+
+def places_from_detail(detail: list) -> Dict[str, int]:
+    """Снимок по деталям схемы вагонов ('places' или 'lower'+'upper')"""
+    snapshot: Dict[str, int] = {}
+    for d in detail or []:
+        mask = snapshot.get(str(d["car"]), 0)
+        for p in d.get("places") or (d.get("lower", []) + d.get("upper", [])):
+            mask |= 1 << int(p)
+        if mask:
+            snapshot[str(d["car"])] = mask
+    return snapshot
+
+
+def places_from_count(count: int) -> Dict[str, int]:
+    """Снимок агрегатного фильтра: только количество мест"""
+    return {ANY_CAR: (1 << count) - 1} if count > 0 else {}
+
+
+def count_places(places: Dict[str, int]) -> int:
+    return sum(mask.bit_count() for mask in places.values())
+
+
+def diff_places(old: Dict[str, int], new: Dict[str, int]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """(появившиеся, пропавшие) места — снимки только с ненулевыми масками"""
+    appeared, disappeared = {}, {}
+    for car in new.keys() | old.keys():
+        before, after = old.get(car, 0), new.get(car, 0)
+        if after & ~before:
+            appeared[car] = after & ~before
+        if before & ~after:
+            disappeared[car] = before & ~after
+    return appeared, disappeared
+
+
+def encode_snapshot(snapshot: Dict[str, Dict[str, int]]) -> str:
+    """Снимок подписки {поезд: {вагон: маска}} -> компактный JSON (маски в hex)"""
+    return json.dumps(
+        {train: {car: format(mask, "x") for car, mask in places.items()}
+         for train, places in snapshot.items()},
+        ensure_ascii=False, separators=(",", ":"), sort_keys=True,
+    )
+
+
+def decode_snapshot(text: Optional[str]) -> Optional[Dict[str, Dict[str, int]]]:
+    """Обратное к encode_snapshot; None — снимка нет или он повреждён"""
+    if not text:
+        return None
+    try:
+        return {train: {car: int(mask, 16) for car, mask in places.items()}
+                for train, places in json.loads(text).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Повреждённый снимок мест: {e}")
+        return None
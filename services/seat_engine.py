@@ -0,0 +1,132 @@
+"""
+Векторный подсчёт match_seats для многих фильтров маршрута (NumPy, опционально)
+
+Группы вагонов всех поездов маршрута раскладываются в столбцы (категория, класс
+обслуживания, цена, нижние/верхние/боковые/пустые купе/всего), фильтры — в массивы
+(допустимые категории, столбец полки, потолок цены). Подходящие места для всех
+фильтров и групп считаются матричными операциями, суммы по поездам — reduceat.
+Результат совпадает с RZDAPIService.match_route_batch; без NumPy (или при малом
+числе фильтров, где накладные расходы не окупаются) используется обычный путь.
+"""
+from typing import Dict, List
+
+from config import config
+from services.seat_filter import SeatFilter
+from services.train_model import Train
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен
+    np = None
+
+# столбец массива counts для фильтра полки; остальные полки — все места группы
+_BERTH_COLUMN = {'lower': 0, 'upper': 1, 'side': 2, 'cabin': 3}
+_PLACES = 4
+
+
+def available() -> bool:
+    return np is not None
+
+
+def should_vectorize(filters: List[SeatFilter]) -> bool:
+    """Считать ли маршрут векторно (SEAT_ENGINE: auto | numpy | python)"""
+    if np is None or config.SEAT_ENGINE == 'python':
+        return False
+    if config.SEAT_ENGINE == 'numpy':
+        return True
+    return len({f.match_key for f in filters}) >= config.SEAT_ENGINE_MIN_FILTERS
+
+
+class RouteArrays:
+    """Доступные группы вагонов маршрута столбцами (группы одного поезда подряд)"""
+
+    def __init__(self, trains: List[Train]):
+        groups = [(i, cg) for i, train in enumerate(trains) for cg in train.car_groups]
+        self.n_trains = len(trains)
+        # общий словарь кодов CarType и классов обслуживания: фильтр категорий
+        # совпадает с любым из двух полей группы
+        self.vocab: Dict[str, int] = {}
+        # (поезд, название категории в сводке) -> столбец by_type
+        self.labels: Dict[tuple, int] = {}
+        code = lambda value: self.vocab.setdefault(value, len(self.vocab))
+        label = lambda key: self.labels.setdefault(key, len(self.labels))
+        self.train = np.array([i for i, _ in groups], dtype=np.intp)
+        self.car_type = np.array([code(cg.car_type) for _, cg in groups], dtype=np.intp)
+        self.service_class = np.array([code(cg.service_class) for _, cg in groups], dtype=np.intp)
+        self.label = np.array([label((i, cg.label)) for i, cg in groups], dtype=np.intp)
+        self.price = np.array([cg.min_price or 0 for _, cg in groups], dtype=np.float64)
+        self.counts = np.array(
+            [(cg.lower, cg.upper, cg.side, cg.empty_cabins, cg.places) for _, cg in groups],
+            dtype=np.int64,
+        ).reshape(len(groups), 5).T
+        # начала участков поездов, у которых есть группы (для reduceat)
+        self.present, self.starts = np.unique(self.train, return_index=True)
+
+    def per_train(self, values, ufunc, fill):
+        """Свёртка F×G -> F×N по группам каждого поезда; у поездов без групп — fill"""
+        out = np.full((values.shape[0], self.n_trains), fill, dtype=values.dtype)
+        if len(self.starts):
+            out[:, self.present] = ufunc.reduceat(values, self.starts, axis=1)
+        return out
+
+
+def match_route(trains: List[Train], filters: List[SeatFilter]) -> List[List[Dict]]:
+    """Аналог match_route_batch: [поезд][фильтр] -> результат match_seats.
+
+    Одинаковые фильтры (match_key) одного поезда получают общий словарь.
+    """
+    route = RouteArrays(trains)
+    keys = list(dict.fromkeys(f.match_key for f in filters))
+    n_filters, n_groups = len(keys), route.train.size
+
+    allowed = np.ones((n_filters, len(route.vocab)), dtype=bool)
+    for row, (car_types, _, _) in enumerate(keys):
+        if car_types is not None:
+            allowed[row] = False
+            allowed[row, [route.vocab[c] for c in car_types if c in route.vocab]] = True
+    berth = np.array([_BERTH_COLUMN.get(b, _PLACES) for _, b, _ in keys], dtype=np.intp)
+    max_price = np.array([p or 0 for _, _, p in keys], dtype=np.float64)[:, None]
+
+    price = route.price[None, :]
+    ok = allowed[:, route.car_type] | allowed[:, route.service_class]
+    ok &= (max_price == 0) | (price == 0) | (price <= max_price)
+    matched = route.counts[berth]
+    ok &= matched > 0
+    matched = np.where(ok, matched, 0)
+
+    total = route.per_train(matched, np.add, 0)
+    lower, upper, side = (route.per_train(np.where(ok, route.counts[c], 0), np.add, 0) for c in range(3))
+    min_price = route.per_train(np.where(ok & (price > 0), price, np.inf), np.minimum, np.inf)
+    by_label = np.zeros((n_filters, len(route.labels)), dtype=np.int64)
+    # номер первой подходящей группы категории: в by_type категории идут в том же
+    # порядке, что и у match_seats_batch (по первой группе, прошедшей фильтр)
+    first = np.full((n_filters, len(route.labels)), n_groups, dtype=np.intp)
+    if n_groups:
+        np.add.at(by_label, (slice(None), route.label), matched)
+        np.minimum.at(first, (slice(None), route.label), np.where(ok, np.arange(n_groups), n_groups))
+
+    labels_of = [[] for _ in range(route.n_trains)]
+    for (train, name), column in route.labels.items():
+        labels_of[train].append((column, name))
+    # дальше — только сборка словарей: списки Python быстрее поэлементного доступа к массивам
+    total, lower, upper, side = (a.T.tolist() for a in (total, lower, upper, side))
+    min_price = np.where(np.isinf(min_price), np.nan, min_price).T.tolist()
+    by_label, first = by_label.T.tolist(), first.T.tolist()
+
+    results = []
+    for n in range(route.n_trains):
+        columns = [(by_label[column], first[column], name) for column, name in labels_of[n]]
+        by_key = {}
+        for row, key in enumerate(keys):
+            best = min_price[n][row]
+            by_key[key] = {
+                'total': total[n][row],
+                'lower': lower[n][row],
+                'upper': upper[n][row],
+                'side': side[n][row],
+                'min_price': None if best != best else best,  # NaN — подходящих цен нет
+                'by_type': {name: counts[row] for counts, _, name in
+                            sorted((c for c in columns if c[0][row]), key=lambda c: c[1][row])},
+            }
+        results.append([by_key[f.match_key] for f in filters])
+    return results
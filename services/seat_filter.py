@@ -0,0 +1,123 @@
+"""
+Фильтр подписки в виде, удобном для подсчёта мест
+
+Подписка хранит категории и номера поездов CSV-строками; для подсчёта нужны
+множества, полка, ценовой потолок и порог мест. SeatFilter — неизменяемый и
+хешируемый: одинаковые фильтры разных подписок считаются один раз
+(RZDAPIService.match_seats_batch). FilterCompiler разбирает строки фильтра один
+раз и отдаёт готовый SeatFilter всем подпискам с такими же полями.
+"""
+from collections import OrderedDict
+from enum import Enum
+from typing import FrozenSet, NamedTuple, Optional
+
+from config import config
+from services.rzd_seatmap import SEATMAP_BERTHS
+
+
+class Berth(str, Enum):
+    """Фильтр полки подписки (значение — как в БД)"""
+    ANY = 'any'
+    LOWER = 'lower'
+    UPPER = 'upper'
+    SIDE = 'side'
+    CABIN = 'cabin'
+    PAIR = 'pair'
+    TOGETHER = 'together'
+
+    # ведёт себя как обычная строка (как StrEnum из 3.11): сравнение, ключ словаря, f-строки
+    __hash__ = str.__hash__
+    __str__ = str.__str__
+    __format__ = str.__format__
+
+    @classmethod
+    def parse(cls, value: Optional[str]) -> "Berth":
+        """Значение из БД -> Berth (пустое/неизвестное — ANY)"""
+        try:
+            return cls(value or cls.ANY)
+        except ValueError:
+            return cls.ANY
+
+
+def _csv_set(value: Optional[str]) -> Optional[FrozenSet[str]]:
+    """'a,b' -> frozenset({'a', 'b'}); пусто -> None (без ограничения)"""
+    return frozenset(v for v in (value or '').split(',') if v) or None
+
+
+class SeatFilter(NamedTuple):
+    """car_types — коды CarType / классы обслуживания (None — любые),
+    train_numbers — номера поездов подписки (None — любые)"""
+    car_types: Optional[FrozenSet[str]] = None
+    berth: str = Berth.ANY
+    max_price: int = 0
+    min_seats: int = 1
+    train_numbers: Optional[FrozenSet[str]] = None
+
+    @classmethod
+    def from_subscription(cls, subscription) -> "SeatFilter":
+        return cls(
+            car_types=_csv_set(subscription.car_types),
+            berth=Berth.parse(subscription.berth),
+            max_price=subscription.max_price or 0,
+            min_seats=subscription.min_seats or 1,
+            train_numbers=_csv_set(subscription.train_numbers),
+        )
+
+    @property
+    def match_key(self) -> tuple:
+        """Часть фильтра, от которой зависит результат match_seats"""
+        return self.car_types, self.berth, self.max_price
+
+    @property
+    def needs_seatmap(self) -> bool:
+        """Фильтр считается по схеме вагонов (CarPricing), а не по агрегатам"""
+        return self.berth in SEATMAP_BERTHS
+
+    @property
+    def threshold(self) -> int:
+        """Сколько подходящих мест нужно поезду, чтобы о нём уведомлять"""
+        return max(1, self.min_seats)
+
+    def wants_train(self, number: str) -> bool:
+        """Поезд входит в train_numbers подписки (пустой список — любой)"""
+        return self.train_numbers is None or number in self.train_numbers
+
+
+def _signature(subscription) -> tuple:
+    return (subscription.car_types, subscription.berth, subscription.max_price,
+            subscription.min_seats, subscription.train_numbers)
+
+
+class FilterCompiler:
+    """LRU-кэш SeatFilter по полям фильтра подписки (не по её id).
+
+    Изменённая подписка даёт другой ключ, поэтому устаревший фильтр не отдаётся и
+    сбрасывать кэш при изменении, отключении или удалении подписки не нужно;
+    одинаковые фильтры разных подписок — один объект. Не больше maxsize записей.
+    """
+
+    def __init__(self, maxsize: int = None):
+        self.maxsize = max(1, maxsize or config.FILTER_CACHE_SIZE)
+        self._cache: "OrderedDict[tuple, SeatFilter]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def compile(self, subscription) -> SeatFilter:
+        signature = _signature(subscription)
+        compiled = self._cache.get(signature)
+        if compiled is not None:
+            self.hits += 1
+            self._cache.move_to_end(signature)
+            return compiled
+        self.misses += 1
+        compiled = self._cache[signature] = SeatFilter.from_subscription(subscription)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return compiled
+
+
+# общий кэш процесса: мониторинг и обработчики видят одни и те же фильтры
+filter_compiler = FilterCompiler()
@@ -0,0 +1,143 @@
+"""
+Компактная модель поезда из ответа train-pricing
+
+Ответ РЖД — большие словари с десятками полей на поезд и группу вагонов. Train и
+CarGroup хранят только то, что использует бот; отображаемые поля (время, длительность)
+и агрегаты по группам считаются один раз при разборе, а не на каждый показ/проверку.
+Недоступные группы вагонов (AvailabilityIndication != 'Available') отбрасываются.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+
+def format_duration(minutes) -> str:
+    """Форматирование длительности в пути (минуты -> 'Xч Yм')"""
+    try:
+        total = int(minutes)
+    except (TypeError, ValueError):
+        return ''
+    if total <= 0:
+        return ''
+    hours, mins = divmod(total, 60)
+    if hours and mins:
+        return f"{hours}ч {mins}м"
+    if hours:
+        return f"{hours}ч"
+    return f"{mins}м"
+
+
+def format_time(value) -> str:
+    """ISO-время РЖД -> 'HH:MM' ('' если времени нет)"""
+    if not value:
+        return ''
+    try:
+        return datetime.fromisoformat(value).strftime('%H:%M')
+    except (ValueError, TypeError):
+        # Fallback: 'YYYY-MM-DDTHH:MM:SS' -> 'HH:MM'
+        return value[11:16] if isinstance(value, str) and len(value) >= 16 else ''
+
+
+def train_info(train: Dict) -> Dict:
+    """Отображаемые поля поезда: номер, название, время отправления/прибытия, в пути"""
+    return {
+        'number': train.get('TrainNumber') or train.get('DisplayTrainNumber') or 'N/A',
+        'name': train.get('TrainName') or train.get('TrainDescription') or '',
+        'departure': format_time(train.get('LocalDepartureDateTime')),
+        'arrival': format_time(train.get('LocalArrivalDateTime')),
+        'duration': format_duration(train.get('TripDuration')),
+    }
+
+
+class CarGroup:
+    """Доступная группа вагонов: категория, места по типам полок и цены"""
+
+    __slots__ = ('car_type', 'car_type_name', 'service_class', 'places', 'lower', 'upper',
+                 'side', 'empty_cabins', 'berths_known', 'min_price', 'max_price')
+
+    def __init__(self, car_type: str = None, car_type_name: str = None, service_class: str = None,
+                 places: int = 0, lower: int = 0, upper: int = 0, side: int = 0,
+                 empty_cabins: int = 0, berths_known: bool = True,
+                 min_price: Optional[float] = None, max_price: Optional[float] = None):
+        self.car_type = car_type
+        self.car_type_name = car_type_name
+        self.service_class = service_class
+        self.places = places
+        self.lower = lower
+        self.upper = upper
+        self.side = side
+        self.empty_cabins = empty_cabins
+        # есть ли у группы разбивка на нижние/верхние (иначе lower/upper неизвестны)
+        self.berths_known = berths_known
+        self.min_price = min_price
+        self.max_price = max_price
+
+    @classmethod
+    def from_json(cls, cg: Dict) -> "CarGroup":
+        # У РЖД PlaceQuantity иногда равен 0, хотя места есть (динамическое
+        # ценообразование / продажа целыми купе) — настоящее количество лежит в
+        # TotalPlaceQuantity. Берём его, а PlaceQuantity — лишь запасной вариант.
+        places = cg.get('TotalPlaceQuantity')
+        if places is None:
+            places = cg.get('PlaceQuantity', 0)
+        return cls(
+            car_type=cg.get('CarType'),
+            car_type_name=cg.get('CarTypeName'),
+            service_class=cg.get('ServiceClassNameRu'),
+            places=places or 0,
+            lower=cg.get('LowerPlaceQuantity', 0) or 0,
+            upper=cg.get('UpperPlaceQuantity', 0) or 0,
+            side=(cg.get('LowerSidePlaceQuantity', 0) or 0) + (cg.get('UpperSidePlaceQuantity', 0) or 0),
+            empty_cabins=cg.get('EmptyCabinQuantity', 0) or 0,
+            berths_known='LowerPlaceQuantity' in cg or 'UpperPlaceQuantity' in cg,
+            min_price=cg.get('MinPrice'),
+            max_price=cg.get('MaxPrice'),
+        )
+
+    @property
+    def label(self) -> str:
+        """Название категории в сводках (для сидячих — класс обслуживания)"""
+        if self.car_type == 'Sedentary':
+            return self.service_class or self.car_type_name or 'СИД'
+        return self.car_type_name or self.car_type or '?'
+
+
+class Train:
+    """Поезд: отображаемые поля, ключ схемы вагонов и доступные группы вагонов"""
+
+    __slots__ = ('number', 'info', 'departure_datetime', 'provider', 'car_groups',
+                 'available_seats', 'min_price')
+
+    def __init__(self, number: str, info: Dict, departure_datetime: str = None,
+                 provider: str = 'P1', car_groups: tuple = ()):
+        self.number = number
+        # {'number','name','departure','arrival','duration'} — как extract_train_info;
+        # общий для всех читателей, изменять нельзя
+        self.info = info
+        self.departure_datetime = departure_datetime
+        self.provider = provider
+        self.car_groups = car_groups
+        self.available_seats = sum(cg.places for cg in car_groups)
+        prices = [cg.min_price for cg in car_groups if cg.min_price]
+        self.min_price = min(prices) if prices else None
+
+    @classmethod
+    def from_json(cls, train: Dict) -> "Train":
+        return cls(
+            number=train.get('TrainNumber') or train.get('DisplayTrainNumber') or '',
+            info=train_info(train),
+            departure_datetime=train.get('LocalDepartureDateTime'),
+            provider=train.get('Provider', 'P1'),
+            car_groups=tuple(
+                CarGroup.from_json(cg) for cg in train.get('CarGroups') or []
+                if cg.get('AvailabilityIndication') == 'Available'
+            ),
+        )
+
+
+def as_train(train: Union[Train, Dict]) -> Train:
+    """Train из ответа API (словарь) или как есть"""
+    return train if isinstance(train, Train) else Train.from_json(train)
+
+
+def parse_trains(trains: List[Dict]) -> List[Train]:
+    return [Train.from_json(t) for t in trains]
@@ -0,0 +1,126 @@
+"""
+Снимок выбранного поезда для панели фильтров (search_states.selected_train_cargroups)
+
+Раньше в состояние поиска клался весь список CarGroups из ответа РЖД (десятки полей
+на группу, включая недоступные), а каждый клик по панели разбирал его json.loads
+и затем ещё раз Train.from_json внутри match_seats. Снимок хранит только доступные
+группы и только поля, которые читают CarGroup.from_json и build_filter_context;
+большие снимки сжимаются zlib (префикс 'z:'). Разобранные снимки кэшируются по
+пользователю (TrainSnapshotCache), так что повторные отрисовки панели не разбирают
+строку вовсе.
+"""
+import base64
+import json
+import logging
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from config import config
+from services.train_model import Train
+
+logger = logging.getLogger(__name__)
+
+# поля группы вагонов, нужные match_seats (CarGroup.from_json) и build_filter_context
+_CARGROUP_FIELDS = (
+    'CarType', 'CarTypeName', 'ServiceClassNameRu',
+    'LowerPlaceQuantity', 'UpperPlaceQuantity', 'LowerSidePlaceQuantity', 'UpperSidePlaceQuantity',
+    'EmptyCabinQuantity', 'MinPrice', 'MaxPrice',
+)
+_ZLIB_PREFIX = 'z:'
+# версия компактного формата (старые снимки — без "v": полный CarGroups или просто список)
+_VERSION = 2
+
+
+class TrainSnapshot(NamedTuple):
+    """Разобранный снимок: группы вагонов (словари РЖД), provider, время отправления и Train"""
+    cargroups: List[Dict]
+    provider: str
+    departure: Optional[str]
+    train: Train
+
+
+def _slim_cargroup(cg: Dict) -> Dict:
+    slim = {'AvailabilityIndication': 'Available'}
+    # PlaceQuantity нужен только как запасной вариант TotalPlaceQuantity (см. CarGroup.from_json)
+    places = cg.get('TotalPlaceQuantity')
+    if places is None:
+        places = cg.get('PlaceQuantity', 0)
+    slim['TotalPlaceQuantity'] = places or 0
+    for key in _CARGROUP_FIELDS:
+        # наличие Lower/UpperPlaceQuantity значимо (berths_known), поэтому переносим ключ как есть
+        if key in cg and (cg[key] is not None or key.endswith('PlaceQuantity')):
+            slim[key] = cg[key]
+    return slim
+
+
+def dump(train: Dict, compress_min: int = None) -> str:
+    """Компактный снимок поезда из ответа API; строки длиннее compress_min байт сжимаются"""
+    compress_min = config.SEARCH_STATE_COMPRESS_MIN if compress_min is None else compress_min
+    data = {
+        'v': _VERSION,
+        'cg': [_slim_cargroup(cg) for cg in train.get('CarGroups') or []
+               if cg.get('AvailabilityIndication') == 'Available'],
+        'p': train.get('Provider', 'P1'),
+        'd': train.get('LocalDepartureDateTime'),
+    }
+    text = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    raw = text.encode('utf-8')
+    if compress_min and len(raw) > compress_min:
+        packed = _ZLIB_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+        if len(packed) < len(raw):
+            return packed
+    return text
+
+
+def load(blob: str) -> TrainSnapshot:
+    """Разбирает снимок любого формата: сжатый, компактный, старый {"cg": ...} или список CarGroups"""
+    try:
+        if blob and blob.startswith(_ZLIB_PREFIX):
+            blob = zlib.decompress(base64.b64decode(blob[len(_ZLIB_PREFIX):])).decode('utf-8')
+        data = json.loads(blob or '[]')
+    except Exception as e:
+        logger.warning(f"Не удалось разобрать снимок поезда: {e}")
+        data = []
+    if isinstance(data, list):  # старый формат — только CarGroups
+        cargroups, provider, departure = data, 'P1', None
+    else:
+        cargroups, provider, departure = data.get('cg', []), data.get('p', 'P1'), data.get('d')
+    train = Train.from_json({'CarGroups': cargroups, 'Provider': provider,
+                             'LocalDepartureDateTime': departure})
+    return TrainSnapshot(cargroups, provider, departure, train)
+
+
+class TrainSnapshotCache:
+    """Разобранные снимки по пользователю (LRU); запись сверяется с самой строкой снимка"""
+
+    def __init__(self, maxsize: int = None):
+        self.maxsize = max(1, config.SEARCH_STATE_CACHE_SIZE if maxsize is None else maxsize)
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, blob: str) -> TrainSnapshot:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == blob:
+                self.hits += 1
+                self._entries.move_to_end(user_id)
+                return entry[1]
+            self.misses += 1
+        snapshot = load(blob)
+        with self._lock:
+            self._entries[user_id] = (blob, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def drop(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
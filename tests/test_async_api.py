@@ -0,0 +1,82 @@
+"""Тесты асинхронного клиента РЖД (без сети: _get_json подменяется)"""
+import asyncio
+
+import aiohttp
+
+from services.rzd_api import AsyncRZDAPIService
+
+
+def _api(responses: dict, calls: list = None):
+    api = AsyncRZDAPIService(api_url="https://rzd/trains", suggest_url="https://rzd/suggest")
+
+    async def fake_get_json(url, params):
+        if calls is not None:
+            calls.append((url, params))
+        result = responses[url]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    api._get_json = fake_get_json
+    return api
+
+
+def test_search_trains_parses_response():
+    calls = []
+    api = _api({"https://rzd/trains": {"Trains": [{"TrainNumber": "001A"}, {"TrainNumber": "002A"}]}}, calls)
+    data = asyncio.run(api.search_trains("2000000", "2004000", "2026-07-01T00:00:00", 2, 1))
+    assert data == {"trains": [{"TrainNumber": "001A"}, {"TrainNumber": "002A"}], "total_count": 2}
+    url, params = calls[0]
+    assert params["origin"] == "2000000" and params["destination"] == "2004000"
+    assert params["adultPassengersQuantity"] == 2 and params["childrenPassengersQuantity"] == 1
+
+
+def test_search_trains_network_error_returns_empty():
+    api = _api({"https://rzd/trains": aiohttp.ClientConnectionError("reset")})
+    data = asyncio.run(api.search_trains("A", "B", "2026-07-01T00:00:00"))
+    assert data == {"trains": [], "total_count": 0}
+
+
+def test_search_trains_timeout_returns_empty():
+    api = _api({"https://rzd/trains": asyncio.TimeoutError()})
+    data = asyncio.run(api.search_trains("A", "B", "2026-07-01T00:00:00"))
+    assert data == {"trains": [], "total_count": 0}
+
+
+def test_search_stations_merges_categories():
+    api = _api({"https://rzd/suggest": {"train": [{"name": "A"}], "city": [{"name": "B"}]}})
+    assert asyncio.run(api.search_stations("мос")) == [{"name": "A"}, {"name": "B"}]
+
+
+def test_build_purchase_url_resolves_node_ids():
+    api = _api({"https://rzd/suggest": {"train": [
+        {"expressCode": 2000000, "nodeId": "node-msk"},
+        {"expressCode": 2004000, "nodeId": "node-spb"},
+    ]}})
+    url = asyncio.run(api.build_purchase_url(
+        "2000000", "2004000", "2026-07-01T00:00:00", "Москва (2000000)", "Санкт-Петербург", 0,
+    ))
+    assert url == "https://ticket.rzd.ru/searchresults/v/1/node-msk/node-spb/2026-07-01?adult=1"
+
+
+def test_build_purchase_url_falls_back_to_codes():
+    api = _api({"https://rzd/suggest": {}})
+    url = asyncio.run(api.build_purchase_url("A1", "B1", "2026-07-01T00:00:00", "Нет", "Нет", 2))
+    assert url.endswith("/A1/B1/2026-07-01?adult=2")
+
+
+def test_session_is_shared_and_pooled():
+    from config import config
+
+    async def scenario():
+        api = AsyncRZDAPIService()
+        first = await api._get_session()
+        second = await api._get_session()
+        limit = first.connector.limit_per_host
+        await api.close()
+        return first is second, limit, first.closed
+
+    shared, limit, closed = asyncio.run(scenario())
+    assert shared is True
+    assert limit == config.HTTP_POOL_LIMIT_PER_HOST
+    assert closed is True
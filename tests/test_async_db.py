@@ -0,0 +1,180 @@
+import asyncio
+import importlib
+import os
+import tempfile
+
+import pytest
+
+
+def _db(**kw):
+    import config
+    from database import async_manager, manager
+    config.config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "async.db")
+    importlib.reload(manager)
+    return async_manager.AsyncDatabase(manager.DatabaseManager(), **kw)
+
+
+def test_concurrent_writes_share_one_transaction():
+    db = _db(batch_ms=50)
+
+    async def run():
+        results = await asyncio.gather(*(db.save_subscription_last_state(i, f"s{i}") for i in range(20)))
+        states = await asyncio.gather(*(db.get_subscription_last_state(i) for i in range(20)))
+        await db.close()
+        return results, states
+
+    results, states = asyncio.run(run())
+    assert results == [True] * 20
+    assert states == [f"s{i}" for i in range(20)]
+    assert (db.writes, db.batches) == (20, 1)
+
+
+def test_batch_size_limits_transaction():
+    db = _db(batch_ms=50, batch_size=8)
+
+    async def run():
+        await asyncio.gather(*(db.save_subscription_last_state(i, "x") for i in range(20)))
+        await db.close()
+
+    asyncio.run(run())
+    assert (db.writes, db.batches) == (20, 3)
+
+
+def test_failed_write_does_not_affect_others():
+    from database.models import SearchState
+    db = _db(batch_ms=50)
+
+    def broken():
+        raise ValueError("boom")
+
+    async def run():
+        ok = asyncio.ensure_future(db.save_search_state(SearchState(user_id=3, search_step="date")))
+        with pytest.raises(ValueError):
+            await db._write(broken)
+        await ok
+        state = await db.get_search_state(3)
+        await db.close()
+        return state
+
+    assert asyncio.run(run()).search_step == "date"
+    assert db.batches == 1
+
+
+def _subscription():
+    from database.models import Subscription
+    return Subscription(id=None, user_id=1, origin_code="A", origin_name="A", destination_code="B",
+                        destination_name="B", departure_date="2099-07-01T00:00:00", train_numbers="",
+                        car_types="", min_seats=1, adult_passengers=1, children_passengers=0,
+                        interval_minutes=None, is_active=True, created_at=None)
+
+
+def test_half_failed_write_is_rolled_back_alone():
+    db = _db(batch_ms=50)
+    sub_id = db.manager.create_subscription(_subscription())
+    db.manager.save_subscription_last_state(sub_id, "seen")
+    # второй DELETE в delete_subscription падает — первый не должен попасть в commit пакета
+    conn = db.manager.pool.acquire()
+    conn.execute("CREATE TRIGGER no_state_delete BEFORE DELETE ON subscription_states "
+                 "BEGIN SELECT RAISE(ABORT, 'boom'); END")
+    conn.commit()
+    db.manager.pool.release(conn)
+
+    async def run():
+        active = await db.get_active_subscriptions()
+        deleted, saved = await asyncio.gather(db.delete_subscription(sub_id, 1),
+                                              db.save_subscription_last_state(99, "ok"))
+        after = await db.get_active_subscriptions()
+        await db.close()
+        return active, deleted, saved, after
+
+    active, deleted, saved, after = asyncio.run(run())
+    assert [s.id for s in active] == [sub_id] and db.batches == 1
+    assert deleted is False and saved is True
+    assert [s.id for s in after] == [sub_id]
+    assert db.manager.get_subscription(sub_id, 1) is not None
+    assert db.manager.get_subscription_last_state(99) == "ok"
+
+
+def _fail_commits(db, monkeypatch):
+    """Новые соединения пула падают на COMMIT (откат и чтение работают)"""
+    import sqlite3
+    from database import connection
+
+    class CommitFails(sqlite3.Connection):
+        def commit(self):
+            raise sqlite3.OperationalError("disk I/O error")
+
+    db.manager.pool.close()
+    monkeypatch.setattr(connection, "connect", lambda path: sqlite3.connect(
+        path, factory=CommitFails, check_same_thread=False))
+
+
+def test_failed_commit_rolls_back_batch_without_hooks(monkeypatch):
+    import sqlite3
+    db = _db(batch_ms=50)
+    sub_id = db.manager.create_subscription(_subscription())
+    changed, rolled_back = [], []
+    db.manager.add_change_hook(lambda subscription_id, _: changed.append(subscription_id))
+    _fail_commits(db, monkeypatch)
+
+    def disable():
+        db.manager.pool.after_rollback(lambda: rolled_back.append(sub_id))
+        return db.manager.disable_subscription(sub_id, 1)
+
+    async def run():
+        results = await asyncio.gather(db._write(disable), db.save_subscription_last_state(sub_id, "x"),
+                                       return_exceptions=True)
+        await db.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, sqlite3.OperationalError) for r in results)
+    assert changed == [] and rolled_back == [sub_id]
+    assert (db.writes, db.batches) == (0, 0)
+    assert db.manager.get_subscription(sub_id, 1).is_active
+    assert db.manager.get_subscription_last_state(sub_id) is None
+
+
+def test_failed_commit_keeps_search_state_columns(monkeypatch):
+    from database.models import SearchState
+    db = _db(batch_ms=50)
+    _fail_commits(db, monkeypatch)
+
+    def save_newer():
+        # новое сохранение после take_pending, в том же (неудачном) пакете
+        db.search_states.update(SearchState(user_id=6, search_step="train", origin_code="A"))
+
+    async def run():
+        results = await asyncio.gather(
+            db.save_search_state(SearchState(user_id=5, search_step="date")),
+            db.save_search_state(SearchState(user_id=6, search_step="date", origin_code="A")),
+            db._write(save_newer),
+            return_exceptions=True)
+        await db.close()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, Exception) for r in results)
+    assert db.search_states.get(5) is None  # кэш не выдаёт незаписанное за сохранённое
+    # колонки неудачной записи вернулись к новой, её значения новее
+    _, pending = db.search_states._pending[6]
+    assert pending["search_step"] == "train" and pending["origin_code"] == "A"
+
+
+def test_close_flushes_queued_writes():
+    db = _db(batch_ms=1000)
+
+    async def run():
+        pending = asyncio.ensure_future(db.save_subscription_last_state(1, "late"))
+        await asyncio.sleep(0)
+        await db.close()
+        return await pending
+
+    assert asyncio.run(run()) is True
+    assert db.manager.get_subscription_last_state(1) == "late"
+
+
+def test_pool_has_connection_for_every_reader_and_writer():
+    db = _db(readers=6)
+    assert db.manager.pool.size == 7
+    asyncio.run(db.close())
@@ -0,0 +1,150 @@
+"""Тесты TTL/LRU-кэша с объединением параллельных запросов"""
+import asyncio
+
+import pytest
+
+from services.cache import TTLCache
+from services.rzd_api import AsyncRZDAPIService
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_after_miss_and_expiry():
+    clock = _Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        first = await cache.get_or_load("k", loader)
+        second = await cache.get_or_load("k", loader)
+        clock.now += 11
+        third = await cache.get_or_load("k", loader)
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (1, 1, 2)
+    assert cache.stats() == {"hits": 1, "misses": 2, "coalesced": 0, "size": 1}
+
+
+def test_lru_eviction():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1      # "a" стал самым свежим
+    cache.set("c", 3)               # вытесняется "b"
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_concurrent_callers_share_one_request():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "payload"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["payload"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1 and cache.stats()["coalesced"] == 4
+
+
+def test_errors_are_shared_but_not_cached():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("rzd down")
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 1 and len(cache) == 0
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.get_or_load("k", failing))
+    assert len(calls) == 2
+
+
+def test_zero_ttl_disables_storage():
+    cache = TTLCache(ttl=0)
+    cache.set("k", 1)
+    assert cache.get("k") is None
+
+
+def test_search_trains_uses_cache_per_query_key():
+    api = AsyncRZDAPIService(api_url="https://rzd/trains")
+    calls = []
+
+    async def fake_get_json(url, params):
+        calls.append(params["departureDate"])
+        await asyncio.sleep(0.01)
+        return {"Trains": [{"TrainNumber": "001A"}]}
+
+    api._get_json = fake_get_json
+
+    async def scenario():
+        await asyncio.gather(*(api.search_trains("A", "B", "2026-07-01T00:00:00") for _ in range(3)))
+        await api.search_trains("A", "B", "2026-07-01T00:00:00")
+        await api.search_trains("A", "B", "2026-07-02T00:00:00")
+
+    asyncio.run(scenario())
+    assert calls == ["2026-07-01T00:00:00", "2026-07-02T00:00:00"]
+    assert api.trains_cache.stats() == {"hits": 1, "misses": 2, "coalesced": 2, "size": 2}
+
+
+def test_waiters_survive_failing_ttl_for():
+    # ttl_for падает на не-словаре: значение всё равно доходит до всех, в кэш не попадает
+    cache = TTLCache(ttl=60, ttl_for=lambda payload: None if payload.get("Cars") else 1)
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        return ["not", "a", "dict"]
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(3))), timeout=1)
+
+    assert asyncio.run(scenario()) == [["not", "a", "dict"]] * 3
+    assert len(cache) == 0
+
+
+def test_waiters_reload_when_leader_cancelled():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_load("k", loader)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*waiters)
+
+    # первый ожидающий становится ведущим, второй присоединяется к его запросу
+    assert asyncio.run(scenario()) == [2, 2]
+    assert len(calls) == 2
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import tempfile
+
+from database.connection import ConnectionPool
+
+
+def _path():
+    return os.path.join(tempfile.mkdtemp(), "pool.db")
+
+
+def test_connection_pragmas():
+    pool = ConnectionPool(_path(), size=1)
+    conn = pool.acquire()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] < 0    # размер в КиБ
+    pool.release(conn)
+    pool.close()
+
+
+def test_pool_reuses_connections_and_rolls_back():
+    pool = ConnectionPool(_path(), size=2)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO t VALUES (1)")  # транзакция не зафиксирована
+    pool.release(conn)
+    again = pool.acquire()
+    assert again is conn and not again.in_transaction
+    assert again.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+    pool.release(again)
+
+
+def test_pool_is_bounded_and_thread_safe():
+    pool = ConnectionPool(_path(), size=2)
+    conn = pool.acquire()
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    pool.release(conn)
+    seen = set()
+
+    def write(i):
+        c = pool.acquire()
+        try:
+            seen.add(id(c))
+            c.execute("INSERT INTO t VALUES (?)", (i,))
+            c.commit()
+        finally:
+            pool.release(c)
+
+    async def run():
+        await asyncio.gather(*(asyncio.to_thread(write, i) for i in range(50)))
+
+    asyncio.run(run())
+    assert len(seen) <= 2
+    c = pool.acquire()
+    assert c.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 50
+    pool.release(c)
+
+
+def test_manager_uses_pool():
+    import importlib
+    import config
+    from database import manager
+    from database.models import SearchState
+    config.config.DATABASE_PATH = _path()
+    importlib.reload(manager)
+    db = manager.DatabaseManager()
+    db.save_search_state(SearchState(user_id=5, search_step="date"))
+    assert db.get_search_state(5).search_step == "date"
+    assert db.pool._created == 1
+    db.close()
+
+
+def test_acquire_times_out_when_pool_is_exhausted():
+    pool = ConnectionPool(_path(), size=1, timeout=0.05)
+    conn = pool.acquire()
+    try:
+        pool.acquire()
+    except TimeoutError as e:
+        assert "1" in str(e)
+    else:
+        raise AssertionError("acquire должен был сдаться по таймауту")
+    pool.release(conn)
+    assert pool.acquire() is conn
+    pool.release(conn)
+    pool.close()
@@ -82,3 +82,22 @@ def test_migration_idempotent():
     db = _fresh_db()
     db.init_database()  # повторный вызов не падает
     db.init_database()
+
+
+def test_subscription_state_with_places_snapshot():
+    db = _fresh_db()
+    assert db.get_subscription_last_places(7) is None
+    db.save_subscription_last_state(7, "001A:2", '{"001A":{"27":"a0"}}')
+    assert db.get_subscription_last_state(7) == "001A:2"
+    assert db.get_subscription_last_places(7) == '{"001A":{"27":"a0"}}'
+    db.save_subscription_last_state(7, "001A:0")  # без снимка — колонка очищается
+    assert db.get_subscription_last_places(7) is None
+
+
+def test_subscription_states_bulk_roundtrip():
+    db = _fresh_db()
+    db.save_subscription_last_state(1, "001A:1", "p1")
+    assert db.save_subscription_states({1: ("001A:2", "p2"), 2: ("002A:0", None)})
+    states = db.get_subscription_states(list(range(1, 1200)))  # больше одного IN (...)
+    assert states == {1: ("001A:2", "p2"), 2: ("002A:0", None)}
+    assert db.get_subscription_states([]) == {}
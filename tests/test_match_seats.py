@@ -84,3 +84,24 @@ def test_total_place_quantity_used_over_place_quantity():
 def test_empty_train():
     r = api.match_seats({})
     assert r == {"total": 0, "lower": 0, "upper": 0, "side": 0, "min_price": None, "by_type": {}}
+
+def test_batch_matches_match_seats_for_every_filter():
+    from itertools import product
+    from services.seat_filter import SeatFilter
+    filters = [SeatFilter(frozenset(ct) if ct else None, berth, price)
+               for ct, berth, price in product(
+                   (None, ("Compartment",), ("ReservedSeat", "Soft"), ("Плац",)),
+                   ("any", "lower", "upper", "side", "cabin"),
+                   (0, 2200, 3000, 6000))]
+    batch = api.match_seats_batch(_train(), filters)
+    assert len(batch) == len(filters)
+    for f, result in zip(filters, batch):
+        assert result == api.match_seats(_train(), car_types=f.car_types, berth=f.berth, max_price=f.max_price)
+
+def test_batch_shares_result_for_equal_filters_and_covers_route():
+    from services.seat_filter import SeatFilter
+    a, b = SeatFilter(None, "lower", 0, 1), SeatFilter(None, "lower", 0, 4)  # порог мест не влияет
+    first, second = api.match_seats_batch(_train(), [a, b])
+    assert first is second and first["total"] == 9
+    route = api.match_route_batch([_train(), {"CarGroups": []}], [a])
+    assert [r[0]["total"] for r in route] == [9, 0]
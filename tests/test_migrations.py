@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from database import migrations
+
+
+def _path():
+    return os.path.join(tempfile.mkdtemp(), "migrations.db")
+
+
+def _indexes(conn):
+    return {row[1] for row in conn.execute("PRAGMA index_list(subscriptions)")}
+
+
+def test_fresh_database_gets_latest_schema():
+    conn = sqlite3.connect(_path())
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION == 2
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+    assert {"idx_subscriptions_active", "idx_subscriptions_user_created"} <= _indexes(conn)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM subscriptions WHERE is_active = 1").fetchall()
+    assert "idx_subscriptions_active" in str(plan)
+
+
+def test_legacy_database_is_upgraded():
+    conn = sqlite3.connect(_path())
+    # база до версионирования: старая таблица без новых колонок, user_version = 0
+    conn.execute("CREATE TABLE subscriptions (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                 "is_active BOOLEAN DEFAULT 1, created_at TIMESTAMP)")
+    conn.execute("INSERT INTO subscriptions (user_id) VALUES (7)")
+    conn.commit()
+    migrations.migrate(conn)
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(subscriptions)")}
+    assert {"berth", "max_price"} <= columns
+    assert conn.execute("SELECT user_id, berth FROM subscriptions").fetchall() == [(7, "any")]
+    assert "idx_subscriptions_active" in _indexes(conn)
+
+
+def test_only_missing_steps_run(monkeypatch):
+    conn = sqlite3.connect(_path())
+    migrations.migrate(conn)
+    calls = []
+    monkeypatch.setattr(migrations, "MIGRATIONS",
+                        migrations.MIGRATIONS + (lambda cursor: calls.append("v3"),))
+    monkeypatch.setattr(migrations, "SCHEMA_VERSION", 3)
+    assert migrations.migrate(conn) == 3
+    assert migrations.migrate(conn) == 3
+    assert calls == ["v3"]
+
+
+def test_failed_step_rolls_back(monkeypatch):
+    conn = sqlite3.connect(_path())
+
+    def broken(cursor):
+        cursor.execute("CREATE TABLE half_done (x INTEGER)")
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", (migrations._v1_base_schema, broken))
+    with pytest.raises(RuntimeError):
+        migrations.migrate(conn)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "half_done" not in tables and "subscriptions" not in tables
+
+
+def test_ensure_schema_runs_once_per_process(monkeypatch):
+    path = _path()
+    conn = sqlite3.connect(path)
+    calls = []
+    real = migrations.migrate
+    monkeypatch.setattr(migrations, "migrate", lambda c: calls.append(c) or real(c))
+    migrations.ensure_schema(conn, path)
+    migrations.ensure_schema(sqlite3.connect(path), path)
+    assert len(calls) == 1
@@ -0,0 +1,392 @@
+"""Тесты цикла мониторинга: группировка подписок по маршрутам"""
+import asyncio
+from contextlib import nullcontext
+from datetime import datetime
+
+from services.monitoring import MonitoringService
+from services.rzd_api import RZDAPIService
+from services.rzd_seatmap import SeatMapIndex
+from database import AsyncDatabase, Subscription
+
+
+def _sub(id, **kw):
+    base = dict(id=id, user_id=id, origin_code="A", origin_name="A", destination_code="B",
+                destination_name="B", departure_date="2099-07-01T00:00:00", train_numbers="",
+                car_types="", min_seats=1, adult_passengers=1, children_passengers=0,
+                interval_minutes=5, is_active=True, created_at=datetime.now(),
+                berth="any", max_price=0)
+    base.update(kw)
+    return Subscription(**base)
+
+
+class _FakeApi(RZDAPIService):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    async def search_trains(self, origin_code, destination_code, departure_date,
+                            adult_passengers=1, children_passengers=0, typed=False):
+        self.calls.append((origin_code, destination_code, departure_date))
+        return {"trains": [], "total_count": 0}
+
+
+class _FakeDb:
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+        self.disabled = []
+        self.states = {}
+        self.places = {}
+
+    def get_active_subscriptions(self):
+        return list(self.subscriptions)
+
+    def iter_active_subscriptions(self):
+        return iter(self.subscriptions)
+
+    def disable_subscription(self, subscription_id, user_id):
+        self.disabled.append(subscription_id)
+        return True
+
+    def get_subscription_states(self, subscription_ids):
+        return {i: (self.states.get(i), self.places.get(i)) for i in subscription_ids
+                if i in self.states or i in self.places}
+
+    def save_subscription_states(self, states):
+        for subscription_id, (state, places) in states.items():
+            self.states[subscription_id] = state
+            self.places[subscription_id] = places
+        return True
+
+    def transaction(self):
+        return nullcontext()
+
+    def add_change_hook(self, hook):
+        pass
+
+
+def _service(subscriptions):
+    service = MonitoringService.__new__(MonitoringService)
+    service.rzd_api = _FakeApi()
+    service.db_manager = _FakeDb(subscriptions)
+    service.db = AsyncDatabase(service.db_manager)
+    service.seatmap_pruned = 0
+    return service
+
+
+def test_group_by_route():
+    subs = [_sub(1), _sub(2, destination_code="C"), _sub(3), _sub(4, adult_passengers=2)]
+    routes = MonitoringService.group_by_route(subs)
+    assert [[s.id for s in group] for group in routes.values()] == [[1, 3], [2], [4]]
+
+
+def test_cycle_fetches_each_route_once():
+    subs = [_sub(i) for i in range(1, 6)] + [_sub(6, destination_code="C")]
+    service = _service(subs)
+    asyncio.run(service.check_all_subscriptions())
+    assert sorted(service.rzd_api.calls) == [
+        ("A", "B", "2099-07-01T00:00:00"), ("A", "C", "2099-07-01T00:00:00"),
+    ]
+    # каждая подписка группы оценена и сохранила своё состояние
+    assert sorted(service.db_manager.states) == [1, 2, 3, 4, 5, 6]
+
+
+def test_expired_route_is_disabled_without_fetch():
+    subs = [_sub(1, departure_date="2000-01-01T00:00:00"), _sub(2, departure_date="2000-01-01T00:00:00")]
+    service = _service(subs)
+    asyncio.run(service.check_all_subscriptions())
+    assert service.rzd_api.calls == []
+    assert service.db_manager.disabled == [1, 2]
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    from services import monitoring
+    monkeypatch.setattr(monitoring.config, "MONITORING_CONCURRENCY", 3)
+    subs = [_sub(i, destination_code=f"D{i}") for i in range(1, 11)]
+    service = _service(subs)
+    active = {"now": 0, "max": 0}
+
+    async def slow_search(origin_code, destination_code, departure_date,
+                          adult_passengers=1, children_passengers=0, typed=False):
+        active["now"] += 1
+        active["max"] = max(active["max"], active["now"])
+        await asyncio.sleep(0.01)
+        active["now"] -= 1
+        return {"trains": [], "total_count": 0}
+
+    service.rzd_api.search_trains = slow_search
+    stats = asyncio.run(service.check_subscriptions(subs))
+    assert active["max"] == 3
+    assert stats["subscriptions"] == 10 and stats["routes"] == 10 and stats["failed"] == 0
+    assert stats["duration"] >= 0
+
+
+def test_failure_is_isolated_per_subscription():
+    subs = [_sub(1), _sub(2), _sub(3)]
+    service = _service(subs)
+    checked = []
+
+    async def check(subscription, trains_data=None, seatmaps=None, aggregates=None,
+                    state=None, changed=None):
+        if subscription.id == 2:
+            raise RuntimeError("boom")
+        checked.append(subscription.id)
+        return True
+
+    service.check_single_subscription = check
+    stats = asyncio.run(service.check_subscriptions(subs))
+    assert sorted(checked) == [1, 3]
+    assert stats["failed"] == 1
+    assert service.last_cycle_stats is stats
+
+
+def test_scheduler_spreads_initial_due_times_within_interval():
+    import random
+    from services.monitoring import SubscriptionScheduler
+    scheduler = SubscriptionScheduler(default_interval=300, jitter=0.1, rng=random.Random(1), batch_window=0)
+    subs = [_sub(i, destination_code=f"B{i}") for i in range(1, 101)]
+    scheduler.sync(subs, now=0)
+    assert len(scheduler) == 100
+    assert scheduler.pop_due(now=-1) == []
+    first_half = scheduler.pop_due(now=150)
+    # первые проверки разных маршрутов размазаны по интервалу, а не пачкой в момент 0
+    assert 20 < len(first_half) < 80
+    assert len(scheduler.pop_due(now=300)) == 100 - len(first_half)
+
+
+def test_scheduler_keeps_route_subscriptions_together():
+    import random
+    from services.monitoring import SubscriptionScheduler
+    scheduler = SubscriptionScheduler(default_interval=300, jitter=0.1, rng=random.Random(4), batch_window=0)
+    route = [_sub(i) for i in range(1, 11)]
+    scheduler.sync(route + [_sub(11, destination_code="C")], now=0)
+    due = scheduler.pop_due(now=300)
+    assert len(due) == 11
+    scheduler.reschedule(due, now=300)
+    # новая подписка маршрута встаёт на его ближайшую проверку
+    scheduler.sync(route + [_sub(11, destination_code="C"), _sub(12)], now=310)
+    first = scheduler.pop_due(now=scheduler.next_due())
+    assert {s.id for s in first} in ({*range(1, 11), 12}, {11})
+    second = scheduler.pop_due(now=scheduler.next_due())
+    assert sorted(s.id for s in first + second) == list(range(1, 13))
+
+
+def test_scheduler_batches_checks_within_window():
+    import random
+    from services.monitoring import SubscriptionScheduler
+    scheduler = SubscriptionScheduler(default_interval=300, jitter=0, rng=random.Random(5), batch_window=15)
+    scheduler.sync([_sub(1), _sub(2, destination_code="C")], now=0)
+    scheduler.reschedule([_sub(1)], now=0)
+    scheduler.reschedule([_sub(2, destination_code="C")], now=10)
+    assert scheduler.pop_due(now=280) == []
+    assert [s.id for s in scheduler.pop_due(now=296)] == [1, 2]  # 300 и 310 — одним циклом
+
+
+def test_scheduler_honors_interval_minutes_with_jitter():
+    import random
+    from services.monitoring import SubscriptionScheduler
+    scheduler = SubscriptionScheduler(default_interval=300, jitter=0.1, rng=random.Random(2), batch_window=0)
+    fast, slow = _sub(1, interval_minutes=1), _sub(2, interval_minutes=30, destination_code="C")
+    scheduler.sync([fast, slow], now=0)
+    assert {s.id for s in scheduler.pop_due(now=1800)} == {1, 2}
+    scheduler.reschedule([fast, slow], now=1800)
+    assert 1800 + 54 <= scheduler.next_due() <= 1800 + 66
+    assert [s.id for s in scheduler.pop_due(now=1800 + 66)] == [1]
+    assert scheduler.pop_due(now=1800 + 1620 - 1) == []
+    assert [s.id for s in scheduler.pop_due(now=1800 + 1980)] == [2]
+
+
+def test_scheduler_default_interval_and_sync_removal():
+    import random
+    from services.monitoring import SubscriptionScheduler
+    scheduler = SubscriptionScheduler(default_interval=120, jitter=0, rng=random.Random(3), batch_window=0)
+    scheduler.sync([_sub(1, interval_minutes=None), _sub(2)], now=0)
+    assert scheduler.interval_for(_sub(1, interval_minutes=None)) == 120
+    # подписку 2 отключили — после sync её больше нет в очереди
+    scheduler.sync([_sub(1, interval_minutes=None, berth="lower")], now=10)
+    due = scheduler.pop_due(now=1000)
+    assert [s.id for s in due] == [1] and due[0].berth == "lower"
+    scheduler.reschedule([_sub(2)], now=1000)  # неизвестная подписка не возвращается
+    assert scheduler.next_due() is None
+
+
+def test_notifies_only_on_newly_released_places():
+    polls = [
+        [{"car": "27", "compartment": "1", "places": [1, 2, 3, 4]}],   # первый опрос
+        [{"car": "27", "compartment": "1", "places": [1, 2, 3, 4]}],   # те же места
+        [{"car": "27", "compartment": "2", "places": [5, 6, 7, 8]}],   # столько же, но другие
+        [],                                                            # всё раскупили
+        [{"car": "27", "compartment": "2", "places": [5, 6, 7, 8]}],   # вернулись
+    ]
+
+    class FakeSeatMap:
+        async def detail_for_berth(self, *args, **kwargs):
+            return polls.pop(0)
+
+    class FakeNotifier:
+        def __init__(self):
+            self.sent = []
+
+        async def send_message(self, chat_id, text, keyboard=None):
+            self.sent.append(text)
+
+    async def build_purchase_url(*args):
+        return "https://ticket.rzd.ru/"
+
+    sub = _sub(1, berth="cabin")
+    service = _service([sub])
+    service.seatmap = FakeSeatMap()
+    service.notification_service = FakeNotifier()
+    service.rzd_api.build_purchase_url = build_purchase_url
+    trains = {"trains": [{"TrainNumber": "001A", "CarGroups": [
+        {"AvailabilityIndication": "Available", "CarType": "Compartment", "TotalPlaceQuantity": 8},
+    ]}]}
+
+    sent = []
+    for _ in range(5):
+        asyncio.run(service.check_single_subscription(sub, trains))
+        sent.append(len(service.notification_service.sent))
+    assert sent == [1, 1, 2, 2, 3]
+    assert "Освободилось мест: 4" in service.notification_service.sent[1]
+    assert service.db_manager.states[1] == "001A:1"
+
+
+def test_legacy_state_without_snapshot_falls_back_to_summary():
+    sub = _sub(1, car_types="ReservedSeat")
+    service = _service([sub])
+    service.db_manager.states[1] = "001A:5"      # состояние до появления снимков мест
+    notified = []
+
+    async def notify(subscription, matches):
+        notified.append([m.count for m in matches])
+
+    service.send_availability_notification = notify
+    train = {"TrainNumber": "001A", "CarGroups": [
+        {"AvailabilityIndication": "Available", "CarType": "ReservedSeat", "PlaceQuantity": 5},
+    ]}
+    asyncio.run(service.check_single_subscription(sub, {"trains": [train]}))
+    assert notified == []                        # сводка та же — без уведомления
+    assert service.db_manager.places[1] is not None
+    train["CarGroups"][0]["PlaceQuantity"] = 7
+    asyncio.run(service.check_single_subscription(sub, {"trains": [train]}))
+    assert notified == [[7]]                     # прирост количества = новые места
+
+
+def test_hopeless_trains_skip_carpricing_and_are_counted():
+    fetched = []
+
+    class FakeSeatMap:
+        async def fetch_index(self, origin, destination, departure, train_number, provider="P1"):
+            fetched.append(train_number)
+            return SeatMapIndex.from_payload({"Cars": [
+                {"CarType": "Compartment", "CarNumber": "05", "MinPrice": 5000,
+                 "FreePlacesByCompartments": [{"CompartmentNumber": "1", "Places": "1, 2, 3, 4"}]},
+            ]})
+
+    sub = _sub(1, berth="cabin", max_price=6000)
+    # вторая подписка на тот же маршрут: исключённые схемы считаются один раз
+    subs = [sub, _sub(2, berth="cabin", max_price=6000)]
+    service = _service(subs)
+    service.seatmap = FakeSeatMap()
+    kupe = {"AvailabilityIndication": "Available", "CarType": "Compartment", "TotalPlaceQuantity": 8, "MinPrice": 5000}
+
+    async def search_trains(*args, **kwargs):
+        return {"trains": [
+            {"TrainNumber": "001A", "CarGroups": [kupe]},
+            {"TrainNumber": "002A", "CarGroups": [dict(kupe, MinPrice=9000)]},          # дорого
+            {"TrainNumber": "003A", "CarGroups": [dict(kupe, CarType="ReservedSeat")]},  # нет купе
+        ]}
+
+    service.rzd_api.search_trains = search_trains
+    service.send_availability_notification = lambda *a: asyncio.sleep(0)
+    stats = asyncio.run(service.check_subscriptions(subs))
+    assert fetched == ["001A"]
+    assert stats["seatmap_pruned"] == 2 and service.seatmap_pruned == 2
+    assert service.db_manager.states[1] == "001A:1,002A:0,003A:0"
+
+
+def test_cycle_fetches_each_seatmap_once_for_all_subscriptions(monkeypatch):
+    from services import monitoring
+    monkeypatch.setattr(monitoring.config, "MONITORING_CONCURRENCY", 2)
+    fetched = []
+    active = {"now": 0, "max": 0}
+
+    class FakeSeatMap:
+        async def fetch_index(self, origin, destination, departure, train_number, provider="P1"):
+            fetched.append((origin, destination, train_number))
+            active["now"] += 1
+            active["max"] = max(active["max"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            if train_number == "003A":
+                raise RuntimeError("502")
+            return SeatMapIndex.from_payload({"Cars": [
+                {"CarType": "Compartment", "CarNumber": "05", "CarPlaceNameRu": "Нижнее",
+                 "FreePlacesByCompartments": [{"CompartmentNumber": "1", "Places": "1, 3"}]},
+                {"CarType": "Compartment", "CarNumber": "05", "CarPlaceNameRu": "Верхнее",
+                 "FreePlacesByCompartments": [{"CompartmentNumber": "1", "Places": "2, 4"}]},
+            ]})
+
+        async def detail_for_berth(self, *args, **kwargs):
+            raise AssertionError("схема должна браться из собранных циклом")
+
+    kupe = {"AvailabilityIndication": "Available", "CarType": "Compartment", "TotalPlaceQuantity": 8,
+            "LowerPlaceQuantity": 4, "UpperPlaceQuantity": 4}
+
+    async def search_trains(*args, **kwargs):
+        return {"trains": [{"TrainNumber": n, "CarGroups": [kupe]} for n in ("001A", "002A", "003A")]}
+
+    # 40 подписок cabin/pair на одни и те же поезда, в т.ч. с другим числом пассажиров
+    subs = [_sub(i, berth="cabin" if i % 2 else "pair", adult_passengers=1 + i % 3) for i in range(1, 41)]
+    subs.append(_sub(41, berth="cabin", train_numbers="001A"))
+    service = _service(subs)
+    service.seatmap = FakeSeatMap()
+    service.rzd_api.search_trains = search_trains
+    service.send_availability_notification = lambda *a: asyncio.sleep(0)
+
+    stats = asyncio.run(service.check_subscriptions(subs))
+    assert sorted(fetched) == [("A", "B", "001A"), ("A", "B", "002A"), ("A", "B", "003A")]
+    assert active["max"] <= 2
+    assert stats["seatmap_fetched"] == 3 and stats["failed"] == 0
+    assert service.db_manager.states[1] == "001A:1,002A:1,003A:0"  # 003A: схема недоступна
+    assert service.db_manager.states[41] == "001A:1"
+
+
+def test_route_matches_aggregate_filters_in_one_batch():
+    subs = [_sub(1), _sub(2, berth="lower"), _sub(3, berth="lower"), _sub(4, car_types="Soft")]
+    service = _service(subs)
+    train = {"TrainNumber": "001A", "CarGroups": [
+        {"AvailabilityIndication": "Available", "CarType": "ReservedSeat", "PlaceQuantity": 6,
+         "LowerPlaceQuantity": 2, "UpperPlaceQuantity": 4},
+    ]}
+    batches = []
+    original = service.rzd_api.match_route_batch
+
+    def counting(trains, filters):
+        batches.append(len(filters))
+        return original(trains, filters)
+
+    def single(*args, **kwargs):
+        raise AssertionError("агрегатные фильтры считаются пачкой, не по одному")
+
+    service.rzd_api.match_route_batch = counting
+    service.rzd_api.match_seats = single
+    service.send_availability_notification = lambda *a: asyncio.sleep(0)
+    failed = asyncio.run(service.check_route(subs, trains_data={"trains": [train], "total_count": 1}))
+    assert failed == 0 and batches == [4]
+    assert [service.db_manager.states[i] for i in (1, 2, 3, 4)] == ["001A:6", "001A:2", "001A:2", "001A:0"]
+
+
+def test_cycle_reads_states_once_and_skips_unchanged():
+    subs = [_sub(i) for i in range(1, 4)] + [_sub(4, destination_code="C")]
+    service = _service(subs)
+    reads, saves = [], []
+    fake = service.db_manager
+    real_get, real_save = fake.get_subscription_states, fake.save_subscription_states
+    fake.get_subscription_states = lambda ids: reads.append(sorted(ids)) or real_get(ids)
+    fake.save_subscription_states = lambda states: saves.append(sorted(states)) or real_save(states)
+
+    first = asyncio.run(service.check_subscriptions(subs))
+    second = asyncio.run(service.check_subscriptions(subs))
+    assert reads == [[1, 2, 3, 4], [1, 2, 3, 4]]
+    assert saves == [[1, 2, 3, 4]]          # во втором цикле ничего не изменилось
+    assert (first["states_saved"], second["states_saved"]) == (4, 0)
@@ -1,9 +1,11 @@
 """Тесты фильтр-осведомлённого мониторинга (_filtered_state)"""
+import asyncio
+from contextlib import nullcontext
 from datetime import datetime
 
 from services.monitoring import MonitoringService
 from services.rzd_api import RZDAPIService
-from database import Subscription
+from database import AsyncDatabase, Subscription
 
 
 def _sub(**kw):
@@ -16,6 +18,14 @@ def _sub(**kw):
     return Subscription(**base)
 
 
+def _service(seatmap=None):
+    service = MonitoringService.__new__(MonitoringService)
+    service.rzd_api = RZDAPIService()
+    service.seatmap = seatmap
+    service.seatmap_pruned = 0
+    return service
+
+
 def _trains():
     return [{"TrainNumber": "001A", "CarGroups": [
         {"AvailabilityIndication": "Available", "CarType": "Compartment", "CarTypeName": "Купе",
@@ -26,26 +36,24 @@ def _trains():
 
 
 def test_filtered_state_price_cap():
-    api = RZDAPIService()
-    trains, state = MonitoringService._filtered_state(api, _sub(max_price=3000), _trains())
+    trains, state = asyncio.run(_service()._filtered_state(_sub(max_price=3000), _trains()))
     assert len(trains) == 1                  # есть подходящие (Плац 2000<=3000)
     assert state == "001A:5"                 # под фильтр 5 мест
 
 
 def test_filtered_state_none_match():
-    api = RZDAPIService()
-    trains, state = MonitoringService._filtered_state(api, _sub(car_types="Soft"), _trains())
+    trains, state = asyncio.run(_service()._filtered_state(_sub(car_types="Soft"), _trains()))
     assert trains == [] and state == "001A:0"
 
 
 def test_format_availability_message_respects_price_filter():
     """Per-train блок в уведомлении должен учитывать фильтры подписки (max_price),
     а не показывать неотфильтрованные места/цену (ревью Task 5)."""
-    service = MonitoringService.__new__(MonitoringService)
-    service.rzd_api = RZDAPIService()
+    service = _service()
 
     subscription = _sub(max_price=3000)
-    message = service.format_availability_message(subscription, _trains())
+    matches, _ = asyncio.run(service._filtered_state(subscription, _trains()))
+    message = service.format_availability_message(subscription, matches)
 
     # Дорогой (Купе, 9000 ₽) вагон отфильтрован — его цена не должна попасть в сообщение
     assert "9000" not in message
@@ -55,18 +63,69 @@ def test_format_availability_message_respects_price_filter():
     assert "Доступно (мест): 5" in message
 
 
-def test_count_matched_together_passes_min_seats(monkeypatch):
-    from services import rzd_seatmap
+def test_count_matched_together_passes_min_seats():
     captured = {}
 
-    def fake_count_for_berth(self, berth, *args, **kwargs):
-        captured['min_count'] = kwargs.get('min_count')
-        return 2
+    class FakeSeatMap:
+        async def detail_for_berth(self, berth, *args, **kwargs):
+            captured['min_count'] = kwargs.get('min_count')
+            return [{"car": "03", "compartment": 1, "places": [1, 2, 3]},
+                    {"car": "03", "compartment": 2, "places": [5, 6, 7]}]
 
-    monkeypatch.setattr(rzd_seatmap.SeatMapService, "count_for_berth", fake_count_for_berth)
-    api = RZDAPIService()
     sub = _sub(berth="together", min_seats=3, car_types="Sedentary")
-    train = {"TrainNumber": "812С", "CarGroups": [], "LocalDepartureDateTime": "2026-07-07T16:10:00"}
-    n = MonitoringService.count_matched(api, sub, train)
+    train = {"TrainNumber": "812С", "LocalDepartureDateTime": "2026-07-07T16:10:00", "CarGroups": [
+        {"AvailabilityIndication": "Available", "CarType": "Sedentary", "TotalPlaceQuantity": 12},
+    ]}
+    n = asyncio.run(_service(FakeSeatMap()).count_matched(sub, train))
     assert n == 2
     assert captured['min_count'] == 3
+
+
+def test_seatmap_evaluated_once_and_reused_in_notification():
+    calls = []
+
+    class FakeSeatMap:
+        async def detail_for_berth(self, berth, *args, **kwargs):
+            calls.append(berth)
+            return [{"car": "27", "compartment": 3, "places": [9, 10, 11, 12]}]
+
+    class FakeNotifier:
+        def __init__(self):
+            self.sent = []
+
+        async def send_message(self, chat_id, text, keyboard=None):
+            self.sent.append(text)
+
+    class FakeApi(RZDAPIService):
+        async def build_purchase_url(self, *args):
+            return "https://ticket.rzd.ru/"
+
+    class FakeDb:
+        def get_subscription_states(self, subscription_ids):
+            return {}
+
+        def save_subscription_states(self, states):
+            return True
+
+        def transaction(self):
+            return nullcontext()
+
+        def add_change_hook(self, hook):
+            pass
+
+    service = _service(FakeSeatMap())
+    service.rzd_api = FakeApi()
+    service.db_manager = FakeDb()
+    service.db = AsyncDatabase(service.db_manager)
+    service.notification_service = FakeNotifier()
+    train = {"TrainNumber": "002А", "LocalDepartureDateTime": "2099-07-01T23:55:00", "CarGroups": [
+        {"AvailabilityIndication": "Available", "CarType": "Compartment", "TotalPlaceQuantity": 4},
+    ]}
+    sub = _sub(berth="cabin", departure_date="2099-07-01T00:00:00")
+    ok = asyncio.run(service.check_single_subscription(sub, {"trains": [train]}))
+
+    assert ok is True
+    assert calls == ["cabin"]                # схема запрошена один раз на поезд
+    message = service.notification_service.sent[0]
+    assert "Доступно (пустых купе): 1" in message
+    assert "вагон 27: купе 3" in message
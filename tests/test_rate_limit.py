@@ -0,0 +1,138 @@
+"""Тесты лимита отправки в Telegram (виртуальное время) и повторов после 429"""
+import asyncio
+import json
+
+from services.notification import NotificationService
+from services.rate_limit import TelegramRateLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def _limiter(**kw):
+    clock = _Clock()
+    return TelegramRateLimiter(clock=clock, sleep=clock.sleep, **kw), clock
+
+
+def test_global_rate_spreads_broadcast():
+    limiter, clock = _limiter(global_rate=30, chat_rate=1, chat_burst=1)
+
+    async def run():
+        await asyncio.gather(*(limiter.acquire(chat) for chat in range(120)))
+
+    asyncio.run(run())
+    # 30 сразу (полная корзина), остальные 90 — по 30 в секунду
+    assert 2.9 <= clock.now <= 3.1
+    stats = limiter.stats()
+    assert stats["acquired"] == 120 and stats["waiting"] == 0
+    # первые 30 проходят, не уступая управление; в очереди ждали остальные 90
+    assert stats["max_waiting"] == 90 and 2.9 <= stats["wait_max"] <= 3.1
+
+
+def test_chat_limit_does_not_block_other_chats():
+    # реальное время (ожидания разных чатов идут параллельно), лимиты ускорены в 20 раз
+    import time
+    limiter = TelegramRateLimiter(global_rate=600, chat_rate=20, chat_burst=2)
+    done = {}
+
+    async def send(chat, n, started):
+        await limiter.acquire(chat)
+        done[(chat, n)] = time.monotonic() - started
+
+    async def run():
+        started = time.monotonic()
+        await asyncio.gather(*(send(1, n, started) for n in range(4)), send(2, 0, started))
+
+    asyncio.run(run())
+    assert done[(2, 0)] < 0.02
+    chat1 = sorted(done[(1, n)] for n in range(4))
+    assert chat1[1] < 0.02 and 0.04 <= chat1[2] and 0.09 <= chat1[3] < 0.5
+
+
+def test_pause_delays_chat_until_retry_after():
+    limiter, clock = _limiter(global_rate=30, chat_rate=1, chat_burst=3)
+    limiter.pause(5, chat_id=7)
+    asyncio.run(limiter.acquire(8))
+    assert clock.now == 0
+    asyncio.run(limiter.acquire(7))
+    assert clock.now == 5 and limiter.stats()["pauses"] == 1
+
+
+class _Response:
+    def __init__(self, status, payload):
+        self.status = status
+        self._payload = payload
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def json(self):
+        return self._payload
+
+    async def text(self):
+        return json.dumps(self._payload)
+
+
+class _Session:
+    closed = False
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        return _Response(*self.responses.pop(0))
+
+
+def _service(responses):
+    limiter, clock = _limiter(global_rate=30, chat_rate=1, chat_burst=3)
+    service = NotificationService(limiter=limiter)
+    service._session = _Session(responses)
+    return service, clock
+
+
+def test_send_message_retries_after_429():
+    too_many = (429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 4}})
+    service, clock = _service([too_many, (200, {"ok": True, "result": {"message_id": 42}})])
+    assert asyncio.run(service.send_message(1, "места!")) == 42
+    assert service._session.posts == 2 and clock.now == 4
+
+
+def test_send_message_gives_up_after_retries(monkeypatch):
+    from services import notification
+    monkeypatch.setattr(notification.config, "TELEGRAM_MAX_RETRIES", 2)
+    too_many = (429, {"ok": False, "parameters": {"retry_after": 1}})
+    service, _ = _service([too_many] * 3)
+    assert asyncio.run(service.send_message(1, "места!")) is None
+    assert service._session.posts == 3
+
+
+def test_floods_in_several_chats_pause_everyone():
+    limiter, clock = _limiter(global_rate=30, chat_rate=1, chat_burst=3)
+    assert limiter.pause(2, chat_id=1) is False
+    clock.now = 0.5
+    assert limiter.pause(2, chat_id=2) is True  # второй чат подряд — общий лимит
+    asyncio.run(limiter.acquire(3))
+    assert clock.now == 2.5 and limiter.stats()["global_pauses"] == 1
+
+
+def test_global_request_429_pauses_other_chats():
+    too_many = (429, {"ok": False, "parameters": {"retry_after": 3}})
+    service, clock = _service([too_many, (200, {"ok": True, "result": True})])
+    assert asyncio.run(service._post("sendMediaGroup", {}, chat_id=None)) == (200, {"ok": True, "result": True})
+    assert clock.now == 3
+    asyncio.run(service.limiter.acquire(5))
+    assert clock.now == 3 and service.limiter.stats()["global_pauses"] == 1
@@ -0,0 +1,128 @@
+import asyncio
+import importlib
+import os
+import tempfile
+
+from database.manager import DatabaseManager
+from database.models import SearchState
+from database.search_state_cache import SearchStateCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(**kw):
+    return SearchStateCache(DatabaseManager.search_state_columns, **kw)
+
+
+def test_only_changed_columns_are_pending():
+    cache = _cache()
+    cache.load(SearchState(user_id=1, selected_train_cargroups="[...большой блоб...]"))
+    state = cache.get(1)
+    state.filter_berth = "lower"
+    token = cache.update(state)
+    assert cache.take_pending(1, token) == {"filter_berth": "lower"}
+    assert cache.update(state) is None  # ничего не изменилось
+
+
+def test_saves_before_flush_are_coalesced():
+    cache = _cache()
+    cache.load(SearchState(user_id=1))
+    state = cache.get(1)
+    state.filter_berth = "lower"
+    token = cache.update(state)
+    state.filter_max_price = 3000
+    assert cache.update(state) is None  # запись уже в очереди — дополняем её
+    assert cache.take_pending(1, token) == {"filter_berth": "lower", "filter_max_price": 3000}
+    assert cache.take_pending(1, token) is None
+
+
+def test_returned_state_is_a_copy():
+    cache = _cache()
+    cache.load(SearchState(user_id=1, messages_to_delete=[10]))
+    state = cache.get(1)
+    state.search_step = "date"
+    state.messages_to_delete.append(11)
+    again = cache.get(1)
+    assert again.search_step == "origin" and again.messages_to_delete == [10]
+
+
+def test_drop_cancels_pending_write():
+    cache = _cache()
+    state = SearchState(user_id=1, search_step="date")
+    token = cache.update(state)
+    cache.drop(1)
+    assert cache.get(1) is None
+    assert cache.take_pending(1, token) is None
+    # новое сохранение после drop пишет строку целиком под новым номером
+    fresh = cache.update(state)
+    assert fresh != token and "origin_code" in cache.take_pending(1, fresh)
+
+
+def test_failed_write_keeps_newer_pending_and_its_columns():
+    cache = _cache()
+    cache.load(SearchState(user_id=1))
+    state = cache.get(1)
+    state.filter_berth = "lower"
+    token = cache.update(state)
+    failed = cache.take_pending(1, token)
+    # пока запись шла, пользователь сохранил ещё раз
+    state.filter_max_price = 3000
+    newer = cache.update(state)
+    cache.write_failed(1, token, failed)
+    assert cache.take_pending(1, newer) == {"filter_max_price": 3000, "filter_berth": "lower"}
+    assert cache.get(1).filter_max_price == 3000
+
+
+def test_failed_write_without_newer_pending_drops_state():
+    cache = _cache()
+    cache.load(SearchState(user_id=1))
+    state = cache.get(1)
+    state.filter_berth = "lower"
+    token = cache.update(state)
+    cache.write_failed(1, token, cache.take_pending(1, token))
+    assert cache.get(1) is None  # перечитается из базы
+
+
+def test_idle_and_overflow_eviction_keeps_pending():
+    clock = _Clock()
+    cache = _cache(maxsize=2, idle_ttl=60, clock=clock)
+    cache.load(SearchState(user_id=1))
+    pending = cache.update(SearchState(user_id=2, search_step="date"))
+    clock.now = 100
+    cache.load(SearchState(user_id=3))
+    assert cache.get(1) is None         # простаивал дольше idle_ttl
+    assert cache.get(2) is not None     # ждёт записи — не вытесняется
+    cache.take_pending(2, pending)
+    cache.load(SearchState(user_id=4))
+    cache.load(SearchState(user_id=5))
+    assert len(cache) == 2
+
+
+def test_filter_toggle_through_async_db():
+    import config
+    from database import async_manager, manager
+    config.config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "states.db")
+    importlib.reload(manager)
+    db = async_manager.AsyncDatabase(manager.DatabaseManager())
+    written = []
+    real = db.manager.update_search_state_columns
+    db.manager.update_search_state_columns = lambda user_id, columns: written.append(dict(columns)) or real(user_id, columns)
+
+    async def run():
+        await db.save_search_state(SearchState(user_id=9, selected_train_cargroups="[...]"))
+        state = await db.get_search_state(9)
+        state.filter_car_types = "Compartment"
+        await db.save_search_state(state)
+        await db.close()
+
+    asyncio.run(run())
+    assert written[-1] == {"filter_car_types": "Compartment"}
+    assert db.search_states.misses == 0
+    row = db.manager.get_search_state(9)
+    assert (row.filter_car_types, row.selected_train_cargroups) == ("Compartment", "[...]")
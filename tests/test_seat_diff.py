@@ -0,0 +1,36 @@
+"""Тесты снимков свободных мест и их разницы между опросами"""
+from services.seat_diff import (
+    ANY_CAR, count_places, decode_snapshot, diff_places, encode_snapshot,
+    places_from_count, places_from_detail,
+)
+
+
+def test_places_from_detail_cabin_and_pair():
+    cabin = [{"car": "27", "compartment": "1", "places": [1, 2, 3, 4]},
+             {"car": "28", "compartment": "2", "places": [5]}]
+    assert places_from_detail(cabin) == {"27": 0b11110, "28": 1 << 5}
+    pair = [{"car": "01", "compartment": "5", "lower": [17], "upper": [18, 20]}]
+    assert places_from_detail(pair) == {"01": (1 << 17) | (1 << 18) | (1 << 20)}
+    assert places_from_detail([]) == {}
+
+
+def test_places_from_count():
+    assert places_from_count(3) == {ANY_CAR: 0b111}
+    assert places_from_count(0) == {}
+
+
+def test_diff_same_count_different_seats():
+    old = places_from_detail([{"car": "27", "places": [1, 2, 3]}])
+    new = places_from_detail([{"car": "27", "places": [2, 3, 4]}])
+    appeared, disappeared = diff_places(old, new)
+    assert appeared == {"27": 1 << 4} and disappeared == {"27": 1 << 1}
+    assert diff_places(new, new) == ({}, {})
+    assert count_places(diff_places({}, new)[0]) == 3
+
+
+def test_snapshot_roundtrip_and_corrupted():
+    snapshot = {"001А": {"27": (1 << 40) | 1}, "002A": {}}
+    text = encode_snapshot(snapshot)
+    assert decode_snapshot(text) == snapshot
+    assert decode_snapshot(None) is None
+    assert decode_snapshot("not json") is None
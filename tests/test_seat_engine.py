@@ -0,0 +1,102 @@
+from itertools import product
+
+import pytest
+
+from services import seat_engine
+from services.rzd_api import RZDAPIService
+from services.seat_filter import SeatFilter
+from services.train_model import parse_trains
+
+api = RZDAPIService()
+
+
+def _group(car_type, name, places, lower=0, upper=0, side=0, cabins=0, price=None, service=None):
+    cg = {"AvailabilityIndication": "Available", "CarType": car_type, "CarTypeName": name,
+          "TotalPlaceQuantity": places, "LowerPlaceQuantity": lower, "UpperPlaceQuantity": upper,
+          "LowerSidePlaceQuantity": side, "EmptyCabinQuantity": cabins, "MinPrice": price}
+    if service:
+        cg["ServiceClassNameRu"] = service
+    return cg
+
+
+def _route():
+    return parse_trains([
+        {"TrainNumber": "001А", "CarGroups": [
+            _group("Compartment", "Купе", 10, 6, 4, cabins=1, price=5200.0),
+            _group("ReservedSeat", "Плац", 8, 3, 3, side=2, price=2200.0),
+            _group("Compartment", "Купе", 4, 2, 2, cabins=1, price=7000.0),
+        ]},
+        {"TrainNumber": "002А", "CarGroups": []},
+        {"TrainNumber": "003А", "CarGroups": [
+            _group("Sedentary", "Сидячий", 30, price=1500.0, service="Эконом+"),
+            _group("Sedentary", "Сидячий", 5, service="Бизнес"),
+            _group("Soft", "Люкс", 0, price=15000.0),
+        ]},
+    ])
+
+
+def _filters():
+    return [SeatFilter(frozenset(ct) if ct else None, berth, price)
+            for ct, berth, price in product(
+                (None, ("Compartment",), ("ReservedSeat", "Эконом+"), ("Бизнес",), ("Нет такого",)),
+                ("any", "lower", "upper", "side", "cabin", "pair"),
+                (0, 2200, 6000))]
+
+
+def test_vectorized_matches_python_path():
+    pytest.importorskip("numpy")
+    trains, filters = _route(), _filters()
+    expected = [api.match_seats_batch(train, filters) for train in trains]
+    assert seat_engine.match_route(trains, filters) == expected
+
+
+def test_vectorized_shares_result_for_equal_filters():
+    pytest.importorskip("numpy")
+    a, b = SeatFilter(None, "lower", 0, 1), SeatFilter(None, "lower", 0, 4)
+    first, second = seat_engine.match_route(_route(), [a, b])[0]
+    assert first is second and first["total"] == 11
+
+
+def test_engine_selection(monkeypatch):
+    monkeypatch.setattr(seat_engine, "np", object())
+    monkeypatch.setattr(seat_engine.config, "SEAT_ENGINE", "auto")
+    monkeypatch.setattr(seat_engine.config, "SEAT_ENGINE_MIN_FILTERS", 3)
+    lower = SeatFilter(None, "lower")
+    assert not seat_engine.should_vectorize([lower, lower, SeatFilter(None, "upper")])
+    assert seat_engine.should_vectorize(_filters()[:3])
+    monkeypatch.setattr(seat_engine.config, "SEAT_ENGINE", "python")
+    assert not seat_engine.should_vectorize(_filters())
+    monkeypatch.setattr(seat_engine.config, "SEAT_ENGINE", "numpy")
+    assert seat_engine.should_vectorize([lower])
+
+
+def test_falls_back_without_numpy(monkeypatch):
+    monkeypatch.setattr(seat_engine, "np", None)
+    monkeypatch.setattr(seat_engine.config, "SEAT_ENGINE", "numpy")
+    assert not seat_engine.available() and not seat_engine.should_vectorize(_filters())
+    trains, filters = _route(), _filters()
+    assert api.match_route_batch(trains, filters) == [api.match_seats_batch(t, filters) for t in trains]
+
+
+def test_vectorized_matches_python_path_fuzz():
+    pytest.importorskip("numpy")
+    import random
+    rng = random.Random(16)
+    kinds = [("Compartment", "Купе", None), ("ReservedSeat", "Плац", None),
+             ("Sedentary", "Сидячий", "Эконом"), ("Sedentary", "Сидячий", "Бизнес"), ("Soft", "Люкс", None)]
+    for _ in range(300):
+        trains = parse_trains([
+            {"TrainNumber": str(n), "CarGroups": [
+                _group(car_type, name, rng.randint(0, 20), rng.randint(0, 6), rng.randint(0, 6),
+                       side=rng.randint(0, 3), cabins=rng.randint(0, 2),
+                       price=rng.choice([None, 1800.0, 3500.0, 7000.0]), service=service)
+                for car_type, name, service in (rng.choice(kinds) for _ in range(rng.randint(0, 6)))
+            ]} for n in range(rng.randint(1, 4))
+        ])
+        filters = rng.sample(_filters(), 8)
+        expected = [api.match_seats_batch(train, filters) for train in trains]
+        actual = seat_engine.match_route(trains, filters)
+        assert actual == expected
+        # порядок категорий в сводке тот же, что у обычного пути (по первой подходящей группе)
+        assert [[list(r["by_type"]) for r in row] for row in actual] == \
+               [[list(r["by_type"]) for r in row] for row in expected]
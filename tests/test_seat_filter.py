@@ -0,0 +1,69 @@
+import dataclasses
+
+from database.models import Subscription
+from services.seat_filter import Berth, FilterCompiler, SeatFilter
+
+
+def _sub(**kw):
+    base = dict(id=7, user_id=1, origin_code="A", origin_name="A", destination_code="B",
+                destination_name="B", departure_date="2099-07-01T00:00:00",
+                train_numbers="001А,003А", car_types="Compartment,ReservedSeat", min_seats=2,
+                adult_passengers=1, children_passengers=0, interval_minutes=5,
+                is_active=True, created_at=None, berth="cabin", max_price=5000)
+    base.update(kw)
+    return Subscription(**base)
+
+
+def test_compile_parses_fields():
+    f = SeatFilter.from_subscription(_sub())
+    assert f.car_types == frozenset({"Compartment", "ReservedSeat"})
+    assert f.train_numbers == frozenset({"001А", "003А"})
+    assert f.berth is Berth.CABIN and f.needs_seatmap
+    assert (f.max_price, f.threshold) == (5000, 2)
+    assert f.wants_train("001А") and not f.wants_train("777А")
+
+
+def test_empty_fields_mean_any():
+    f = SeatFilter.from_subscription(_sub(train_numbers="", car_types="", berth=None,
+                                          min_seats=0, max_price=None))
+    assert f.car_types is None and f.train_numbers is None
+    assert f.berth is Berth.ANY and not f.needs_seatmap
+    assert f.threshold == 1 and f.wants_train("любой")
+
+
+def test_berth_behaves_like_str():
+    assert Berth.parse("lower") == "lower"
+    assert {"lower": 1}[Berth.LOWER] == 1
+    assert f"{Berth.PAIR}" == "pair"
+    assert Berth.parse("нечто") is Berth.ANY
+    # фильтры из подписки и построенные вручную делят результат match_seats
+    assert SeatFilter(None, "lower").match_key == SeatFilter(None, Berth.LOWER).match_key
+
+
+def test_compiler_shares_filter_between_equal_subscriptions():
+    compiler = FilterCompiler()
+    first = compiler.compile(_sub())
+    assert compiler.compile(_sub(id=8, user_id=2)) is first
+    assert compiler.compile(_sub(id=None)) is first  # id не важен — ключ по полям фильтра
+    assert (compiler.hits, compiler.misses, len(compiler)) == (2, 1, 1)
+
+
+def test_compiler_rebuilds_when_fields_change():
+    compiler = FilterCompiler()
+    sub = _sub()
+    compiler.compile(sub)
+    changed = compiler.compile(dataclasses.replace(sub, berth="lower", car_types="Compartment"))
+    assert changed.berth is Berth.LOWER and changed.car_types == frozenset({"Compartment"})
+    assert compiler.compile(sub).berth is Berth.CABIN
+
+
+def test_compiler_is_bounded_lru():
+    compiler = FilterCompiler(maxsize=2)
+    first = compiler.compile(_sub(max_price=1000))
+    compiler.compile(_sub(max_price=2000))
+    assert compiler.compile(_sub(max_price=1000)) is first  # стал самым свежим
+    compiler.compile(_sub(max_price=3000))                  # вытесняется 2000
+    assert len(compiler) == 2
+    misses = compiler.misses
+    compiler.compile(_sub(max_price=2000))
+    assert compiler.misses == misses + 1
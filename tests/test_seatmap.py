@@ -216,3 +216,231 @@ def test_seatmap_service_cabin_unaffected_by_min_count(monkeypatch):
     # min_count не используется для 'cabin' — поведение не меняется
     n = svc.count_for_berth("cabin", "A", "B", "2026-07-01T00:00:00", "001A", min_count=5)
     assert n == svc.count_for_berth("cabin", "A", "B", "2026-07-01T00:00:00", "001A")
+
+
+def test_async_seatmap_service_counts_and_degrades(monkeypatch):
+    import asyncio
+    from services.rzd_seatmap import AsyncSeatMapService
+    svc = AsyncSeatMapService()
+
+    async def fake_fetch(*a, **k):
+        return _payload_sedentary()
+
+    monkeypatch.setattr(svc, "_fetch", fake_fetch)
+    n = asyncio.run(svc.count_for_berth("together", "2064150", "2064130", "2026-07-07T16:10:00",
+                                        "812С", min_count=3))
+    assert n == 2
+
+    async def boom(*a, **k):
+        raise RuntimeError("network")
+
+    monkeypatch.setattr(svc, "_fetch", boom)
+    assert asyncio.run(svc.empty_compartments("A", "B", "2026-07-07T16:10:00", "812С")) is None
+
+
+def test_async_seatmap_service_reuses_session():
+    import asyncio
+    from services.rzd_seatmap import AsyncSeatMapService
+
+    async def scenario():
+        svc = AsyncSeatMapService()
+        first, second = await svc._get_session(), await svc._get_session()
+        await svc.close()
+        return first is second, first.closed
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def _cached_service(fetch, clock):
+    from services.cache import TTLCache
+    from services.rzd_seatmap import AsyncSeatMapService
+    svc = AsyncSeatMapService(payload_cache=TTLCache(
+        ttl=30, maxsize=2, clock=clock,
+        ttl_for=lambda p: None if p and p.get("Cars") else 5,
+    ))
+    svc._fetch = fetch
+    return svc
+
+
+def test_async_seatmap_payload_cache_serves_filter_toggles():
+    import asyncio
+    calls = []
+    now = [0.0]
+
+    async def fetch(*a, **k):
+        calls.append(a)
+        return _payload_mixed()
+
+    svc = _cached_service(fetch, lambda: now[0])
+    args = ("A", "B", "2026-07-01T22:10:00", "001A", "P1")
+
+    async def scenario():
+        # переключение фильтров на одной схеме — один запрос к РЖД
+        pair_plac = await svc.count_for_berth("pair", *args, car_types=["ReservedSeat"])
+        pair_kupe = await svc.count_for_berth("pair", *args, car_types=["Compartment"])
+        cabin = await svc.count_for_berth("cabin", *args)
+        return pair_plac, pair_kupe, cabin
+
+    assert asyncio.run(scenario()) == (1, 1, 1)
+    assert len(calls) == 1
+    now[0] = 31.0  # TTL истёк — схема запрашивается заново
+    asyncio.run(svc.count_for_berth("cabin", *args))
+    assert len(calls) == 2
+
+
+def test_async_seatmap_negative_cache_for_errors_and_empty():
+    import asyncio
+    calls = []
+    now = [0.0]
+
+    async def fetch(origin, destination, departure, train_number, provider="P1"):
+        calls.append(train_number)
+        if train_number == "ERR":
+            raise RuntimeError("502")
+        return {"Cars": []}
+
+    svc = _cached_service(fetch, lambda: now[0])
+    for _ in range(3):
+        assert asyncio.run(svc.count_for_berth("cabin", "A", "B", "T", "ERR")) is None
+        assert asyncio.run(svc.count_for_berth("cabin", "A", "B", "T", "EMPTY")) == 0
+    assert calls == ["ERR", "EMPTY"]
+    now[0] = 6.0  # короткий negative TTL истёк
+    asyncio.run(svc.count_for_berth("cabin", "A", "B", "T", "ERR"))
+    assert calls == ["ERR", "EMPTY", "ERR"]
+
+
+def test_async_seatmap_payload_cache_is_bounded():
+    import asyncio
+    calls = []
+
+    async def fetch(origin, destination, departure, train_number, provider="P1"):
+        calls.append(train_number)
+        return _payload_typed()
+
+    svc = _cached_service(fetch, lambda: 0.0)
+    for number in ("1", "2", "3", "1"):
+        asyncio.run(svc.fetch_payload("A", "B", "T", number))
+    assert len(svc.payload_cache) == 2
+    assert calls == ["1", "2", "3", "1"]  # "1" вытеснен при добавлении "3"
+
+
+def _payload_priced():
+    # вагон 05: нижние по 3000, верхние по 2500 — цена задана на строку вагона
+    return {"Cars": [
+        {"CarType": "Compartment", "CarNumber": "05", "CarPlaceNameRu": "Нижнее", "MinPrice": 3000,
+         "ServiceClassNameRu": "2Л", "FreePlacesByCompartments": [{"CompartmentNumber": "2", "Places": "5, 7"}]},
+        {"CarType": "Compartment", "CarNumber": "05", "CarPlaceNameRu": "Верхнее", "MinPrice": 2500,
+         "ServiceClassNameRu": "2Л", "FreePlacesByCompartments": [{"CompartmentNumber": "2", "Places": "6, 8"}]},
+        {"CarType": "ReservedSeat", "CarNumber": "01", "CarPlaceNameRu": "Нижнее боковое", "MinPrice": 1500,
+         "FreePlacesByCompartments": [{"CompartmentNumber": "5", "Places": "37"}]},
+    ]}
+
+
+def test_seatmap_index_masks_and_row_prices():
+    from services.rzd_seatmap import SeatMapIndex
+    index = SeatMapIndex.from_payload(_payload_priced())
+    lower, upper, side, every = index.select()["05"]["2"]
+    assert lower == (1 << 5) | (1 << 7) and upper == (1 << 6) | (1 << 8) and every == lower | upper
+    assert index.select()["01"]["5"][2] == 1 << 37          # боковое место — отдельная маска
+    # лимит цены отсекает только дорогую строку: в купе остаются верхние
+    assert index.select(max_price=2800)["05"]["2"] == (0, upper, 0, upper)
+    assert pair_compartments_detail(index, max_price=2800) == []
+    assert [d["compartment"] for d in pair_compartments_detail(index, car_types=["2Л"])] == ["2"]
+
+
+def test_async_seatmap_builds_index_once_per_payload(monkeypatch):
+    import asyncio
+    from services import rzd_seatmap
+    built = []
+    original = rzd_seatmap.SeatMapIndex.from_payload
+
+    def counting(payload):
+        built.append(1)
+        return original(payload)
+
+    monkeypatch.setattr(rzd_seatmap.SeatMapIndex, "from_payload", staticmethod(counting))
+
+    async def fetch(*a, **k):
+        return _payload_mixed()
+
+    svc = _cached_service(fetch, lambda: 0.0)
+    args = ("A", "B", "2026-07-01T22:10:00", "001A", "P1")
+
+    async def scenario():
+        return [await svc.count_for_berth(berth, *args, car_types=car_types)
+                for berth in SEATMAP_BERTHS for car_types in (None, ["ReservedSeat"])]
+
+    assert asyncio.run(scenario()) == [1, 0, 2, 1, 0, 0]
+    assert len(built) == 1
+
+
+def test_async_seatmap_index_follows_reloaded_payload():
+    import asyncio
+    payloads = [{"Cars": []}, _payload_mixed()]
+    now = [0.0]
+
+    async def fetch(*a, **k):
+        return payloads.pop(0)
+
+    svc = _cached_service(fetch, lambda: now[0])
+    args = ("A", "B", "2026-07-01T22:10:00", "001A", "P1")
+    assert asyncio.run(svc.count_for_berth("cabin", *args)) == 0
+    now[0] = 6.0  # пустая схема истекла по negative TTL, индекс тоже не переживает её
+    assert asyncio.run(svc.count_for_berth("cabin", *args)) == 1
+
+
+def test_async_seatmap_index_does_not_keep_payload_alive():
+    import asyncio
+    import gc
+    import weakref
+
+    class _Payload(dict):
+        pass  # у dict нет weakref, у подкласса — есть
+
+    async def fetch(*a, **k):
+        return _Payload(_payload_mixed())
+
+    svc = _cached_service(fetch, lambda: 0.0)
+    index = asyncio.run(svc.fetch_index("A", "B", "2026-07-01T22:10:00", "001A", "P1"))
+    payload = weakref.ref(svc.payload_cache.get(("A", "B", "2026-07-01T22:10:00", "001A", "P1")))
+    svc.payload_cache.invalidate()
+    gc.collect()
+    assert payload() is None and index.select()
+
+
+def _train_groups(*groups):
+    return {"TrainNumber": "001A", "CarGroups": [dict({"AvailabilityIndication": "Available"}, **g) for g in groups]}
+
+
+def test_seatmap_may_match_prunes_by_aggregates():
+    from services.rzd_seatmap import seatmap_may_match
+    kupe = {"CarType": "Compartment", "TotalPlaceQuantity": 6, "LowerPlaceQuantity": 3,
+            "UpperPlaceQuantity": 3, "MinPrice": 5000, "ServiceClassNameRu": "2Л"}
+    plac_upper = {"CarType": "ReservedSeat", "TotalPlaceQuantity": 2, "LowerPlaceQuantity": 0,
+                  "UpperPlaceQuantity": 2, "MinPrice": 2000}
+    sit = {"CarType": "Sedentary", "TotalPlaceQuantity": 3, "ServiceClassNameRu": "Эконом", "MinPrice": 900}
+
+    assert seatmap_may_match(_train_groups(kupe), "cabin")
+    assert not seatmap_may_match(_train_groups(plac_upper, sit), "cabin")               # нет купе
+    assert not seatmap_may_match(_train_groups(dict(kupe, TotalPlaceQuantity=3)), "cabin")  # < 4 мест
+    assert not seatmap_may_match(_train_groups(kupe), "cabin", max_price=4000)          # дороже лимита
+    assert not seatmap_may_match(_train_groups(dict(kupe, AvailabilityIndication="NoPlaces")), "cabin")
+
+    assert seatmap_may_match(_train_groups(kupe), "pair", car_types=["Compartment"])
+    assert not seatmap_may_match(_train_groups(plac_upper), "pair")                     # нет нижних
+    assert not seatmap_may_match(_train_groups(kupe, plac_upper), "pair", car_types=["ReservedSeat"])
+
+    assert seatmap_may_match(_train_groups(sit), "together", min_count=3)
+    assert not seatmap_may_match(_train_groups(sit), "together", min_count=4)
+    assert not seatmap_may_match(_train_groups(sit), "together", car_types=["Бизнес"])
+    assert not seatmap_may_match({"CarGroups": []}, "together")
+
+
+def test_seatmap_may_match_is_conservative_on_unknown_fields():
+    from services.rzd_seatmap import seatmap_may_match
+    assert seatmap_may_match(_train_groups({"CarType": "Compartment", "PlaceQuantity": 4}), "unknown")
+    # нет разбивки низ/верх — пару не отсекаем
+    assert seatmap_may_match(_train_groups({"CarType": "ReservedSeat", "PlaceQuantity": 5}), "pair")
+    # у группы нет класса обслуживания — категорию могут дать вагоны схемы
+    assert seatmap_may_match(_train_groups({"CarType": "Sedentary", "TotalPlaceQuantity": 5}),
+                             "together", car_types=["Эконом"])
@@ -0,0 +1,99 @@
+import asyncio
+import importlib
+import os
+import tempfile
+
+import pytest
+
+from database import Subscription
+from database.subscription_registry import SubscriptionRegistry, route_key
+
+
+def _manager():
+    import config
+    from database import manager
+    config.config.DATABASE_PATH = os.path.join(tempfile.mkdtemp(), "registry.db")
+    importlib.reload(manager)
+    return manager.DatabaseManager()
+
+
+def _sub(user_id=1, **kw):
+    base = dict(id=None, user_id=user_id, origin_code="A", origin_name="A", destination_code="B",
+                destination_name="B", departure_date="2099-07-01T00:00:00", train_numbers="",
+                car_types="", min_seats=1, adult_passengers=1, children_passengers=0,
+                interval_minutes=5, is_active=True, created_at=None)
+    base.update(kw)
+    return Subscription(**base)
+
+
+def test_registry_follows_manager_writes():
+    db = _manager()
+    registry = SubscriptionRegistry(db)
+    registry.load()
+    first = db.create_subscription(_sub(train_numbers="001А,002А"))
+    second = db.create_subscription(_sub(user_id=2, destination_code="C"))
+    assert [s.id for s in registry.active()] == [first, second]
+    assert [s.id for s in registry.by_train("002А")] == [first, second]  # second — на любой поезд
+    assert [s.id for s in registry.by_train("777")] == [second]
+
+    db.update_subscription_filters(first, 1, "Compartment", "lower", 5000, 2)
+    assert registry.get(first).berth == "lower"
+    db.disable_subscription(first, 1)
+    assert first not in registry and registry.by_train("001А") == [registry.get(second)]
+    db.enable_subscription(first, 1)
+    assert first in registry
+    db.delete_subscription(second, 2)
+    assert [s.id for s in registry.active()] == [first]
+    assert list(registry.routes()) == [route_key(registry.get(first))]
+    assert sorted(s.id for s in registry.active()) == [s.id for s in db.get_active_subscriptions()]
+
+
+def test_rolled_back_transaction_does_not_notify():
+    db = _manager()
+    registry = SubscriptionRegistry(db)
+    registry.load()
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.create_subscription(_sub())
+            assert len(registry) == 0  # хуки — только после commit
+            raise RuntimeError("boom")
+    assert len(registry) == 0 and db.get_active_subscriptions() == []
+
+
+def test_async_database_reads_table_once():
+    from database import async_manager
+    db = async_manager.AsyncDatabase(_manager())
+    reads = []
+    real = db.manager.iter_active_subscriptions
+    db.manager.iter_active_subscriptions = lambda: reads.append(1) or real()
+
+    async def run():
+        await db.create_subscription(_sub())
+        before = await db.get_active_subscriptions()
+        sub_id = await db.create_subscription(_sub(user_id=2))
+        await db.disable_subscription(before[0].id, 1)
+        after = await db.get_active_subscriptions()
+        await db.close()
+        return before, after, sub_id
+
+    before, after, sub_id = asyncio.run(run())
+    assert len(before) == 1 and [s.id for s in after] == [sub_id]
+    assert reads == [1]
+
+
+def test_iter_active_subscriptions_pages_by_id():
+    from datetime import datetime
+    db = _manager()
+    ids = [db.create_subscription(_sub(user_id=i)) for i in range(1, 26)]
+    for sub_id, user_id in zip(ids[::4], range(1, 26, 4)):
+        db.disable_subscription(sub_id, user_id)
+    pages = []
+    real = db.pool.acquire
+    db.pool.acquire = lambda: pages.append(1) or real()
+    rows = list(db.iter_active_subscriptions(page_size=5))
+    assert [r.id for r in rows] == [i for i in ids if i not in ids[::4]]
+    assert len(pages) == 4  # 18 строк: три полные страницы и неполная последняя
+    assert not hasattr(rows[0], "__dict__") and isinstance(rows[0].created_at, datetime)
+    registry = SubscriptionRegistry(db)
+    registry.load()
+    assert [s.id for s in registry.active()] == [r.id for r in rows]
@@ -0,0 +1,84 @@
+"""Тесты компактной модели поезда (Train/CarGroup)"""
+import asyncio
+
+import pytest
+
+from services.rzd_api import AsyncRZDAPIService, RZDAPIService
+from services.train_model import CarGroup, Train, as_train
+
+api = RZDAPIService()
+
+
+def _raw():
+    return {
+        "TrainNumber": "752А", "TrainName": "Ласточка", "Provider": "P2",
+        "LocalDepartureDateTime": "2026-07-01T06:50:00", "LocalArrivalDateTime": "2026-07-01T10:52:00",
+        "TripDuration": 242, "CarrierName": "ФПК", "IsSuburban": False,
+        "CarGroups": [
+            {"AvailabilityIndication": "Available", "CarType": "Sedentary", "CarTypeName": "СИД",
+             "ServiceClassNameRu": "Эконом", "PlaceQuantity": 0, "TotalPlaceQuantity": 12,
+             "MinPrice": 1900.0, "MaxPrice": 2500.0},
+            {"AvailabilityIndication": "Available", "CarType": "Compartment", "CarTypeName": "Купе",
+             "PlaceQuantity": 6, "LowerPlaceQuantity": 2, "UpperPlaceQuantity": 4,
+             "EmptyCabinQuantity": 1, "MinPrice": 5200.0},
+            {"AvailabilityIndication": "NotAvailable", "CarType": "Soft", "PlaceQuantity": 9, "MinPrice": 100.0},
+        ],
+    }
+
+
+def test_train_parsed_once_with_display_fields_and_aggregates():
+    train = Train.from_json(_raw())
+    assert train.number == "752А" and train.provider == "P2"
+    assert train.departure_datetime == "2026-07-01T06:50:00"
+    assert train.info == {"number": "752А", "name": "Ласточка", "departure": "06:50",
+                          "arrival": "10:52", "duration": "4ч 2м"}
+    # недоступная группа отброшена, TotalPlaceQuantity важнее PlaceQuantity
+    assert [cg.car_type for cg in train.car_groups] == ["Sedentary", "Compartment"]
+    assert train.available_seats == 18 and train.min_price == 1900.0
+    assert train.car_groups[0].label == "Эконом" and train.car_groups[1].label == "Купе"
+    assert train.car_groups[0].berths_known is False and train.car_groups[1].berths_known is True
+    with pytest.raises(AttributeError):
+        train.extra = 1                     # __slots__: лишние поля не хранятся
+    assert as_train(train) is train
+
+
+def test_rzd_api_helpers_accept_typed_trains():
+    raw = _raw()
+    typed = Train.from_json(raw)
+    assert api.extract_train_info(typed) == api.extract_train_info(raw)
+    assert api.count_available_seats(typed) == api.count_available_seats(raw) == 18
+    assert api.count_seats_breakdown(typed) == api.count_seats_breakdown(raw)
+    assert api.min_price(typed) == api.min_price(raw) == 1900.0
+    assert api.check_available_seats(typed, 12) and not api.check_available_seats(typed, 13)
+    for kwargs in ({}, {"car_types": ["Эконом"]}, {"berth": "lower"}, {"berth": "cabin"},
+                   {"max_price": 3000}):
+        assert api.match_seats(typed, **kwargs) == api.match_seats(raw, **kwargs)
+
+
+def test_car_group_defaults():
+    cg = CarGroup.from_json({"CarType": "ReservedSeat"})
+    assert (cg.places, cg.lower, cg.upper, cg.side, cg.min_price) == (0, 0, 0, 0, None)
+    assert cg.label == "ReservedSeat"
+
+
+def test_async_search_trains_typed_shares_cached_response():
+    api_async = AsyncRZDAPIService(api_url="https://rzd/trains")
+    calls = []
+
+    async def fake_get_json(url, params):
+        calls.append(params["departureDate"])
+        return {"Trains": [_raw()]}
+
+    api_async._get_json = fake_get_json
+
+    async def scenario():
+        typed = await api_async.search_trains("A", "B", "2026-07-01T00:00:00", typed=True)
+        again = await api_async.search_trains("A", "B", "2026-07-01T00:00:00", typed=True)
+        raw = await api_async.search_trains("A", "B", "2026-07-01T00:00:00")
+        return typed, again, raw
+
+    typed, again, raw = asyncio.run(scenario())
+    assert isinstance(typed["trains"][0], Train) and typed["total_count"] == 1
+    assert again is typed
+    assert isinstance(raw["trains"][0], dict)
+    assert len(calls) == 1  # мониторинг (typed) и хендлеры — один запрос к РЖД
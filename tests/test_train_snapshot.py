@@ -0,0 +1,69 @@
+import json
+
+from services import filters as flt
+from services import train_snapshot
+from services.rzd_api import RZDAPIService
+
+
+def _train():
+    groups = []
+    for i in range(12):
+        groups.append({
+            "CarType": "Compartment" if i % 2 else "ReservedSeat",
+            "CarTypeName": "КУПЕ" if i % 2 else "ПЛАЦ",
+            "ServiceClassNameRu": None,
+            "AvailabilityIndication": "Available" if i % 3 else "NotAvailable",
+            "TotalPlaceQuantity": 10 + i,
+            "PlaceQuantity": 0,
+            "LowerPlaceQuantity": 4,
+            "UpperPlaceQuantity": 3,
+            "LowerSidePlaceQuantity": 2 if i % 2 == 0 else 0,
+            "UpperSidePlaceQuantity": 1 if i % 2 == 0 else 0,
+            "EmptyCabinQuantity": 1,
+            "MinPrice": 2000 + 100 * i,
+            "MaxPrice": 5000 + 100 * i,
+            "Carriers": ["ФПК"], "ServiceCosts": [1, 2, 3], "InfoRequestSchema": "StandardExtended",
+            "PlaceReservationTypes": ["Usual"], "IsBeddingSelectionPossible": True,
+        })
+    return {"CarGroups": groups, "Provider": "P2", "LocalDepartureDateTime": "2026-10-20T08:15:00"}
+
+
+def test_snapshot_matches_full_train():
+    api = RZDAPIService()
+    full = _train()
+    snap = train_snapshot.load(train_snapshot.dump(full, compress_min=0))
+    assert (snap.provider, snap.departure) == ("P2", "2026-10-20T08:15:00")
+    for berth in ("any", "lower", "upper", "side", "cabin"):
+        for car_types in (None, ["Compartment"]):
+            expected = api.match_seats(full, car_types=car_types, berth=berth, max_price=2800)
+            assert api.match_seats(snap.train, car_types=car_types, berth=berth, max_price=2800) == expected
+    assert flt.build_filter_context(snap.cargroups) == flt.build_filter_context(full["CarGroups"])
+
+
+def test_compression_and_size():
+    full = _train()
+    plain = train_snapshot.dump(full, compress_min=0)
+    packed = train_snapshot.dump(full, compress_min=1)
+    assert len(plain) < len(json.dumps({"cg": full["CarGroups"]}, ensure_ascii=False)) / 2
+    assert packed.startswith("z:") and len(packed) < len(plain)
+    assert train_snapshot.load(packed)[:3] == train_snapshot.load(plain)[:3]
+
+
+def test_old_formats_still_load():
+    groups = _train()["CarGroups"]
+    old = train_snapshot.load(json.dumps({"cg": groups, "p": "P1", "d": None}))
+    legacy = train_snapshot.load(json.dumps(groups))
+    assert old.train.available_seats == legacy.train.available_seats > 0
+    assert train_snapshot.load("").cargroups == [] and train_snapshot.load("z:garbage").cargroups == []
+
+
+def test_cache_reuses_decoded_snapshot():
+    cache = train_snapshot.TrainSnapshotCache(maxsize=2)
+    blob = train_snapshot.dump(_train())
+    first = cache.get(1, blob)
+    assert cache.get(1, blob) is first and cache.hits == 1
+    other = train_snapshot.dump({"CarGroups": []})
+    assert cache.get(1, other) is not first  # снимок сменился — разбираем заново
+    cache.get(2, blob)
+    cache.get(3, blob)
+    assert len(cache) == 2